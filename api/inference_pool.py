@@ -0,0 +1,212 @@
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+# -----------------------------
+# Out-of-process query inference
+# -----------------------------
+# DeepFace (TensorFlow) runs in a pool of worker processes, each loading
+# RetinaFace + Facenet512 once at start-up. Flask threads only hand over
+# the upload bytes and wait, so they no longer fight over the GIL or the
+# model.
+#
+# Admission is bounded: at most `workers + queue_size` queries are in
+# flight. Past that, submit() raises PoolBusy immediately and the API
+# answers 503 + Retry-After instead of queueing without bound. Every
+# query carries a deadline. Workers skip queries that are already past
+# their deadline, and the caller stops waiting at the deadline.
+
+
+class PoolBusy(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+# -----------------------------
+# Worker process side
+# -----------------------------
+def _init_worker():
+    """
+    Load the detector and the embedding model before the first query.
+    """
+    from face_engine.query import detect_faces, embed_face
+
+    start = time.perf_counter()
+    try:
+        blank = np.zeros((160, 160, 3), dtype=np.uint8)
+        detect_faces(blank)
+        embed_face(blank)
+    except Exception as e:
+        print(f"[INFERENCE] Worker warm-up failed — {e}")
+        return
+    print(f"[INFERENCE] Worker ready in {time.perf_counter() - start:.1f}s")
+
+
+def _embed_task(image_bytes, deadline):
+    from face_engine.query import embed_query
+
+    start = time.perf_counter()
+    emb, info = embed_query(image_bytes, deadline=deadline)
+    info["busy_seconds"] = time.perf_counter() - start
+    return emb, info
+
+
+# -----------------------------
+# API process side
+# -----------------------------
+class InferencePool:
+    def __init__(self, workers: int, queue_size: int, deadline_seconds: float):
+        self.workers = workers
+        self.capacity = max(workers, 1) + queue_size
+        self.deadline_seconds = deadline_seconds
+
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._started = time.monotonic()
+
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.failed = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def _get_executor(self):
+        # Started lazily: importing the API must not spawn processes
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker
+                )
+                print(f"[INFERENCE] Started {self.workers} worker process(es)")
+            return self._executor
+
+    def _restart(self, broken):
+        if broken is None:
+            return
+        with self._executor_lock:
+            if self._executor is broken:
+                self._executor = None
+                self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        print("[INFERENCE] Worker pool broke, restarting")
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def _release(self, future=None):
+        self._count(in_flight=-1)
+        self._slots.release()
+
+    def submit(self, image_bytes: bytes):
+        """
+        Queue one query. Returns a handle for result(); raises PoolBusy
+        when the pool is at capacity.
+        """
+        if not self._slots.acquire(blocking=False):
+            self._count(rejected=1)
+            raise PoolBusy()
+
+        self._count(in_flight=1, submitted=1)
+        deadline = time.time() + self.deadline_seconds
+
+        if self.workers <= 0:
+            return {"bytes": image_bytes, "deadline": deadline, "future": None}
+
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_embed_task, image_bytes, deadline)
+            except BrokenProcessPool:
+                self._restart(executor)
+                future = self._get_executor().submit(_embed_task, image_bytes, deadline)
+        except Exception:
+            self._release()
+            raise
+
+        future.add_done_callback(self._release)
+        return {"bytes": image_bytes, "deadline": deadline, "future": future}
+
+    def result(self, handle):
+        """
+        (embedding or None, info) for a submitted query. Raises
+        DeadlineExceeded when it did not finish in time.
+        """
+        start = time.perf_counter()
+        future = handle["future"]
+
+        try:
+            if future is None:
+                # In-process mode (INFERENCE_WORKERS = 0)
+                from face_engine.query import embed_query
+                try:
+                    emb, info = embed_query(handle["bytes"], deadline=handle["deadline"])
+                    info["busy_seconds"] = time.perf_counter() - start
+                finally:
+                    self._release()
+            else:
+                emb, info = future.result(timeout=max(handle["deadline"] - time.time(), 0))
+
+        except (FutureTimeout, TimeoutError):
+            if future is not None:
+                future.cancel()
+            self._count(timeouts=1)
+            raise DeadlineExceeded()
+
+        except BrokenProcessPool:
+            self._count(failed=1)
+            self._restart(self._executor)
+            raise
+
+        except Exception:
+            self._count(failed=1)
+            raise
+
+        waited = time.perf_counter() - start
+        busy = info.pop("busy_seconds", 0.0)
+        queue_wait = max(waited - busy, 0.0)
+        self._count(completed=1, busy_seconds=busy, wait_seconds=queue_wait)
+        # queueing + IPC as seen by the caller, next to the worker's own timings
+        info["queue_wait_ms"] = queue_wait * 1000
+        return emb, info
+
+    def embed(self, image_bytes: bytes):
+        return self.result(self.submit(image_bytes))
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            uptime = time.monotonic() - self._started
+            workers = max(self.workers, 1)
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "queued": max(self.in_flight - workers, 0),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "failed": self.failed,
+                "restarts": self.restarts,
+                "utilisation": round(self.busy_seconds / (workers * uptime), 4) if uptime else 0.0,
+                "avg_inference_ms": round(self.busy_seconds / self.completed * 1000, 1) if self.completed else 0.0,
+                "avg_queue_wait_ms": round(self.wait_seconds / self.completed * 1000, 1) if self.completed else 0.0,
+                "deadline_seconds": self.deadline_seconds,
+            }
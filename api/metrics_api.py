@@ -0,0 +1,109 @@
+from flask import Blueprint, Response
+
+from api.search_api import get_snapshot, query_cache, inference_pool
+from crawler.crawler import crawler_state, crawler_runtime_loaded, get_crawled_urls, get_rate_limiter
+from utils.metrics import REGISTRY
+
+metrics_api = Blueprint("metrics_api", __name__)
+
+CRAWLER_STATUSES = ("idle", "running", "paused", "completed")
+
+
+# -----------------------------
+# Scrape-time collectors
+# -----------------------------
+def _index_metrics():
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return [("facetrace_index_loaded", "gauge", "1 when an index snapshot is being served", [({}, 0)])]
+
+    return [
+        ("facetrace_index_loaded", "gauge", "1 when an index snapshot is being served", [({}, 1)]),
+        ("facetrace_index_vectors", "gauge", "Face embeddings in the live index", [({}, snapshot.size)]),
+        ("facetrace_index_info", "gauge", "Live index snapshot", [({
+            "version": snapshot.version,
+            "index_type": snapshot.index_type,
+            "storage": snapshot.storage,
+        }, 1)]),
+        ("facetrace_index_shards", "gauge", "Shards the live index is split into", [
+            ({}, snapshot.shards["count"] if snapshot.shards else 1),
+        ]),
+    ]
+
+
+def _query_cache_metrics():
+    stats = query_cache.stats()
+    return [
+        ("facetrace_query_cache_entries", "gauge", "Cached query results", [({}, stats["size"])]),
+        ("facetrace_query_cache_capacity", "gauge", "Query cache capacity", [({}, stats["capacity"])]),
+        ("facetrace_query_cache_lookups", "counter", "Query cache lookups by result", [
+            ({"result": "hit"}, stats["hits"]),
+            ({"result": "phash_hit"}, stats["phash_hits"]),
+            ({"result": "miss"}, stats["misses"]),
+        ]),
+        ("facetrace_query_cache_removals", "counter", "Query cache entries dropped, by cause", [
+            ({"cause": "eviction"}, stats["evictions"]),
+            ({"cause": "expiration"}, stats["expirations"]),
+        ]),
+        ("facetrace_query_cache_invalidations", "counter", "Query cache clears on index reload", [
+            ({}, stats["invalidations"]),
+        ]),
+    ]
+
+
+def _inference_metrics():
+    stats = inference_pool.stats()
+    return [
+        ("facetrace_inference_workers", "gauge", "Inference worker processes", [({}, stats["workers"])]),
+        ("facetrace_inference_in_flight", "gauge", "Queries admitted and not finished", [({}, stats["in_flight"])]),
+        ("facetrace_inference_queued", "gauge", "Queries waiting for a worker", [({}, stats["queued"])]),
+        ("facetrace_inference_queries", "counter", "Inference queries by outcome", [
+            ({"outcome": outcome}, stats[outcome])
+            for outcome in ("completed", "rejected", "timeouts", "failed")
+        ]),
+        ("facetrace_inference_restarts", "counter", "Inference pool restarts", [({}, stats["restarts"])]),
+        ("facetrace_inference_utilisation", "gauge", "Busy share of worker time since start", [
+            ({}, stats["utilisation"]),
+        ]),
+    ]
+
+
+def _crawler_metrics():
+    sources = dict(crawler_state["sources"])
+    metrics = [
+        ("facetrace_crawler_status", "gauge", "Current crawler status (1 = active state)", [
+            ({"status": status}, int(crawler_state["status"] == status)) for status in CRAWLER_STATUSES
+        ]),
+        ("facetrace_crawler_captcha_required", "gauge", "1 while a CAPTCHA blocks the crawl", [
+            ({}, int(crawler_state["captcha_required"])),
+        ]),
+        ("facetrace_crawler_run_urls", "gauge", "New URLs collected in the current / last run", [
+            ({}, len(crawler_state["collected_urls"])),
+        ]),
+        ("facetrace_crawler_source_urls", "gauge", "New URLs per source in the current / last run", [
+            ({"source": name, "status": st.get("status")}, st.get("collected", 0)) for name, st in sources.items()
+        ]),
+    ]
+
+    # the crawl state (URL set, journal replay, segment log) is loaded on
+    # first use; a scrape must not be what loads it
+    if crawler_runtime_loaded():
+        metrics += [
+            ("facetrace_crawler_known_urls", "gauge", "URLs crawled across all runs", [({}, len(get_crawled_urls()))]),
+            ("facetrace_crawler_host_delay_seconds", "gauge", "Current politeness delay per host", [
+                ({"host": host}, st["delay_seconds"]) for host, st in get_rate_limiter().stats().items()
+            ]),
+        ]
+    return metrics
+
+
+for _collect in (_index_metrics, _query_cache_metrics, _inference_metrics, _crawler_metrics):
+    REGISTRY.register_collector(_collect)
+
+
+# -----------------------------
+# Prometheus endpoint
+# -----------------------------
+@metrics_api.route("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,175 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from face_engine.phash_index import CHUNKS, CHUNK_BITS, CHUNK_MASK, _flip_masks
+
+# -----------------------------
+# Content-addressed query cache
+# -----------------------------
+# Keyed by the SHA-256 of the uploaded bytes, with a secondary lookup by
+# pHash so re-encoded / resized copies of the same photo also hit.
+# Entries remember the snapshot version they were computed against and
+# are dropped as soon as a different snapshot is being served.
+#
+# Entry pHashes are kept in the same 4 x 16-bit chunk tables as
+# PHashIndex / PHashGroups, so a near-duplicate lookup probes a few dict
+# buckets instead of scanning every entry under the lock.
+
+
+def content_key(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class QueryCache:
+    def __init__(self, capacity: int, ttl_seconds: float, phash_threshold: int):
+        self.capacity = capacity
+        self.ttl = ttl_seconds
+        self.phash_threshold = phash_threshold
+
+        self._entries = OrderedDict()   # key -> entry, oldest first
+        self._tables = [{} for _ in range(CHUNKS)]   # 16-bit chunk -> {key}
+        self._masks = _flip_masks(phash_threshold // CHUNKS).tolist()
+        self._lock = threading.Lock()
+        self._version = None
+
+        self.hits = 0
+        self.phash_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    # -----------------------------
+    # Internals (caller holds the lock)
+    # -----------------------------
+    def _check_version(self, version):
+        if version != self._version:
+            self._clear()
+            self._version = version
+
+    def _clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tables = [{} for _ in range(CHUNKS)]
+
+    @staticmethod
+    def _chunks(code: int):
+        return [(code >> (c * CHUNK_BITS)) & CHUNK_MASK for c in range(CHUNKS)]
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        if entry["phash"] is not None:
+            for table, chunk in zip(self._tables, self._chunks(entry["phash"])):
+                bucket = table[chunk]
+                bucket.discard(key)
+                if not bucket:
+                    del table[chunk]
+        return entry
+
+    def _live(self, key, entry, now) -> bool:
+        if entry["expires"] > now:
+            return True
+        self._remove(key)
+        self.expirations += 1
+        return False
+
+    def _near(self, code: int, now):
+        """
+        Closest live entry within phash_threshold bits, as (key, entry).
+        """
+        candidates = set()
+        for table, chunk in zip(self._tables, self._chunks(code)):
+            for mask in self._masks:
+                candidates.update(table.get(chunk ^ mask, ()))
+
+        best, best_dist = None, None
+        for key in candidates:
+            entry = self._entries[key]
+            if not self._live(key, entry, now):
+                continue
+            dist = (entry["phash"] ^ code).bit_count()
+            if dist <= self.phash_threshold and (best_dist is None or dist < best_dist):
+                best, best_dist = (key, entry), dist
+        return best
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+    def get(self, key: str, version, phash: str = None):
+        """
+        Cached entry for these exact bytes, else (if phash is given) for
+        a near-identical upload. Returns None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+
+            entry = self._entries.get(key)
+            if entry is not None and self._live(key, entry, now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+            near = self._near(int(phash, 16), now) if phash is not None else None
+            if near is not None:
+                other_key, entry = near
+                self._entries.move_to_end(other_key)
+                self.phash_hits += 1
+                return entry
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, version, phash: str, embedding, response: dict):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._check_version(version)
+
+            if key in self._entries:
+                self._remove(key)
+            code = int(phash, 16) if phash else None
+            self._entries[key] = {
+                "phash": code,
+                "embedding": embedding,
+                "response": response,
+                "expires": time.monotonic() + self.ttl,
+            }
+            if code is not None:
+                for table, chunk in zip(self._tables, self._chunks(code)):
+                    table.setdefault(chunk, set()).add(key)
+
+            while len(self._entries) > self.capacity:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.phash_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "phash_hits": self.phash_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.phash_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "version": self._version,
+            }
@@ -1,70 +1,359 @@
-import os
-import json
+import time
+import threading
+import multiprocessing
 import numpy as np
-import cv2
-import faiss
 from flask import Blueprint, request, jsonify
-from deepface import DeepFace
 
-from face_engine.image_hash import compute_phash, hamming_distance
+from config import (
+    SNAPSHOT_VERIFY_ON_LOAD,
+    INDEX_RELOAD_CHECK_SECONDS,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL_SECONDS,
+    QUERY_CACHE_PHASH_THRESHOLD,
+    SEARCH_BATCH_MAX_FILES,
+    INFERENCE_WORKERS,
+    INFERENCE_QUEUE_SIZE,
+    INFERENCE_DEADLINE_SECONDS,
+    INFERENCE_RETRY_AFTER_SECONDS,
+    SHARD_TIMEOUT_SECONDS
+)
+from api.inference_pool import InferencePool, PoolBusy, DeadlineExceeded
+from api.query_cache import QueryCache, content_key
+from face_engine.ann import configure_search
+from face_engine.backends import describe as describe_backend, mismatches as backend_mismatches
+from face_engine.shards import ShardedSearcher
+from face_engine.image_hash import compute_phash
+from face_engine.snapshot import load_snapshot, read_current_version, LEGACY_VERSION
+from utils.metrics import REGISTRY, StageTimer
 
 search_api = Blueprint("search_api", __name__)
 
-BASE_DIR = "data/embeddings"
-FAISS_INDEX_PATH = os.path.join(BASE_DIR, "faiss.index")
-METADATA_PATH = os.path.join(BASE_DIR, "metadata.json")
-
-MODEL_NAME = "Facenet512"
-DETECTOR_BACKEND = "retinaface"
-EMBEDDING_DIM = 512
-
 TOP_K = 50
 MIN_SIMILARITY = 75.0   # stricter identity threshold
 PHASH_THRESHOLD = 6     # exact / near-exact match
 
+query_cache = QueryCache(
+    capacity=QUERY_CACHE_SIZE,
+    ttl_seconds=QUERY_CACHE_TTL_SECONDS,
+    phash_threshold=QUERY_CACHE_PHASH_THRESHOLD
+)
+
+inference_pool = InferencePool(
+    workers=INFERENCE_WORKERS,
+    queue_size=INFERENCE_QUEUE_SIZE,
+    deadline_seconds=INFERENCE_DEADLINE_SECONDS
+)
+
+# -----------------------------
+# Latency metrics (exported at /metrics)
+# -----------------------------
+# Every search request gets a StageTimer. Its stages go out in the
+# Server-Timing header, in the body with ?timings=1, and into these
+# histograms. Inference is split into the pool's queue wait and the
+# worker's decode / detect (RetinaFace) / crop / embed (Facenet512)
+# timings.
+STAGE_SECONDS = REGISTRY.histogram(
+    "facetrace_search_stage_seconds",
+    "Time spent in each stage of a search request",
+    ("endpoint", "stage")
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "facetrace_search_request_seconds",
+    "End-to-end search request latency",
+    ("endpoint", "outcome")
+)
+DEGRADED_SEARCHES = REGISTRY.counter(
+    "facetrace_search_degraded",
+    "Searches answered without every index shard",
+    ("endpoint",)
+)
+CROP_FALLBACKS = REGISTRY.counter(
+    "facetrace_query_crop_fallbacks",
+    "Queries embedded from the reduced-resolution face, by reason",
+    ("reason",)
+)
+SEARCH_ERRORS = REGISTRY.counter(
+    "facetrace_search_errors",
+    "Uploads that could not be searched, by the stage that failed",
+    ("endpoint", "stage")
+)
+
 # -----------------------------
-# Load index ONCE
+# Index snapshot (hot-reloadable)
 # -----------------------------
-if os.path.exists(FAISS_INDEX_PATH):
-    index = faiss.read_index(FAISS_INDEX_PATH)
-    with open(METADATA_PATH, "r") as f:
-        metadata = json.load(f)
-else:
-    index = None
-    metadata = []
+# Requests read `_snapshot` once and use that object to the end, so a
+# reload only swaps the reference: in-flight searches finish on the
+# snapshot they started with, new ones see index + metadata together.
+_snapshot = None
+_reload_lock = threading.Lock()
+_last_check = time.monotonic()
+
+
+def get_snapshot():
+    return _snapshot
+
+
+def _published_version():
+    return read_current_version() or LEGACY_VERSION
+
+
+def reload_index(force: bool = False) -> dict:
+    """
+    Load the published snapshot and swap it in.
+    Raises if the snapshot cannot be loaded; the old one stays live.
+    """
+    global _snapshot
+
+    with _reload_lock:
+        current = _snapshot
+        version = _published_version()
+
+        if not force and current is not None and current.version == version:
+            return {"reloaded": False, "version": version, "size": current.size}
+
+        snapshot = load_snapshot(verify=SNAPSHOT_VERIFY_ON_LOAD)
+        if snapshot is None:
+            return {"reloaded": False, "version": None, "size": 0}
+
+        if snapshot.shards:
+            # shard workers apply nprobe / efSearch themselves
+            snapshot.searcher = ShardedSearcher(snapshot)
+            snapshot.searcher.warm_up(snapshot.manifest.get("dim", 512))
+        else:
+            # nprobe / efSearch for IVF and HNSW snapshots
+            configure_search(snapshot.index)
+
+        # query vectors must come from the model (and detector) the index
+        # was built with
+        for field, (built_with, query_with) in backend_mismatches(snapshot.manifest).items():
+            print(f"[SEARCH] ⚠️ Index {snapshot.version} was built with {field} {built_with}, "
+                  f"queries use {query_with}")
+
+        _snapshot = snapshot
+        query_cache.invalidate()
+
+        if current is not None and current.searcher is not None:
+            # let searches still running on the old shards finish first
+            threading.Timer(SHARD_TIMEOUT_SECONDS * 2, current.searcher.close).start()
+
+    print(f"[SEARCH] Serving index {snapshot.version} ({snapshot.size} embeddings)")
+    return {"reloaded": True, "version": snapshot.version, "size": snapshot.size}
+
+
+def _background_reload():
+    try:
+        reload_index()
+    except Exception as e:
+        print(f"[SEARCH] Index reload failed — {e}")
+
+
+def _maybe_reload():
+    """
+    Poll CURRENT at most every INDEX_RELOAD_CHECK_SECONDS and reload in
+    the background when it moved, so no request waits on index loading.
+    """
+    global _last_check
+
+    if INDEX_RELOAD_CHECK_SECONDS <= 0:
+        return
+
+    now = time.monotonic()
+    if now - _last_check < INDEX_RELOAD_CHECK_SECONDS:
+        return
+    _last_check = now
+
+    current = _snapshot
+    if current is not None and current.version == _published_version():
+        return
+
+    if not _reload_lock.locked():
+        threading.Thread(target=_background_reload, daemon=True).start()
+
+
+# Load index ONCE at startup; later swaps go through reload_index().
+# Inference workers re-import the app's main module when they spawn and
+# must not load the index.
+if multiprocessing.parent_process() is None:
+    _background_reload()
+
 
 # -----------------------------
 # Helpers
 # -----------------------------
-def bytes_to_image(image_bytes):
-    arr = np.frombuffer(image_bytes, np.uint8)
-    return cv2.imdecode(arr, cv2.IMREAD_COLOR)
+def extract_embedding(image_bytes, handle=None, timer=None):
+    """
+    Detect once, embed the aligned crop. None unless exactly one face.
+    Runs on the inference pool; raises PoolBusy / DeadlineExceeded.
+    The pool's queue wait and the worker's stage timings go to `timer`.
+    """
+    if handle is None:
+        handle = inference_pool.submit(image_bytes)
+    emb, info = inference_pool.result(handle)
+    timings = " | ".join(f"{k} {v:.1f} ms" for k, v in info["timings"].items())
+    print(f"[SEARCH] {info['faces']} face(s) — {timings}")
+    if info.get("crop_fallback"):
+        print(f"[SEARCH] Native re-crop skipped ({info['crop_fallback']}), using the reduced-resolution face")
+        CROP_FALLBACKS.inc(reason=info["crop_fallback"])
 
+    if timer is not None:
+        timer.add("queue_wait", info.get("queue_wait_ms", 0.0))
+        for stage, ms in info["timings"].items():
+            timer.add(stage, ms)
+    return emb
 
-def extract_embedding(image_bytes):
-    img = bytes_to_image(image_bytes)
-    if img is None:
-        return None
 
-    faces = DeepFace.extract_faces(
-        img_path=img,
-        detector_backend=DETECTOR_BACKEND,
-        enforce_detection=False
-    )
+def wants_timings() -> bool:
+    return request.args.get("timings", "").lower() in ("1", "true", "yes")
+
+
+def timed_response(timer, endpoint, body, status=200, outcome="ok", headers=None):
+    """
+    jsonify `body` and attach the request's stage timings: always as a
+    Server-Timing header, in the body too with ?timings=1. Records the
+    stages and the total latency in the /metrics histograms.
+    """
+    if wants_timings():
+        body = {**body, "timings": timer.as_dict()}
+
+    with timer.stage("serialize"):
+        response = jsonify(body)
 
-    # ❗ single-face enforcement
-    if len(faces) != 1:
+    response.status_code = status
+    response.headers["Server-Timing"] = timer.server_timing()
+    for name, value in (headers or {}).items():
+        response.headers[name] = value
+
+    timer.observe(STAGE_SECONDS, endpoint=endpoint)
+    REQUEST_SECONDS.observe(timer.total_ms() / 1000, endpoint=endpoint, outcome=outcome)
+    return response
+
+
+def search_vectors(snapshot, queries, endpoint: str):
+    """
+    Top-k (scores, ids, degraded). For sharded snapshots `degraded`
+    names the shards missing from the merged ranking, else None.
+    """
+    if snapshot.searcher is None:
+        scores, ids = snapshot.search(queries, TOP_K)
+        return scores, ids, None
+
+    scores, ids, status = snapshot.searcher.search(queries, TOP_K)
+    if not status["missing"]:
+        return scores, ids, None
+
+    DEGRADED_SEARCHES.inc(endpoint=endpoint)
+    return scores, ids, {"shards": status["shards"], "missing_shards": status["missing"]}
+
+
+def with_row_details(metadata, row, match: dict, face: bool = True) -> dict:
+    """
+    Add the image id, which face of the image matched and the
+    near-duplicate URLs collapsed into it, when the row has them.
+    """
+    extra = metadata.extra(row)
+    if "image_id" in extra:
+        match["image_id"] = extra["image_id"]
+    if face and "face" in extra:
+        match["face"] = {"index": extra["face"], "bbox": extra.get("bbox")}
+    if extra.get("aliases"):
+        match["aliases"] = extra["aliases"]
+    return match
+
+
+def exact_match_response(snapshot, query_hash, hits=None):
+    """
+    Response for near-identical indexed images, or None if there are none.
+    `hits` are precomputed (row, distance) pairs from a batch lookup.
+    """
+    metadata = snapshot.metadata
+
+    if hits is None:
+        hits = snapshot.phash_index.search(query_hash, PHASH_THRESHOLD)
+
+    # face rows of one image share its pHash: keep one per URL
+    best_per_url = {}
+    for row, dist in hits:
+        url = metadata.url(row)
+        if url not in best_per_url:
+            best_per_url[url] = (row, dist)
+
+    exact_matches = [
+        with_row_details(metadata, row, {
+            "image_url": url,
+            "similarity": 100 - dist * 5,
+            "match_type": "exact"
+        }, face=False)
+        for url, (row, dist) in best_per_url.items()
+    ]
+
+    if not exact_matches:
         return None
 
-    rep = DeepFace.represent(
-        img_path=faces[0]["face"],
-        model_name=MODEL_NAME,
-        enforce_detection=False
+    return {
+        "count": len(exact_matches),
+        "matches": sorted(exact_matches, key=lambda x: x["similarity"], reverse=True),
+        "mode": "exact_match"
+    }
+
+
+def identity_response(snapshot, scores, indices):
+    """
+    Response from one row of FAISS results (best-scoring face per image URL).
+    """
+    metadata = snapshot.metadata
+
+    best_per_url = {}
+    for score, idx in zip(scores, indices):
+        if idx < 0:
+            continue
+
+        similarity = ((float(score) + 1) / 2) * 100
+        if similarity < MIN_SIMILARITY:
+            continue
+
+        url = metadata.url(idx)
+        if url not in best_per_url or similarity > best_per_url[url][0]:
+            best_per_url[url] = (similarity, idx)
+
+    results = [
+        with_row_details(metadata, idx, {
+            "image_url": url,
+            "similarity": round(sim, 2),
+            "match_type": "identity"
+        })
+        for url, (sim, idx) in best_per_url.items()
+    ]
+
+    results.sort(key=lambda x: x["similarity"], reverse=True)
+
+    return {
+        "count": len(results),
+        "matches": results[:10],
+        "mode": "identity_verification"
+    }
+
+
+NO_FACE_RESPONSE = {
+    "count": 0,
+    "matches": [],
+    "error": "No single face detected"
+}
+
+
+def busy_response(timer):
+    return timed_response(
+        timer, "search", {"error": "Server busy, retry later"}, 503, "busy",
+        headers={"Retry-After": str(INFERENCE_RETRY_AFTER_SECONDS)}
     )
 
-    emb = np.array(rep[0]["embedding"], dtype="float32").reshape(1, -1)
-    faiss.normalize_L2(emb)
-    return emb
+
+def timeout_response(timer):
+    return timed_response(timer, "search", {"error": "Search timed out"}, 504, "timeout")
+
+
+def error_response(timer, endpoint, stage, error, status):
+    SEARCH_ERRORS.inc(endpoint=endpoint, stage=stage)
+    return timed_response(timer, endpoint, {"error": error}, status, "error")
 
 
 # -----------------------------
@@ -72,78 +361,245 @@ def extract_embedding(image_bytes):
 # -----------------------------
 @search_api.route("/api/search", methods=["POST"])
 def search_face():
-    if index is None:
-        return jsonify({"error": "Index not available"}), 500
+    timer = StageTimer()
+    _maybe_reload()
+
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return timed_response(timer, "search", {"error": "Index not available"}, 500, "no_index")
 
     if "file" not in request.files:
-        return jsonify({"error": "No image uploaded"}), 400
+        return timed_response(timer, "search", {"error": "No image uploaded"}, 400, "bad_request")
+
+    with timer.stage("upload"):
+        image_bytes = request.files["file"].read()
 
-    image_bytes = request.files["file"].read()
+    try:
+        with timer.stage("phash"):
+            query_hash = compute_phash(image_bytes)
+    except Exception as e:
+        print(f"[SEARCH] Unreadable upload — {e}")
+        return error_response(timer, "search", "phash", "Could not read image", 400)
+
+    # =============================
+    # 0️⃣ QUERY CACHE (same bytes or near-identical upload)
+    # =============================
+    with timer.stage("cache"):
+        cache_key = content_key(image_bytes)
+        cached = query_cache.get(cache_key, snapshot.version, phash=query_hash)
+    if cached is not None:
+        return timed_response(timer, "search", {**cached["response"], "cached": True}, outcome="cached")
 
     # =============================
     # 1️⃣ EXACT IMAGE MATCH (TRUE RIS)
     # =============================
-    query_hash = compute_phash(image_bytes)
+    with timer.stage("exact_match"):
+        response = exact_match_response(snapshot, query_hash)
+    if response is not None:
+        query_cache.put(cache_key, snapshot.version, query_hash, None, response)
+        return timed_response(timer, "search", response, outcome="exact")
 
-    exact_matches = []
-    for item in metadata:
-        if "phash" not in item:
+    # =============================
+    # 2️⃣ IDENTITY VERIFICATION
+    # =============================
+    try:
+        query_emb = extract_embedding(image_bytes, timer=timer)
+    except PoolBusy:
+        return busy_response(timer)
+    except DeadlineExceeded:
+        return timeout_response(timer)
+    except Exception as e:
+        # the pool has already counted it as failed
+        print(f"[SEARCH] Inference failed — {e}")
+        return error_response(timer, "search", "inference", "Could not process image", 500)
+
+    if query_emb is None:
+        query_cache.put(cache_key, snapshot.version, query_hash, None, NO_FACE_RESPONSE)
+        return timed_response(timer, "search", NO_FACE_RESPONSE, outcome="no_face")
+
+    with timer.stage("faiss"):
+        scores, indices, degraded = search_vectors(snapshot, query_emb, "search")
+
+    with timer.stage("rank"):
+        response = identity_response(snapshot, scores[0], indices[0])
+
+    if degraded:
+        # partial ranking: answer it, but never cache it
+        return timed_response(timer, "search", {**response, "degraded": degraded}, outcome="degraded")
+
+    query_cache.put(cache_key, snapshot.version, query_hash, query_emb, response)
+    return timed_response(timer, "search", response, outcome="identity")
+
+
+# -----------------------------
+# Batch Search Endpoint
+# -----------------------------
+@search_api.route("/api/search/batch", methods=["POST"])
+def search_batch():
+    """
+    Many uploads ("files") in one request. pHash matching runs as one
+    vectorized pass and all query faces go to FAISS as one matrix.
+    Each result has the same schema as /api/search.
+    Stage timings cover the whole batch; inference is a single stage
+    because the uploads are embedded in parallel.
+    """
+    timer = StageTimer()
+    _maybe_reload()
+
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return timed_response(timer, "batch", {"error": "Index not available"}, 500, "no_index")
+
+    files = request.files.getlist("files") or request.files.getlist("file")
+    if not files:
+        return timed_response(timer, "batch", {"error": "No images uploaded"}, 400, "bad_request")
+
+    if len(files) > SEARCH_BATCH_MAX_FILES:
+        return timed_response(
+            timer, "batch", {"error": f"At most {SEARCH_BATCH_MAX_FILES} images per batch"}, 400, "bad_request"
+        )
+
+    results = [None] * len(files)
+    items = []     # (position, bytes, cache key, pHash) still to search
+
+    for i, f in enumerate(files):
+        with timer.stage("upload"):
+            image_bytes = f.read()
+        try:
+            with timer.stage("phash"):
+                query_hash = compute_phash(image_bytes)
+        except Exception:
+            SEARCH_ERRORS.inc(endpoint="batch", stage="phash")
+            results[i] = {"count": 0, "matches": [], "error": "Could not read image"}
             continue
 
-        dist = hamming_distance(query_hash, item["phash"])
-        if dist <= PHASH_THRESHOLD:
-            exact_matches.append({
-                "image_url": item["url"],
-                "similarity": 100 - dist * 5,
-                "match_type": "exact"
-            })
+        with timer.stage("cache"):
+            cache_key = content_key(image_bytes)
+            cached = query_cache.get(cache_key, snapshot.version, phash=query_hash)
+        if cached is not None:
+            results[i] = {**cached["response"], "cached": True}
+        else:
+            items.append((i, image_bytes, cache_key, query_hash))
 
-    if exact_matches:
-        return jsonify({
-            "count": len(exact_matches),
-            "matches": sorted(exact_matches, key=lambda x: x["similarity"], reverse=True),
-            "mode": "exact_match"
-        })
+    # =============================
+    # 1️⃣ EXACT IMAGE MATCH — all queries in one pass
+    # =============================
+    with timer.stage("exact_match"):
+        hits = snapshot.phash_index.search_batch([h for _, _, _, h in items], PHASH_THRESHOLD)
+
+    to_embed = []
+    for (i, image_bytes, cache_key, query_hash), item_hits in zip(items, hits):
+        if item_hits:
+            with timer.stage("exact_match"):
+                response = exact_match_response(snapshot, query_hash, item_hits)
+            query_cache.put(cache_key, snapshot.version, query_hash, None, response)
+            results[i] = response
+        else:
+            to_embed.append((i, image_bytes, cache_key, query_hash))
 
     # =============================
-    # 2️⃣ IDENTITY VERIFICATION
+    # 2️⃣ IDENTITY VERIFICATION — one FAISS call
     # =============================
-    query_emb = extract_embedding(image_bytes)
-    if query_emb is None:
-        return jsonify({
-            "count": 0,
-            "matches": [],
-            "error": "No single face detected"
-        })
+    inference_start = time.perf_counter()
 
-    scores, indices = index.search(query_emb, TOP_K)
+    # Submit every upload first so the pool works on them in parallel
+    handles = []
+    for i, image_bytes, cache_key, query_hash in to_embed:
+        try:
+            handles.append(inference_pool.submit(image_bytes))
+        except PoolBusy:
+            handles.append(None)
 
-    best_per_url = {}
-    for score, idx in zip(scores[0], indices[0]):
-        if idx < 0:
+    embedded = []
+    for (i, image_bytes, cache_key, query_hash), handle in zip(to_embed, handles):
+        if handle is None:
+            results[i] = {"count": 0, "matches": [], "error": "Server busy, retry later"}
             continue
 
-        similarity = ((float(score) + 1) / 2) * 100
-        if similarity < MIN_SIMILARITY:
+        try:
+            query_emb = extract_embedding(image_bytes, handle)
+        except DeadlineExceeded:
+            results[i] = {"count": 0, "matches": [], "error": "Search timed out"}
+            continue
+        except Exception as e:
+            print(f"[SEARCH] Batch item {i} failed — {e}")
+            SEARCH_ERRORS.inc(endpoint="batch", stage="inference")
+            results[i] = {"count": 0, "matches": [], "error": "Could not process image"}
             continue
 
-        url = metadata[idx]["url"]
-        if url not in best_per_url or similarity > best_per_url[url]:
-            best_per_url[url] = similarity
+        if query_emb is None:
+            query_cache.put(cache_key, snapshot.version, query_hash, None, NO_FACE_RESPONSE)
+            results[i] = NO_FACE_RESPONSE
+        else:
+            embedded.append((i, cache_key, query_hash, query_emb))
 
-    results = [
-        {
-            "image_url": url,
-            "similarity": round(sim, 2),
-            "match_type": "identity"
-        }
-        for url, sim in best_per_url.items()
-    ]
+    if to_embed:
+        timer.add("inference", (time.perf_counter() - inference_start) * 1000)
 
-    results.sort(key=lambda x: x["similarity"], reverse=True)
+    if embedded:
+        with timer.stage("faiss"):
+            matrix = np.vstack([emb for _, _, _, emb in embedded])
+            scores, indices, degraded = search_vectors(snapshot, matrix, "batch")
 
-    return jsonify({
+        for row, (i, cache_key, query_hash, query_emb) in enumerate(embedded):
+            with timer.stage("rank"):
+                response = identity_response(snapshot, scores[row], indices[row])
+            if degraded:
+                response = {**response, "degraded": degraded}
+            else:
+                query_cache.put(cache_key, snapshot.version, query_hash, query_emb, response)
+            results[i] = response
+
+    return timed_response(timer, "batch", {
         "count": len(results),
-        "matches": results[:10],
-        "mode": "identity_verification"
+        "results": [
+            {"filename": f.filename, **result}
+            for f, result in zip(files, results)
+        ]
+    })
+
+
+@search_api.route("/api/search/cache")
+def query_cache_stats():
+    return jsonify(query_cache.stats())
+
+
+@search_api.route("/api/search/inference")
+def inference_stats():
+    return jsonify({**inference_pool.stats(), **describe_backend()})
+
+
+# -----------------------------
+# Index management
+# -----------------------------
+@search_api.route("/api/index/reload", methods=["POST"])
+def reload_index_endpoint():
+    force = request.args.get("force", "").lower() in ("1", "true", "yes")
+
+    try:
+        result = reload_index(force=force)
+    except Exception as e:
+        current = get_snapshot()
+        return jsonify({
+            "error": f"Reload failed: {e}",
+            "version": current.version if current else None
+        }), 500
+
+    return jsonify(result)
+
+
+@search_api.route("/api/index/status")
+def index_status():
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return jsonify({"version": None, "size": 0, "published": read_current_version()})
+
+    return jsonify({
+        "version": snapshot.version,
+        "size": snapshot.size,
+        "created_at": snapshot.manifest.get("created_at"),
+        "index_type": snapshot.index_type,
+        "storage": snapshot.storage,
+        "shards": snapshot.shards,
+        "published": _published_version()
     })
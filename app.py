@@ -1,17 +1,20 @@
-from flask import Flask, jsonify, render_template
+from flask import Flask, jsonify, render_template, request
 import threading
 import os
 import webbrowser
 from dotenv import load_dotenv
 
-from crawler.crawler import crawl_all_sources, crawler_state
+from crawler.crawler import crawl_all_sources, crawler_state, cooling_down_sources, get_rate_limiter, SOURCES
 from config import API_PORT, DEBUG, UPLOAD_FOLDER
 from api.search_api import search_api
+from api.metrics_api import metrics_api
+from utils.metrics import REGISTRY
 
 load_dotenv()
 
 app = Flask(__name__, template_folder="templates")
 app.register_blueprint(search_api)
+app.register_blueprint(metrics_api)
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
@@ -35,23 +38,78 @@ def search_page():
 # Crawler API
 # =========================
 
+# Set while a streaming crawl (?stream=1) is running
+stream_indexer = None
+
+
+def crawl_and_index():
+    """
+    Crawl with every accepted URL streamed into the index.
+    """
+    global stream_indexer
+
+    # imported here so plain crawls never load the face models
+    from face_engine.streaming import StreamingIndexer
+
+    stream_indexer = StreamingIndexer().start()
+    try:
+        crawl_all_sources(stream=stream_indexer)
+    finally:
+        stream_indexer.close()
+
+
+def _stream_metrics():
+    if stream_indexer is None:
+        return []
+    stats = stream_indexer.stats()
+    return [
+        ("facetrace_stream_images", "counter", "Images handled by the streaming indexer, by outcome", [
+            ({"outcome": outcome}, stats[outcome]) for outcome in ("submitted", "indexed", "no_face", "prefiltered", "failed")
+        ]),
+        ("facetrace_stream_queued", "gauge", "URLs waiting for the streaming indexer", [({}, stats["queued"])]),
+        ("facetrace_stream_pending_publish", "gauge", "Embedded images not yet published", [
+            ({}, stats["pending_publish"]),
+        ]),
+    ]
+
+
+REGISTRY.register_collector(_stream_metrics)
+
+
 @app.route("/api/crawl/start", methods=["GET", "POST"])
 def start_crawler():
     if crawler_state["status"] == "running":
         return jsonify({"status": "crawler already running"})
 
+    # Cooldowns survive restarts; don't start into a ban
+    cooling = cooling_down_sources()
+    if len(cooling) == len(SOURCES):
+        return jsonify({
+            "status": "all sources cooling down",
+            "retry_at": min(cooling.values()).isoformat(timespec="seconds")
+        }), 429
+
+    stream = request.args.get("stream", "").lower() in ("1", "true", "yes")
+
     thread = threading.Thread(
-        target=crawl_all_sources,
+        target=crawl_and_index if stream else crawl_all_sources,
         daemon=True
     )
     thread.start()
 
-    return jsonify({"status": "crawler started"})
+    return jsonify({
+        "status": "crawler started",
+        "streaming": stream,
+        "skipped": {n: t.isoformat(timespec="seconds") for n, t in cooling.items()}
+    })
 
 
 @app.route("/api/crawl/status")
 def crawler_status():
-    return jsonify(crawler_state)
+    status = {**crawler_state, "rate_limits": get_rate_limiter().stats()}
+    if stream_indexer is not None:
+        status["stream"] = stream_indexer.stats()
+    return jsonify(status)
 
 
 # =========================
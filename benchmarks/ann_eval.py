@@ -0,0 +1,138 @@
+"""
+Recall / latency / memory evaluation of the FAISS index types.
+
+Uses the embeddings of the current snapshot, or a synthetic corpus:
+
+    python -m benchmarks.ann_eval
+    python -m benchmarks.ann_eval --synthetic 200000 --types flat hnsw ivf_flat ivf_pq
+    python -m benchmarks.ann_eval --nprobe 8 16 32 --ef-search 64 128 256 --json ann.json
+
+Recall@k is measured against the exact flat (IndexFlatIP) results.
+"""
+import argparse
+import json
+import time
+import numpy as np
+import faiss
+
+from face_engine.ann import INDEX_TYPES, build_index, configure_search
+from face_engine.snapshot import load_snapshot, EMBEDDINGS_NAME
+
+
+def synthetic_embeddings(n: int, dim: int = 512, identities: int = None, seed: int = 0):
+    """
+    Clustered unit vectors: a few faces per identity, like a real corpus.
+    """
+    rng = np.random.default_rng(seed)
+    identities = identities or max(1, n // 5)
+    centers = rng.standard_normal((identities, dim)).astype("float32")
+    x = centers[rng.integers(0, identities, size=n)] + 0.6 * rng.standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def load_corpus(synthetic: int):
+    if synthetic:
+        return synthetic_embeddings(synthetic), f"synthetic ({synthetic})"
+
+    snapshot = load_snapshot(verify=False)
+    if snapshot is None:
+        raise SystemExit("No index snapshot found — use --synthetic N")
+    x = np.load(snapshot.file(EMBEDDINGS_NAME)).astype("float32")
+    return x, f"snapshot {snapshot.version}"
+
+
+def make_queries(corpus: np.ndarray, count: int, seed: int = 1):
+    """
+    Perturbed corpus vectors, so each query has a true near neighbour.
+    """
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(corpus), size=min(count, len(corpus)), replace=False)
+    q = corpus[picks] + 0.3 * rng.standard_normal((len(picks), corpus.shape[1])).astype("float32")
+    faiss.normalize_L2(q)
+    return q
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def evaluate(index, queries, truth, k):
+    # one query per call, like /api/search
+    start = time.perf_counter()
+    found = np.vstack([index.search(q.reshape(1, -1), k)[1] for q in queries])
+    elapsed = time.perf_counter() - start
+
+    return {
+        f"recall@{k}": round(recall_at_k(found, truth), 4),
+        "qps": round(len(queries) / elapsed, 1),
+        "latency_ms": round(elapsed / len(queries) * 1000, 3),
+    }
+
+
+def run(corpus, types, k, queries, nprobes, ef_searches):
+    queries = make_queries(corpus, queries)
+
+    flat = faiss.IndexFlatIP(corpus.shape[1])
+    flat.add(corpus)
+    _, truth = flat.search(queries, k)
+
+    rows = []
+    for index_type in types:
+        start = time.perf_counter()
+        index = build_index(corpus, index_type=index_type)
+        build_s = time.perf_counter() - start
+        memory_mb = len(faiss.serialize_index(index)) / 2**20
+
+        if index_type.startswith("ivf"):
+            knobs = [{"nprobe": p} for p in nprobes]
+        elif index_type == "hnsw":
+            knobs = [{"ef_search": e} for e in ef_searches]
+        else:
+            knobs = [{}]
+
+        for knob in knobs:
+            configure_search(index, **knob)
+            rows.append({
+                "index_type": index_type,
+                **knob,
+                **evaluate(index, queries, truth, k),
+                "memory_mb": round(memory_mb, 2),
+                "build_s": round(build_s, 2),
+            })
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of the snapshot")
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 128, 256])
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    corpus, source = load_corpus(args.synthetic)
+    print(f"[ANN] Corpus: {source}, {len(corpus)} x {corpus.shape[1]}")
+
+    rows = run(corpus, args.types, args.k, args.queries, args.nprobe, args.ef_search)
+
+    print(f"{'type':<9} {'knob':<14} {'recall@' + str(args.k):>10} {'qps':>9} {'ms':>8} {'MB':>9} {'build s':>8}")
+    for r in rows:
+        knob = f"nprobe={r['nprobe']}" if "nprobe" in r else f"ef={r['ef_search']}" if "ef_search" in r else "-"
+        print(
+            f"{r['index_type']:<9} {knob:<14} {r[f'recall@{args.k}']:>10.4f} {r['qps']:>9.1f} "
+            f"{r['latency_ms']:>8.3f} {r['memory_mb']:>9.2f} {r['build_s']:>8.2f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"corpus": source, "size": len(corpus), "k": args.k, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
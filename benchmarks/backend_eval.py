@@ -0,0 +1,132 @@
+"""
+Throughput of the ONNX Runtime embedding backend by batch size and
+thread settings:
+
+    python -m benchmarks.backend_eval                       # tiny generated model
+    python -m benchmarks.backend_eval --model models/facenet512.onnx --batch 1 8 32
+    python -m benchmarks.backend_eval --model models/facenet512.onnx --deepface
+
+Without --model a tiny convolutional model with Facenet512's input and
+output shapes is generated (needs the `onnx` package), so the batching
+and threading code paths can be exercised on any machine; its numbers
+only show relative overheads. --deepface also embeds the same crops
+with DeepFace and reports the cosine similarity between the two
+backends' vectors, to check an exported model before switching
+EMBEDDING_BACKEND.
+
+crops_per_s   aligned crops embedded per second
+ms_per_crop   wall time per crop
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from face_engine.backends import OnnxBackend, DeepFaceBackend
+
+INPUT_SIZE = 160
+EMBEDDING_DIM = 512
+
+
+def make_tiny_model(path: str, size: int = INPUT_SIZE, dim: int = EMBEDDING_DIM, seed: int = 0) -> str:
+    """
+    NHWC float input (N, size, size, 3) -> (N, dim), batch dimension
+    dynamic: Transpose, two strided convolutions, global pooling, dense.
+    """
+    import onnx
+    from onnx import helper, numpy_helper, TensorProto
+
+    rng = np.random.default_rng(seed)
+    weights = {
+        "w1": rng.standard_normal((16, 3, 5, 5)).astype(np.float32) * 0.1,
+        "w2": rng.standard_normal((32, 16, 3, 3)).astype(np.float32) * 0.1,
+        "dense": rng.standard_normal((32, dim)).astype(np.float32) * 0.1,
+    }
+    nodes = [
+        helper.make_node("Transpose", ["input"], ["nchw"], perm=[0, 3, 1, 2]),
+        helper.make_node("Conv", ["nchw", "w1"], ["c1"], strides=[2, 2], pads=[2, 2, 2, 2]),
+        helper.make_node("Relu", ["c1"], ["r1"]),
+        helper.make_node("Conv", ["r1", "w2"], ["c2"], strides=[2, 2], pads=[1, 1, 1, 1]),
+        helper.make_node("Relu", ["c2"], ["r2"]),
+        helper.make_node("GlobalAveragePool", ["r2"], ["pooled"]),
+        helper.make_node("Flatten", ["pooled"], ["flat"]),
+        helper.make_node("MatMul", ["flat", "dense"], ["embedding"]),
+    ]
+    graph = helper.make_graph(
+        nodes, "tiny_face_embedder",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["N", size, size, 3])],
+        [helper.make_tensor_value_info("embedding", TensorProto.FLOAT, ["N", dim])],
+        initializer=[numpy_helper.from_array(v, k) for k, v in weights.items()],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+    return path
+
+
+def make_crops(n: int, seed: int = 0) -> list:
+    # face crops come out of the detector at assorted sizes
+    rng = np.random.default_rng(seed)
+    return [
+        rng.integers(0, 256, (int(s), int(s * rng.uniform(0.8, 1.0)), 3), dtype=np.uint8)
+        for s in rng.integers(60, 400, n)
+    ]
+
+
+def bench(backend, crops, repeat: int) -> dict:
+    backend.embed(crops[:backend.batch_size])     # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        backend.embed(crops)
+    elapsed = (time.perf_counter() - start) / repeat
+    return {
+        "crops_per_s": round(len(crops) / elapsed, 1),
+        "ms_per_crop": round(elapsed / len(crops) * 1000, 3),
+    }
+
+
+def agreement(onnx_backend, crops) -> dict:
+    a = onnx_backend.embed(crops)
+    b = DeepFaceBackend().embed(crops)
+    a /= np.linalg.norm(a, axis=1, keepdims=True)
+    b /= np.linalg.norm(b, axis=1, keepdims=True)
+    cos = np.sum(a * b, axis=1)
+    return {"cosine_mean": round(float(cos.mean()), 5), "cosine_min": round(float(cos.min()), 5)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="ONNX embedding model (default: generate a tiny one)")
+    parser.add_argument("--crops", type=int, default=256)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--intra", type=int, nargs="+", default=[0, 1], help="intra-op thread counts (0 = ORT default)")
+    parser.add_argument("--inter", type=int, nargs="+", default=[0], help="inter-op thread counts")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--deepface", action="store_true", help="compare vectors with the DeepFace backend")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="backend-eval-") as tmp:
+        model = args.model or make_tiny_model(os.path.join(tmp, "tiny.onnx"))
+        print(f"[BACKEND] Model: {model if args.model else 'tiny generated model'}, {args.crops} crops")
+
+        crops = make_crops(args.crops)
+        print(f"{'batch':>6} {'intra':>6} {'inter':>6} {'crops/s':>10} {'ms/crop':>9}")
+        for intra in args.intra:
+            for inter in args.inter:
+                for batch in args.batch:
+                    backend = OnnxBackend(
+                        model_path=model, batch_size=batch,
+                        intra_op_threads=intra, inter_op_threads=inter, detector="retinaface"
+                    )
+                    r = bench(backend, crops, args.repeat)
+                    print(f"{backend.batch_size:>6} {intra:>6} {inter:>6} {r['crops_per_s']:>10.1f} {r['ms_per_crop']:>9.3f}")
+
+        if args.deepface:
+            r = agreement(OnnxBackend(model_path=model, detector="retinaface"), crops[:32])
+            print(f"[BACKEND] ONNX vs DeepFace cosine: mean {r['cosine_mean']}, min {r['cosine_min']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Exact-match stage benchmark: the old per-entry hamming_distance loop
+vs. a vectorized popcount scan vs. the multi-index PHashIndex.
+
+    python -m benchmarks.phash_lookup --sizes 10000 100000 1000000
+"""
+import argparse
+import time
+import numpy as np
+
+from face_engine.image_hash import hamming_distance
+from face_engine.phash_index import PHashIndex, popcount64
+
+PHASH_THRESHOLD = 6
+
+
+def make_corpus(n: int, queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(0, 2**64, size=n, dtype=np.uint64)
+
+    # half the queries are near-duplicates of corpus entries
+    picks = rng.integers(0, n, size=queries)
+    query_codes = rng.integers(0, 2**64, size=queries, dtype=np.uint64)
+    for i in range(0, queries, 2):
+        flips = rng.choice(64, size=rng.integers(0, PHASH_THRESHOLD + 1), replace=False)
+        q = int(codes[picks[i]])
+        for bit in flips:
+            q ^= 1 << int(bit)
+        query_codes[i] = q
+
+    return codes, [f"{int(q):016x}" for q in query_codes]
+
+
+def legacy_loop(metadata, query_hash):
+    hits = []
+    for row, item in enumerate(metadata):
+        if "phash" not in item:
+            continue
+        dist = hamming_distance(query_hash, item["phash"])
+        if dist <= PHASH_THRESHOLD:
+            hits.append((row, dist))
+    return sorted(hits, key=lambda x: x[1])
+
+
+def linear_scan(codes, query_hash):
+    dists = popcount64(codes ^ np.uint64(int(query_hash, 16)))
+    rows = np.nonzero(dists <= PHASH_THRESHOLD)[0]
+    return sorted(zip(rows.tolist(), dists[rows].tolist()), key=lambda x: x[1])
+
+
+def _time_per_query(fn, queries):
+    start = time.perf_counter()
+    results = [fn(q) for q in queries]
+    return (time.perf_counter() - start) / len(queries) * 1000, results
+
+
+def run(sizes, queries: int, legacy_max: int):
+    rows = []
+    for n in sizes:
+        codes, query_hashes = make_corpus(n, queries)
+
+        build_start = time.perf_counter()
+        index = PHashIndex(codes, np.arange(n))
+        build_ms = (time.perf_counter() - build_start) * 1000
+
+        mih_ms, mih = _time_per_query(lambda q: index.search(q, PHASH_THRESHOLD), query_hashes)
+        scan_ms, scan = _time_per_query(lambda q: linear_scan(codes, q), query_hashes)
+        assert [set(r) for r in mih] == [set(r) for r in scan], "index and scan disagree"
+
+        legacy_ms = None
+        if n <= legacy_max:
+            metadata = [{"phash": f"{int(c):016x}"} for c in codes]
+            legacy_ms, legacy = _time_per_query(lambda q: legacy_loop(metadata, q), query_hashes[:20])
+            assert [set(r) for r in legacy] == [set(r) for r in scan[:20]], "legacy loop disagrees"
+
+        rows.append({
+            "corpus": n,
+            "legacy_loop_ms": round(legacy_ms, 3) if legacy_ms is not None else None,
+            "popcount_scan_ms": round(scan_ms, 3),
+            "phash_index_ms": round(mih_ms, 3),
+            "index_build_ms": round(build_ms, 1),
+            "hits": sum(len(r) for r in mih),
+        })
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--legacy-max", type=int, default=1_000_000,
+                        help="skip the slow Python loop above this corpus size")
+    args = parser.parse_args()
+
+    print(f"{'corpus':>10} {'legacy ms':>10} {'scan ms':>9} {'index ms':>9} {'build ms':>9}")
+    for row in run(args.sizes, args.queries, args.legacy_max):
+        legacy = f"{row['legacy_loop_ms']:.3f}" if row["legacy_loop_ms"] is not None else "-"
+        print(
+            f"{row['corpus']:>10} {legacy:>10} {row['popcount_scan_ms']:>9.3f} "
+            f"{row['phash_index_ms']:>9.3f} {row['index_build_ms']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Accuracy / memory evaluation of reduced-precision vector storage.
+
+Builds each index type with float32, float16 and sq8 codes, with and
+without float32 re-ranking, and compares them with exact float32 search:
+
+    python -m benchmarks.precision_eval
+    python -m benchmarks.precision_eval --synthetic 200000 --types flat hnsw
+    python -m benchmarks.precision_eval --rerank 0 2 4 8 --json precision.json
+
+recall@k      share of the exact top-k ids found
+top1_same     share of queries whose best match is unchanged
+order_same    share of queries whose top-k list is identical, in order
+score_drift   mean / max |reported score - exact score| over returned ids,
+              in similarity points (the 0-100 scale the API returns)
+"""
+import argparse
+import json
+import time
+import numpy as np
+import faiss
+
+from face_engine.ann import STORAGE_TYPES, build_index, configure_search, search_reranked, storage_of
+from benchmarks.ann_eval import load_corpus, make_queries, recall_at_k
+
+PRECISION_TYPES = ("flat", "hnsw", "ivf_flat")
+
+
+def score_points(scores: np.ndarray) -> np.ndarray:
+    # same mapping as identity_response
+    return (scores + 1) / 2 * 100
+
+
+def evaluate(index, corpus, queries, truth, exact_scores, k, rerank):
+    start = time.perf_counter()
+    scores, found = [], []
+    for q in queries:
+        s, i = search_reranked(index, corpus, q.reshape(1, -1), k, factor=rerank)
+        scores.append(s[0])
+        found.append(i[0])
+    elapsed = time.perf_counter() - start
+    scores, found = np.vstack(scores), np.vstack(found)
+
+    # drift of the score the API would report for each returned id
+    valid = found >= 0
+    true_scores = np.einsum("qd,qkd->qk", queries, corpus[np.where(valid, found, 0)])
+    drift = np.abs(score_points(scores) - score_points(true_scores))[valid]
+
+    return {
+        f"recall@{k}": round(recall_at_k(found, truth), 4),
+        "top1_same": round(float(np.mean(found[:, 0] == truth[:, 0])), 4),
+        "order_same": round(float(np.mean(np.all(found == truth, axis=1))), 4),
+        "score_drift_mean": round(float(drift.mean()), 4) if drift.size else 0.0,
+        "score_drift_max": round(float(drift.max()), 4) if drift.size else 0.0,
+        "top1_score_delta": round(float(np.mean(np.abs(score_points(scores[:, 0]) - score_points(exact_scores[:, 0])))), 4),
+        "latency_ms": round(elapsed / len(queries) * 1000, 3),
+    }
+
+
+def run(corpus, types, storages, reranks, k, queries):
+    queries = make_queries(corpus, queries)
+
+    flat = faiss.IndexFlatIP(corpus.shape[1])
+    flat.add(corpus)
+    exact_scores, truth = flat.search(queries, k)
+
+    rows = []
+    for index_type in types:
+        for storage in storages:
+            index = build_index(corpus, index_type=index_type, storage=storage)
+            configure_search(index)
+            memory_mb = len(faiss.serialize_index(index)) / 2**20
+
+            for rerank in (reranks if storage_of(index) != "float32" else [0]):
+                rows.append({
+                    "index_type": index_type,
+                    "storage": storage,
+                    "rerank": rerank,
+                    **evaluate(index, corpus, queries, truth, exact_scores, k, rerank),
+                    "memory_mb": round(memory_mb, 2),
+                    "bytes_per_face": round(memory_mb * 2**20 / len(corpus), 1),
+                })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of the snapshot")
+    parser.add_argument("--types", nargs="+", default=["flat"], choices=PRECISION_TYPES)
+    parser.add_argument("--storage", nargs="+", default=list(STORAGE_TYPES), choices=STORAGE_TYPES)
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 4], help="re-rank factors to try (0 = off)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    corpus, source = load_corpus(args.synthetic)
+    print(f"[PRECISION] Corpus: {source}, {len(corpus)} x {corpus.shape[1]}")
+
+    rows = run(corpus, args.types, args.storage, args.rerank, args.k, args.queries)
+
+    print(
+        f"{'type':<9} {'storage':<8} {'rerank':>6} {'recall@' + str(args.k):>10} {'top1':>7} {'order':>7} "
+        f"{'drift':>8} {'max':>8} {'ms':>8} {'MB':>9} {'B/face':>7}"
+    )
+    for r in rows:
+        print(
+            f"{r['index_type']:<9} {r['storage']:<8} {r['rerank']:>6} {r[f'recall@{args.k}']:>10.4f} "
+            f"{r['top1_same']:>7.4f} {r['order_same']:>7.4f} {r['score_drift_mean']:>8.4f} "
+            f"{r['score_drift_max']:>8.4f} {r['latency_ms']:>8.3f} {r['memory_mb']:>9.2f} {r['bytes_per_face']:>7.1f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"corpus": source, "size": len(corpus), "k": args.k, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Query latency by detection resolution (QUERY_DETECT_MAX_SIDE):
+
+    python -m benchmarks.query_resolution --images photos/*.jpg
+    python -m benchmarks.query_resolution --images photos/*.jpg --sides 0 1600 1024 640
+    python -m benchmarks.query_resolution --stub            # synthetic 12 MP JPEGs, no model
+
+Every upload runs through embed_query() once per --sides value (0 =
+detect at full resolution, the old behaviour). Per side it reports the
+median time of each stage and the cosine similarity of the embedding to
+the full-resolution one, so a cap can be picked that keeps the vectors
+the same while cutting detection time.
+
+With --stub DeepFace is replaced by benchmarks/stub_deepface.py: decode
+and crop costs are real, detection and embedding are not, and the
+embeddings are not comparable across sides (agreement is skipped).
+
+decode / detect / crop / embed   median ms per query
+total_ms                         median end-to-end ms
+cosine_min                       worst agreement with the full-resolution vector
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+
+from benchmarks import stub_deepface
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("decode", "detect", "crop", "embed")
+
+
+def synthetic_photos(n: int, size=(4032, 3024), seed: int = 0) -> list:
+    """
+    n phone-sized JPEGs (smooth gradients + sensor-like noise).
+    """
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    photos = []
+    for _ in range(n):
+        base = rng.integers(0, 256, size=(6, 8, 3)).astype(np.uint8)
+        img = cv2.resize(base, size, interpolation=cv2.INTER_CUBIC)
+        img = cv2.add(img, rng.integers(0, 12, size=img.shape).astype(np.uint8))
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        photos.append(buf.tobytes())
+    return photos
+
+
+def run_side(uploads: list, side: int) -> tuple:
+    from face_engine.query import embed_query
+
+    stages = {stage: [] for stage in STAGES}
+    totals, embeddings = [], []
+    for image_bytes in uploads:
+        start = time.perf_counter()
+        emb, info = embed_query(image_bytes, max_side=side)
+        totals.append((time.perf_counter() - start) * 1000)
+        for stage in STAGES:
+            stages[stage].append(info["timings"].get(stage, 0.0))
+        embeddings.append(emb)
+
+    row = {stage: round(float(np.median(v)), 1) for stage, v in stages.items()}
+    row["total_ms"] = round(float(np.median(totals)), 1)
+    return row, embeddings
+
+
+def agreement(embeddings: list, reference: list):
+    cos = [
+        float(np.dot(a[0], b[0]))
+        for a, b in zip(embeddings, reference) if a is not None and b is not None
+    ]
+    return round(min(cos), 4) if cos else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", nargs="+", help="single-face photos (default: synthetic 12 MP JPEGs)")
+    parser.add_argument("--sides", type=int, nargs="+", default=[0, 2048, 1024, 640],
+                        help="detection long-edge caps to compare (0 = full resolution)")
+    parser.add_argument("--synthetic", type=int, default=8, help="synthetic photos when --images is not given")
+    parser.add_argument("--stub", action="store_true", help="use the offline DeepFace stand-in")
+    args = parser.parse_args()
+
+    if args.stub:
+        # before anything imports face_engine / config
+        stub_deepface.install()
+        os.environ.setdefault("PEXELS_API_KEY", "offline-benchmark")
+    sys.path.insert(0, REPO_DIR)
+
+    if args.images:
+        paths = [p for pattern in args.images for p in glob.glob(pattern)]
+        uploads = [open(p, "rb").read() for p in paths]
+    else:
+        uploads = synthetic_photos(args.synthetic)
+    print(f"[BENCH] {len(uploads)} uploads, detection caps {args.sides}")
+
+    run_side(uploads[:1], args.sides[0])    # warm-up: model load
+
+    reference = None
+    print(f"{'side':>6} {'decode':>8} {'detect':>8} {'crop':>8} {'embed':>8} {'total_ms':>9} {'cosine_min':>11}")
+    for side in args.sides:
+        row, embeddings = run_side(uploads, side)
+        if side == 0:
+            reference = embeddings
+        cosine = agreement(embeddings, reference) if reference is not None and not args.stub else None
+        print(
+            f"{side or 'full':>6} {row['decode']:>8.1f} {row['detect']:>8.1f} {row['crop']:>8.1f} "
+            f"{row['embed']:>8.1f} {row['total_ms']:>9.1f} {'-' if cosine is None else cosine:>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
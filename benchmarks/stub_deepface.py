@@ -0,0 +1,64 @@
+"""
+Offline stand-in for the `deepface` package, for benchmarks only.
+
+install() registers a fake `deepface` module before face_engine is
+imported. Every image gets one centred "face" whose 512-d embedding is
+derived from the pixels, so the same image always embeds the same way
+and no model weights or network are needed. `model_seconds` adds a
+fixed delay per call to mimic inference cost.
+"""
+import sys
+import time
+import types
+import hashlib
+import numpy as np
+
+EMBEDDING_DIM = 512
+
+
+def _as_array(img):
+    if isinstance(img, np.ndarray):
+        return img
+    import cv2
+    return cv2.imread(img)
+
+
+def _embedding(img: np.ndarray) -> list:
+    seed = int.from_bytes(hashlib.blake2b(img[::4, ::4].tobytes(), digest_size=8).digest(), "little")
+    v = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM)
+    return (v / np.linalg.norm(v)).tolist()
+
+
+def _centre_face(img: np.ndarray) -> dict:
+    h, w = img.shape[:2]
+    return {"x": w // 4, "y": h // 4, "w": w // 2, "h": h // 2, "left_eye": None, "right_eye": None}
+
+
+def install(model_seconds: float = 0.0):
+    class DeepFace:
+        @staticmethod
+        def represent(img_path, model_name=None, detector_backend=None, enforce_detection=True, **kwargs):
+            if model_seconds:
+                time.sleep(model_seconds)
+            img = _as_array(img_path)
+            return [{
+                "embedding": _embedding(img),
+                "facial_area": _centre_face(img),
+                "face_confidence": 0.99,
+            }]
+
+        @staticmethod
+        def extract_faces(img_path, detector_backend=None, enforce_detection=True, align=True, **kwargs):
+            img = _as_array(img_path)
+            area = _centre_face(img)
+            face = img[area["y"]:area["y"] + area["h"], area["x"]:area["x"] + area["w"], ::-1] / 255.0
+            return [{"face": face, "facial_area": area, "confidence": 0.99}]
+
+        @staticmethod
+        def build_model(model_name, *args, **kwargs):
+            return None
+
+    module = types.ModuleType("deepface")
+    module.DeepFace = DeepFace
+    sys.modules["deepface"] = module
+    return module
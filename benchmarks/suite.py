@@ -0,0 +1,456 @@
+"""
+Offline benchmark suite for the indexing and search hot paths.
+
+Runs without network access or model weights. DeepFace is replaced by
+benchmarks/stub_deepface.py, images are served by a local HTTP server,
+and all data lives in a temporary working directory:
+
+    python -m benchmarks.suite                  # full run
+    python -m benchmarks.suite --quick          # small sizes, ~1 minute
+    python -m benchmarks.suite --only faiss rebuild
+    python -m benchmarks.suite --compare benchmarks/results/suite-20260101-120000.json
+
+Benchmarks:
+    phash         exact-match stage: legacy per-entry loop vs. PHashIndex
+    faiss         FAISS search latency at several corpus sizes
+    append        crawler append_to_metadata() into a large crawl log
+    load_index    load_index() of a published snapshot
+    rebuild       rebuild_index_from_urls() throughput, cold and warm image store
+
+Results go to benchmarks/results/suite-<timestamp>.json (or --json).
+Every run stores a flat "metrics" map (lower is better unless the name
+ends in _per_s), which --compare diffs against an earlier run.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+from benchmarks import stub_deepface
+
+BENCHMARKS = ("phash", "faiss", "append", "load_index", "rebuild")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SIZES = {
+    "full": {
+        "phash": [10_000, 100_000, 1_000_000],
+        "faiss": [10_000, 100_000],
+        "append_existing": 200_000,
+        "load_index": [10_000, 100_000],
+        "rebuild_images": 500,
+    },
+    "quick": {
+        "phash": [10_000, 100_000],
+        "faiss": [10_000],
+        "append_existing": 20_000,
+        "load_index": [10_000],
+        "rebuild_images": 100,
+    },
+}
+
+
+def timed(fn, repeat: int = 1):
+    """
+    Best wall time of `repeat` calls, in seconds.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# -----------------------------
+# Synthetic data
+# -----------------------------
+def synthetic_jpegs(n: int, seed: int = 0) -> list:
+    """
+    n distinct JPEGs (smooth gradients + noise, 200-480 px wide), so
+    pHashes differ and the pre-filter and decoder do real work.
+    """
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(n):
+        w = int(rng.integers(200, 481))
+        h = int(w * rng.uniform(0.75, 1.33))
+        base = rng.integers(0, 256, size=(4, 4, 3)).astype(np.uint8)
+        img = cv2.resize(base, (w, h), interpolation=cv2.INTER_CUBIC)
+        img = cv2.add(img, rng.integers(0, 24, size=img.shape).astype(np.uint8))
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        images.append(buf.tobytes())
+    return images
+
+
+class ImageServer:
+    """
+    Local HTTP stand-in for image hosts: keep-alive, ETag, 304.
+    """
+
+    def __init__(self, images: list):
+        blobs = {f"/img/{i}.jpg": data for i, data in enumerate(images)}
+        etags = {path: '"' + hashlib.sha1(data).hexdigest() + '"' for path, data in blobs.items()}
+        self.requests = {"200": 0, "304": 0}
+        counts, lock = self.requests, threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                data = blobs.get(self.path)
+                if data is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                if self.headers.get("If-None-Match") == etags[self.path]:
+                    with lock:
+                        counts["304"] += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etags[self.path])
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                with lock:
+                    counts["200"] += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("ETag", etags[self.path])
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def url(self, i: int) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/img/{i}.jpg"
+
+
+# -----------------------------
+# Benchmarks
+# -----------------------------
+def bench_phash(sizes, queries: int = 200):
+    from benchmarks.phash_lookup import make_corpus, legacy_loop, PHASH_THRESHOLD
+    from face_engine.phash_index import PHashIndex
+
+    results, metrics = [], {}
+    for n in sizes:
+        codes, query_hashes = make_corpus(n, queries)
+        index = PHashIndex(codes, np.arange(n, dtype=np.int64))
+        row = {"size": n}
+
+        # the legacy loop is O(corpus) in Python; time a few queries only
+        if n <= 100_000:
+            metadata = [{"phash": f"{int(c):016x}"} for c in codes]
+            few = query_hashes[:5]
+            row["legacy_loop_ms"] = round(timed(lambda: [legacy_loop(metadata, q) for q in few]) / len(few) * 1000, 3)
+
+        row["phash_index_ms"] = round(timed(lambda: [index.search(q, PHASH_THRESHOLD) for q in query_hashes]) / queries * 1000, 4)
+        row["search_batch_ms"] = round(timed(lambda: index.search_batch(query_hashes, PHASH_THRESHOLD)) / queries * 1000, 4)
+        results.append(row)
+
+        for key, value in row.items():
+            if key != "size":
+                metrics[f"phash.{n}.{key}"] = value
+
+    return results, metrics
+
+
+def bench_faiss(sizes, queries: int = 200, k: int = 50):
+    import faiss
+    from benchmarks.ann_eval import synthetic_embeddings, make_queries
+    from face_engine.ann import build_index, configure_search, search_reranked
+    from config import FAISS_INDEX_TYPE, FAISS_STORAGE
+
+    results, metrics = [], {}
+    for n in sizes:
+        corpus = synthetic_embeddings(n)
+        q = make_queries(corpus, queries)
+
+        variants = [("flat", "float32")]
+        if (FAISS_INDEX_TYPE, FAISS_STORAGE) not in variants:
+            variants.append((FAISS_INDEX_TYPE, FAISS_STORAGE))
+
+        for index_type, storage in variants:
+            start = time.perf_counter()
+            index = build_index(corpus, index_type=index_type, storage=storage)
+            build_s = time.perf_counter() - start
+            configure_search(index)
+
+            # one query per call, like /api/search
+            per_query = timed(lambda: [search_reranked(index, corpus, v.reshape(1, -1), k) for v in q]) / queries
+            batched = timed(lambda: search_reranked(index, corpus, q, k)) / queries
+
+            row = {
+                "size": n,
+                "index_type": index_type,
+                "storage": storage,
+                "build_s": round(build_s, 3),
+                "query_ms": round(per_query * 1000, 4),
+                "batched_query_ms": round(batched * 1000, 4),
+                "memory_mb": round(len(faiss.serialize_index(index)) / 2**20, 2),
+            }
+            results.append(row)
+            prefix = f"faiss.{n}.{index_type}.{storage}"
+            metrics[f"{prefix}.query_ms"] = row["query_ms"]
+            metrics[f"{prefix}.batched_query_ms"] = row["batched_query_ms"]
+
+    return results, metrics
+
+
+def bench_append(existing: int, batches: int = 50, batch_size: int = 100):
+    # crawler state lives under FACETRACE_DATA_DIR (the working directory)
+    from crawler import crawler
+    os.makedirs(os.path.dirname(crawler.METADATA_PATH), exist_ok=True)
+    with open(crawler.METADATA_PATH, "w") as f:
+        json.dump([{"url": f"https://example.com/old/{i}.jpg", "source": "bench"} for i in range(existing)], f)
+
+    start = time.perf_counter()
+    crawler.get_segment_log()
+    bootstrap_s = time.perf_counter() - start
+
+    times = []
+    for b in range(batches):
+        # a third of every batch was already crawled
+        urls = [f"https://example.com/new/{b}/{i}.jpg" for i in range(batch_size * 2 // 3)]
+        urls += [f"https://example.com/old/{(b * batch_size + i) % existing}.jpg" for i in range(batch_size // 3)]
+        start = time.perf_counter()
+        crawler.append_to_metadata(urls, source="bench")
+        times.append(time.perf_counter() - start)
+
+    compact_s = timed(lambda: crawler.get_segment_log().compact(include_active=True))
+
+    result = {
+        "existing": existing,
+        "batches": batches,
+        "batch_size": batch_size,
+        "bootstrap_s": round(bootstrap_s, 3),
+        "append_ms_mean": round(float(np.mean(times)) * 1000, 3),
+        "append_ms_p95": round(float(np.percentile(times, 95)) * 1000, 3),
+        "compact_s": round(compact_s, 3),
+    }
+    metrics = {f"append.{key}": value for key, value in result.items() if key.endswith(("_s", "_ms_mean", "_ms_p95"))}
+    return result, metrics
+
+
+def bench_load_index(sizes):
+    import faiss
+    from benchmarks.ann_eval import synthetic_embeddings
+    from face_engine import indexer
+    from face_engine.ann import build_index
+    from face_engine.snapshot import load_snapshot
+
+    results, metrics = [], {}
+    rng = np.random.default_rng(0)
+    for n in sizes:
+        embeddings = synthetic_embeddings(n)
+        metadata = [
+            {"url": f"https://example.com/{i}.jpg", "phash": f"{int(c):016x}", "source": "bench"}
+            for i, c in enumerate(rng.integers(0, 2**64, size=n, dtype=np.uint64))
+        ]
+        index = build_index(embeddings)
+        indexer._save_snapshot(index, metadata, [], lambda path: np.save(path, embeddings), {"built_by": "benchmark"})
+
+        row = {
+            "size": n,
+            "load_index_s": round(timed(indexer.load_index, repeat=3), 4),
+            "load_full_verify_s": round(timed(lambda: load_snapshot(verify="full"), repeat=3), 4),
+            "load_unverified_s": round(timed(lambda: load_snapshot(verify=False), repeat=3), 4),
+            "index_mb": round(len(faiss.serialize_index(index)) / 2**20, 2),
+        }
+        results.append(row)
+        metrics[f"load_index.{n}.load_index_s"] = row["load_index_s"]
+        metrics[f"load_index.{n}.load_full_verify_s"] = row["load_full_verify_s"]
+        metrics[f"load_index.{n}.load_unverified_s"] = row["load_unverified_s"]
+
+    return results, metrics
+
+
+def bench_rebuild(n_images: int, workdir: str):
+    from face_engine import indexer
+    from face_engine.image_store import ImageStore
+
+    images = synthetic_jpegs(n_images)
+    runs = {}
+
+    with ImageServer(images) as server:
+        urls = [server.url(i) for i in range(n_images)]
+
+        for name, revalidate in (("cold", 0), ("revalidate", 0), ("warm", 3600)):
+            if name == "cold":
+                shutil.rmtree(os.path.join(workdir, "images"), ignore_errors=True)
+            # the suite's own store, so nothing is written under the repo
+            indexer._image_store = ImageStore(
+                os.path.join(workdir, "images"), max_bytes=2**34, revalidate_seconds=revalidate
+            )
+            before = dict(server.requests)
+
+            start = time.perf_counter()
+            report = indexer.rebuild_index_from_urls(urls)
+            elapsed = time.perf_counter() - start
+
+            runs[name] = {
+                "images": n_images,
+                "seconds": round(elapsed, 3),
+                "images_per_s": round(n_images / elapsed, 1),
+                "indexed": report["indexed"],
+                "http_200": server.requests["200"] - before["200"],
+                "http_304": server.requests["304"] - before["304"],
+                "stages": {
+                    stage: {"avg_ms": s["avg_ms"], "per_second": s["per_second"], "workers": s["workers"]}
+                    for stage, s in report["stages"].items()
+                },
+            }
+
+    metrics = {f"rebuild.{name}.images_per_s": run["images_per_s"] for name, run in runs.items()}
+    return runs, metrics
+
+
+# -----------------------------
+# Runner
+# -----------------------------
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _environment() -> dict:
+    import faiss
+    import cv2
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "faiss": getattr(faiss, "__version__", None),
+        "opencv": cv2.__version__,
+    }
+
+
+def compare(current: dict, previous: dict):
+    print(f"\n[BENCH] Compared with {previous.get('commit')} ({previous.get('created_at')})")
+    print(f"{'metric':<52} {'before':>12} {'after':>12} {'change':>9}")
+    for name, after in sorted(current["metrics"].items()):
+        before = previous.get("metrics", {}).get(name)
+        if before is None or not before:
+            continue
+        change = (after - before) / before * 100
+        better = change > 0 if name.endswith("_per_s") else change < 0
+        mark = "" if abs(change) < 5 else ("  better" if better else "  worse")
+        print(f"{name:<52} {before:>12} {after:>12} {change:>+8.1f}%{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="small corpus sizes")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="run only these benchmarks")
+    parser.add_argument("--model-ms", type=float, default=0.0, help="simulated DeepFace time per image")
+    parser.add_argument("--json", help="result file (default benchmarks/results/suite-<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary working directory")
+    args = parser.parse_args()
+
+    sizes = SIZES["quick" if args.quick else "full"]
+    selected = args.only or list(BENCHMARKS)
+
+    workdir = tempfile.mkdtemp(prefix="facetrace-bench-")
+
+    # before anything imports face_engine / config. All runtime state
+    # (crawler pacing, image store, snapshots) goes to the working
+    # directory, never to the repo's data/.
+    stub_deepface.install(model_seconds=args.model_ms / 1000)
+    os.environ.setdefault("PEXELS_API_KEY", "offline-benchmark")
+    os.environ["FACETRACE_DATA_DIR"] = os.path.join(workdir, "data")
+    sys.path.insert(0, REPO_DIR)
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    print(f"[BENCH] Working directory {workdir}")
+
+    result = {
+        "suite": "offline",
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "environment": _environment(),
+        "options": {"quick": args.quick, "model_ms": args.model_ms, "sizes": sizes},
+        "benchmarks": {},
+        "metrics": {},
+    }
+
+    runners = {
+        "phash": lambda: bench_phash(sizes["phash"]),
+        "faiss": lambda: bench_faiss(sizes["faiss"]),
+        "append": lambda: bench_append(sizes["append_existing"]),
+        "load_index": lambda: bench_load_index(sizes["load_index"]),
+        "rebuild": lambda: bench_rebuild(sizes["rebuild_images"], workdir),
+    }
+
+    try:
+        for name in BENCHMARKS:
+            if name not in selected:
+                continue
+            print(f"[BENCH] ▶ {name}")
+            start = time.perf_counter()
+            details, metrics = runners[name]()
+            result["benchmarks"][name] = details
+            result["metrics"].update(metrics)
+            print(f"[BENCH] ✔ {name} ({time.perf_counter() - start:.1f}s)")
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{'metric':<52} {'value':>12}")
+    for key, value in sorted(result["metrics"].items()):
+        print(f"{key:<52} {value:>12}")
+
+    path = args.json
+    if not path:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"suite-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n[BENCH] Results saved to {path}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,9 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # ---------------- PATHS ----------------
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
-DATA_DIR = os.path.join(BASE_DIR, "data")
+# All runtime state lives under DATA_DIR; FACETRACE_DATA_DIR moves it
+# elsewhere (the benchmarks use a temp dir)
+DATA_DIR = os.getenv("FACETRACE_DATA_DIR") or os.path.join(BASE_DIR, "data")
 IMAGE_DIR = os.path.join(DATA_DIR, "images")
 EMBEDDING_DIR = os.path.join(DATA_DIR, "embeddings")
 
@@ -17,13 +19,109 @@ ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "webp"}
 CRAWLER_DELAY_SECONDS = 8        # delay between requests (anti-ban)
 CRAWLER_COOLDOWN_HOURS = 3       # wait time after CAPTCHA / ban
 MAX_IMAGES_PER_SOURCE = 50
+CRAWLER_HOST_DELAYS = {          # starting seconds between requests per host (others use CRAWLER_DELAY_SECONDS)
+    "images.search.yahoo.com": 1.2,
+    "www.flickr.com": 1.4,
+    "commons.wikimedia.org": 1.2,
+    "api.pexels.com": 0.7,
+    "serpapi.com": 1.0,
+}
+CRAWLER_MIN_DELAY_SECONDS = 0.3  # adaptive pacing never goes faster than this
+CRAWLER_MAX_DELAY_SECONDS = 120
+CRAWLER_BACKOFF_FACTOR = 2.0     # delay multiplier on 429 / 5xx / slow / CAPTCHA
+CRAWLER_SPEEDUP_STEP = 0.1       # seconds shaved off after a healthy streak
+CRAWLER_SPEEDUP_AFTER = 5        # healthy responses per speed-up step
+CRAWLER_SLOW_RESPONSE_SECONDS = 5.0
+CRAWLER_RATE_STATE_FILE = os.path.join(DATA_DIR, "rate_limits.json")
+CRAWL_JOURNAL_FSYNC_EVERY = 50   # journal records per fsync
+CRAWL_JOURNAL_FSYNC_SECONDS = 2.0
+CRAWL_SEGMENT_MAX_RECORDS = 5000 # URLs per crawl log segment before rolling
+CRAWL_COMPACT_EVERY_SEGMENTS = 4 # closed segments that trigger background compaction
 
 # ---------------- FACE ENGINE ----------------
 FACE_MODEL = "ArcFace"
 FACE_DETECTOR = "retinaface"
 SIMILARITY_THRESHOLD = 0.60
 
+# ---------------- EMBEDDING BACKEND ----------------
+EMBEDDING_BACKEND = "deepface"   # deepface (TensorFlow) | onnx (ONNX Runtime)
+ONNX_MODEL_PATH = os.path.join(BASE_DIR, "models", "facenet512.onnx")
+ONNX_BATCH_SIZE = 32             # face crops per ONNX Runtime call
+ONNX_INTRA_OP_THREADS = 0        # threads inside one operator, 0 = one per core
+ONNX_INTER_OP_THREADS = 0        # operators run in parallel, 0 = sequential
+ONNX_DETECTOR = "retinaface"     # retinaface (DeepFace) | yunet (OpenCV, no TensorFlow)
+ONNX_DETECTOR_MODEL_PATH = os.path.join(BASE_DIR, "models", "face_detection_yunet.onnx")
+
+# ---------------- INDEXER PIPELINE ----------------
+INDEXER_DOWNLOAD_WORKERS = 16    # concurrent image downloads
+INDEXER_DECODE_WORKERS = 4       # decode + pHash workers
+INDEXER_EMBED_WORKERS = 1        # DeepFace workers (model is shared)
+INDEXER_PREFILTER_WORKERS = 1    # OpenCV pre-filter workers
+INDEXER_QUEUE_SIZE = 64          # max items buffered between stages
+INDEXER_CHECKPOINT_EVERY = 500   # incremental updates checkpoint every N URLs
+INDEXER_MAX_FACES = 16           # faces indexed per image, largest first
+INDEXER_MIN_FACE_SIDE = 24       # px; smaller extra faces are skipped (the largest is always kept)
+STREAM_QUEUE_SIZE = 256          # crawled URLs buffered before the crawler blocks
+STREAM_BATCH_SIZE = 64           # URLs per streaming ingestion batch
+STREAM_PUBLISH_SECONDS = 60      # how often streamed embeddings are published
+STREAM_PUBLISH_MAX_SHARE = 0.25  # publishing slows down to stay under this share of indexer time
+
+# ---------------- PRE-FILTER ----------------
+PREFILTER_ENABLED = True         # size / format sanity checks before embedding
+PREFILTER_OPENCV = True          # OpenCV face check before RetinaFace
+PREFILTER_MIN_BYTES = 1024       # smaller files are placeholders / pixels
+PREFILTER_MIN_SIDE = 48          # px, shorter image side
+PREFILTER_MAX_ASPECT = 3.0       # long side / short side
+PREFILTER_OPENCV_MAX_SIDE = 640  # downscale before the OpenCV check
+PREFILTER_AUDIT_RATE = 0.02      # share of OpenCV rejects still checked by RetinaFace
+PREFILTER_RETRY_REJECTS = True   # incremental updates re-check earlier OpenCV rejects with RetinaFace
+
+# ---------------- NEAR-DUPLICATES ----------------
+DEDUP_ENABLED = True             # embed each near-duplicate group once
+DEDUP_PHASH_THRESHOLD = 4        # pHash bits for "same photo"
+
+# ---------------- IMAGE STORE ----------------
+IMAGE_STORE_ENABLED = True       # keep downloaded images under IMAGE_DIR
+IMAGE_STORE_MAX_GB = 20          # LRU eviction above this size
+IMAGE_STORE_REVALIDATE_HOURS = 168  # serve from disk without asking the host for this long
+
+# ---------------- VECTOR INDEX ----------------
+FAISS_INDEX_TYPE = "flat"        # flat | hnsw | ivf_flat | ivf_pq
+FAISS_HNSW_M = 32                # graph degree
+FAISS_HNSW_EF_CONSTRUCTION = 200
+FAISS_HNSW_EF_SEARCH = 128       # search-time candidate list size
+FAISS_IVF_NLIST = 0              # inverted lists, 0 = auto (~4*sqrt(n))
+FAISS_IVF_NPROBE = 16            # lists scanned per query
+FAISS_PQ_M = 64                  # PQ sub-quantizers (must divide 512)
+FAISS_PQ_NBITS = 8
+FAISS_TRAIN_SAMPLE = 100_000     # max vectors used to train IVF / PQ
+FAISS_STORAGE = "float32"        # float32 | float16 | sq8 — vector codes held in the index
+FAISS_RERANK_FACTOR = 4          # reduced-precision indexes re-rank k x this candidates in float32 (0 = off)
+INDEX_SHARDS = 1                 # >1 writes the vector index as this many shards (rebuild to change)
+INDEX_SHARD_PARTITION = "hash"   # hash (by image URL) | range (by row id)
+SHARD_WORKERS = "local"          # local (one search process per shard) | remote (shard servers over HTTP)
+SHARD_REMOTE_URLS = []           # remote: base URL serving shard i, e.g. "http://10.0.0.5:9100"
+SHARD_TIMEOUT_SECONDS = 2.0      # shards slower than this are left out (degraded results)
+
+# ---------------- INDEX SNAPSHOTS ----------------
+SNAPSHOT_KEEP = 3                # published snapshots kept on disk
+SNAPSHOT_VERIFY_ON_LOAD = "quick" # before serving: "quick" (sizes + mtimes), "full" (SHA-256), "off"
+INDEX_RELOAD_CHECK_SECONDS = 30  # how often the API polls CURRENT (0 = never)
+
+# ---------------- QUERY PREPROCESSING ----------------
+QUERY_DETECT_MAX_SIDE = 1024     # px long edge uploads are detected at (0 = full resolution)
+QUERY_CROP_MARGIN = 0.3          # context around the face (share of its size) re-cropped at native resolution
+QUERY_CROP_MAX_SIDE = 640        # px; larger native face crops are shrunk before re-alignment
+
 # ---------------- API ----------------
+QUERY_CACHE_SIZE = 1024          # cached query results (0 = disabled)
+QUERY_CACHE_TTL_SECONDS = 900
+QUERY_CACHE_PHASH_THRESHOLD = 4  # pHash bits for a near-identical upload hit
+SEARCH_BATCH_MAX_FILES = 64      # uploads per /api/search/batch request
+INFERENCE_WORKERS = 2            # model processes (0 = in the request thread); each loads its own model
+INFERENCE_QUEUE_SIZE = 8         # queries waiting beyond the busy workers before 503
+INFERENCE_DEADLINE_SECONDS = 10  # per-query budget, then 504
+INFERENCE_RETRY_AFTER_SECONDS = 2
 API_PORT = 5005
 DEBUG = True
 
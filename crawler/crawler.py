@@ -1,5 +1,7 @@
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from crawler.sources import (
     crawl_yahoo_images,
@@ -9,26 +11,137 @@ from crawler.sources import (
     crawl_unsplash_images
 )
 from crawler.rate_limiter import RateLimiter
-from config import CRAWLER_DELAY_SECONDS, CRAWLER_COOLDOWN_HOURS
+from crawler.journal import CrawlJournal
+from crawler.segment_log import SegmentLog
+from config import (
+    CRAWLER_DELAY_SECONDS,
+    CRAWLER_COOLDOWN_HOURS,
+    CRAWLER_HOST_DELAYS,
+    CRAWLER_MIN_DELAY_SECONDS,
+    CRAWLER_MAX_DELAY_SECONDS,
+    CRAWLER_BACKOFF_FACTOR,
+    CRAWLER_SPEEDUP_STEP,
+    CRAWLER_SPEEDUP_AFTER,
+    CRAWLER_SLOW_RESPONSE_SECONDS,
+    CRAWLER_RATE_STATE_FILE,
+    CRAWL_JOURNAL_FSYNC_EVERY,
+    CRAWL_JOURNAL_FSYNC_SECONDS,
+    CRAWL_SEGMENT_MAX_RECORDS,
+    CRAWL_COMPACT_EVERY_SEGMENTS,
+    DATA_DIR,
+    EMBEDDING_DIR
+)
 
 # ===============================
 # Paths
 # ===============================
 
-METADATA_PATH = "data/embeddings/metadata.json"
-CRAWLED_URLS_FILE = "data/crawled_urls.json"
-
-os.makedirs("data/embeddings", exist_ok=True)
+METADATA_PATH = os.path.join(EMBEDDING_DIR, "metadata.json")
+CRAWLED_URLS_FILE = os.path.join(DATA_DIR, "crawled_urls.json")
+CRAWL_JOURNAL_FILE = os.path.join(DATA_DIR, "crawl_journal.jsonl")
+CRAWL_SEGMENT_DIR = os.path.join(EMBEDDING_DIR, "crawl_segments")
 
 # ===============================
-# Persistent crawled URL storage
+# Persistent crawler state (lazy)
 # ===============================
+# The crawled URL set (crawled_urls.json + journal replay), the journal,
+# the per-host rate limiter (data/rate_limits.json) and the segment log
+# (which bootstraps url_hashes.bin from metadata.json) are loaded on
+# first use, not at import. Inference and shard worker processes are
+# spawned and re-import the app's module graph, and must not pay for or
+# touch any of this.
+
+_runtime = {}
+_runtime_lock = threading.Lock()
+
 
-if os.path.exists(CRAWLED_URLS_FILE):
-    with open(CRAWLED_URLS_FILE, "r") as f:
-        crawled_urls = set(json.load(f))
-else:
-    crawled_urls = set()
+def _load_runtime() -> dict:
+    os.makedirs(EMBEDDING_DIR, exist_ok=True)
+
+    if os.path.exists(CRAWLED_URLS_FILE):
+        with open(CRAWLED_URLS_FILE, "r") as f:
+            crawled_urls = set(json.load(f))
+    else:
+        crawled_urls = set()
+
+    # URLs accepted since crawled_urls.json was last written
+    journal = CrawlJournal(
+        CRAWL_JOURNAL_FILE,
+        fsync_every=CRAWL_JOURNAL_FSYNC_EVERY,
+        fsync_seconds=CRAWL_JOURNAL_FSYNC_SECONDS
+    )
+    crawled_urls.update(journal.replay()["urls"])
+
+    rate_limiter = RateLimiter(
+        delay_seconds=CRAWLER_DELAY_SECONDS,
+        cooldown_hours=CRAWLER_COOLDOWN_HOURS,
+        host_delays=CRAWLER_HOST_DELAYS,
+        min_delay=CRAWLER_MIN_DELAY_SECONDS,
+        max_delay=CRAWLER_MAX_DELAY_SECONDS,
+        backoff=CRAWLER_BACKOFF_FACTOR,
+        speedup_step=CRAWLER_SPEEDUP_STEP,
+        speedup_after=CRAWLER_SPEEDUP_AFTER,
+        slow_seconds=CRAWLER_SLOW_RESPONSE_SECONDS,
+        state_path=CRAWLER_RATE_STATE_FILE
+    )
+
+    # Appends go to the segment log (O(batch)); compaction folds them
+    # into metadata.json in the background.
+    segment_log = SegmentLog(
+        CRAWL_SEGMENT_DIR,
+        METADATA_PATH,
+        max_records=CRAWL_SEGMENT_MAX_RECORDS,
+        compact_every=CRAWL_COMPACT_EVERY_SEGMENTS
+    )
+
+    print(f"[CRAWLER] Loaded crawl state — {len(crawled_urls)} crawled URLs")
+    return {
+        "crawled_urls": crawled_urls,
+        "journal": journal,
+        "rate_limiter": rate_limiter,
+        "segment_log": segment_log,
+    }
+
+
+def _crawler_runtime() -> dict:
+    if not _runtime:
+        with _runtime_lock:
+            if not _runtime:
+                _runtime.update(_load_runtime())
+    return _runtime
+
+
+def crawler_runtime_loaded() -> bool:
+    """
+    True once something in this process has used the crawler state.
+    Lets monitoring report it without loading it.
+    """
+    return bool(_runtime)
+
+
+def get_crawled_urls() -> set:
+    return _crawler_runtime()["crawled_urls"]
+
+
+def get_rate_limiter() -> RateLimiter:
+    return _crawler_runtime()["rate_limiter"]
+
+
+def get_journal() -> CrawlJournal:
+    return _crawler_runtime()["journal"]
+
+
+def get_segment_log() -> SegmentLog:
+    return _crawler_runtime()["segment_log"]
+
+
+def _save_crawled_urls():
+    tmp = CRAWLED_URLS_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(sorted(get_crawled_urls()), f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, CRAWLED_URLS_FILE)
 
 # ===============================
 # Runtime crawler state (API)
@@ -38,159 +151,158 @@ crawler_state = {
     "status": "idle",            # idle | running | paused | completed
     "captcha_required": False,
     "last_source": None,
-    "collected_urls": []
+    "collected_urls": [],
+    "sources": {}                # per-source status + new URL count
 }
 
 # ===============================
-# Rate limiter
+# Metadata append helper
 # ===============================
 
-rate_limiter = RateLimiter(
-    delay_seconds=CRAWLER_DELAY_SECONDS,
-    cooldown_hours=CRAWLER_COOLDOWN_HOURS
-)
+def append_to_metadata(new_urls, source=None):
+    added = get_segment_log().append(new_urls, source=source)
+    print(f"[CRAWLER] 📦 Metadata updated — {len(added)} new URLs added")
+    return added
 
 # ===============================
-# Metadata append helper
+# Sources
 # ===============================
+# (name, crawl function, host it fetches from). Each source runs in its
+# own thread; the rate limiter keeps each host at its own pace.
+
+SOURCES = [
+    ("yahoo", crawl_yahoo_images, "images.search.yahoo.com"),
+    ("flickr", crawl_flickr_images, "www.flickr.com"),
+    ("wikimedia", crawl_wikimedia_images, "commons.wikimedia.org"),
+    ("pexels", crawl_pexels_images, "api.pexels.com"),
+    ("unsplash", crawl_unsplash_images, "serpapi.com"),
+]
+
+_state_lock = threading.Lock()
+
+def cooling_down_sources() -> dict:
+    """
+    {source name: cooldown end} for every source whose host is blocked.
+    """
+    rate_limiter = get_rate_limiter()
+    return {
+        name: rate_limiter.blocked_until(host)
+        for name, _, host in SOURCES
+        if rate_limiter.is_blocked(host)
+    }
+
+
+def _crawl_source(name, crawl, host, done, stream=None):
+    source_state = crawler_state["sources"][name]
+    crawled_urls, journal, rate_limiter = get_crawled_urls(), get_journal(), get_rate_limiter()
+
+    if rate_limiter.is_blocked(host):
+        print(f"[CRAWLER] {name} cooling down until {rate_limiter.blocked_until(host):%H:%M}, skipped")
+        source_state["status"] = "paused"
+        return
 
-def append_to_metadata(new_urls):
-    if os.path.exists(METADATA_PATH):
-        with open(METADATA_PATH, "r") as f:
-            existing = json.load(f)
+    print(f"[CRAWLER] Crawling {name}" + (f" (resuming, {len(done)} pages done)" if done else ""))
+    source_state["status"] = "running"
+
+    def page_done(query, page, urls):
+        # Dedup + metadata append are shared across source threads.
+        # The page is journaled only once its URLs are in the crawl log.
+        with _state_lock:
+            new_urls = [u for u in dict.fromkeys(urls) if u not in crawled_urls]
+            if new_urls:
+                append_to_metadata(new_urls, source=name)
+            crawled_urls.update(new_urls)
+            crawler_state["collected_urls"].extend(new_urls)
+            crawler_state["last_source"] = name
+            journal.record("page", source=name, query=query, page=page, found=len(urls), urls=new_urls)
+
+        source_state["collected"] += len(new_urls)
+
+        # Outside the lock: a full stream queue blocks only this source
+        if stream is not None:
+            for url in new_urls:
+                stream.submit(url, name)
+
+    result = crawl(rate_limiter, done=done, on_page=page_done)
+
+    print(f"[CRAWLER] {name} collected {source_state['collected']} new images")
+
+    if result.get("captcha"):
+        # Only this source pauses; the others keep crawling
+        print(f"[CRAWLER] CAPTCHA detected on {name}, pausing it")
+        rate_limiter.block(host)
+        source_state["status"] = "paused"
+        crawler_state["captcha_required"] = True
     else:
-        existing = []
+        source_state["status"] = "completed"
 
-    existing_urls = {x["url"] for x in existing}
+    journal.record("source_end", sync=True, source=name, status=source_state["status"])
 
-    added = 0
-    for url in new_urls:
-        if url not in existing_urls:
-            existing.append({"url": url})
-            added += 1
-
-    with open(METADATA_PATH, "w") as f:
-        json.dump(existing, f, indent=2)
-
-    print(f"[CRAWLER] 📦 Metadata updated — {added} new URLs added")
 
 # ===============================
 # Main crawler entry
 # ===============================
 
-def crawl_all_sources():
-    global crawler_state, crawled_urls
+def crawl_all_sources(stream=None):
+    """
+    Crawl every source concurrently. With `stream` (a StreamingIndexer),
+    each accepted URL is also handed to the indexer as it is found.
+    """
+    global crawler_state
 
     print("[CRAWLER] Started")
+    journal = get_journal()
+
+    # Pick up where an interrupted run of this cycle stopped
+    resume = journal.replay()
+    if resume["runs"]:
+        pages = sum(len(p) for p in resume["pages"].values())
+        print(f"[CRAWLER] Resuming crawl cycle — {pages} pages already done")
+    get_crawled_urls().update(resume["urls"])
+    journal.start_run()
 
     crawler_state["status"] = "running"
     crawler_state["captcha_required"] = False
     crawler_state["collected_urls"] = []
+    crawler_state["sources"] = {
+        name: {"status": "pending", "collected": 0} for name, _, _ in SOURCES
+    }
+
+    with ThreadPoolExecutor(max_workers=len(SOURCES)) as pool:
+        futures = {}
+        for name, crawl, host in SOURCES:
+            if resume["sources"].get(name) == "completed":
+                print(f"[CRAWLER] {name} already completed this cycle, skipped")
+                crawler_state["sources"][name]["status"] = "completed"
+                continue
+            done = resume["pages"].get(name, {})
+            futures[pool.submit(_crawl_source, name, crawl, host, done, stream)] = name
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"[CRAWLER] {name} failed — {e}")
+                crawler_state["sources"][name]["status"] = "failed"
 
     # ===============================
-    # Yahoo Images
-    # ===============================
-    print("[CRAWLER] Crawling Yahoo")
-    rate_limiter.wait()
-
-    yahoo = crawl_yahoo_images()
-
-    if yahoo.get("captcha"):
-        print("[CRAWLER] CAPTCHA detected on Yahoo")
-        crawler_state["captcha_required"] = True
-        crawler_state["status"] = "paused"
-        rate_limiter.block()
-        return
-
-    new_yahoo = [u for u in yahoo.get("urls", []) if u not in crawled_urls]
-    crawled_urls.update(new_yahoo)
-    crawler_state["collected_urls"].extend(new_yahoo)
-    crawler_state["last_source"] = "yahoo"
-
-    append_to_metadata(new_yahoo)
-    print(f"[CRAWLER] Yahoo collected {len(new_yahoo)} new images")
-
-    # ===============================
-    # Flickr
-    # ===============================
-    print("[CRAWLER] Crawling Flickr")
-    rate_limiter.wait()
-
-    flickr = crawl_flickr_images()
-
-    if flickr.get("captcha"):
-        print("[CRAWLER] CAPTCHA detected on Flickr")
-        crawler_state["captcha_required"] = True
-        crawler_state["status"] = "paused"
-        rate_limiter.block()
-        return
-
-    new_flickr = [u for u in flickr.get("urls", []) if u not in crawled_urls]
-    crawled_urls.update(new_flickr)
-    crawler_state["collected_urls"].extend(new_flickr)
-    crawler_state["last_source"] = "flickr"
-
-    append_to_metadata(new_flickr)
-    print(f"[CRAWLER] Flickr collected {len(new_flickr)} new images")
-
-    # ===============================
-    # Wikimedia
-    # ===============================
-    print("[CRAWLER] Crawling Wikimedia")
-    rate_limiter.wait()
-
-    wikimedia = crawl_wikimedia_images()
-
-    new_wiki = [u for u in wikimedia.get("urls", []) if u not in crawled_urls]
-    crawled_urls.update(new_wiki)
-    crawler_state["collected_urls"].extend(new_wiki)
-    crawler_state["last_source"] = "wikimedia"
-
-    append_to_metadata(new_wiki)
-    print(f"[CRAWLER] Wikimedia collected {len(new_wiki)} new images")
-
-    # ===============================
-    # Pexels
-    # ===============================
-    print("[CRAWLER] Crawling Pexels")
-    rate_limiter.wait()
-
-    pexels = crawl_pexels_images()
-
-    new_pexels = [u for u in pexels.get("urls", []) if u not in crawled_urls]
-    crawled_urls.update(new_pexels)
-    crawler_state["collected_urls"].extend(new_pexels)
-    crawler_state["last_source"] = "pexels"
-
-    append_to_metadata(new_pexels)
-    print(f"[CRAWLER] Pexels collected {len(new_pexels)} new images")
-
-    # ===============================
-    # Unsplash (SerpAPI)
+    # Persist crawl results
     # ===============================
-    print("[CRAWLER] Crawling Unsplash")
-    rate_limiter.wait()
-
-    unsplash = crawl_unsplash_images()
-
-    new_unsplash_urls = [
-        url for url in unsplash.get("urls", [])
-        if url not in crawled_urls
-    ]
+    _save_crawled_urls()
+    get_rate_limiter().flush()
+    get_segment_log().compact_async(include_active=True)
 
-    crawled_urls.update(new_unsplash_urls)
-    crawler_state["collected_urls"].extend(new_unsplash_urls)
-    crawler_state["last_source"] = "unsplash"
+    unfinished = [n for n, st in crawler_state["sources"].items() if st["status"] != "completed"]
+    journal.record("run_end", sync=True, complete=not unfinished)
+    if not unfinished:
+        # Cycle done: crawled_urls.json has everything, start the next one fresh
+        journal.reset()
 
-    append_to_metadata(new_unsplash_urls)
+    paused = [n for n, st in crawler_state["sources"].items() if st["status"] == "paused"]
+    crawler_state["status"] = "paused" if paused else "completed"
 
-    print(f"[CRAWLER] Unsplash collected {len(new_unsplash_urls)} new images")
-
-    # ===============================
-    # Persist crawl results
-    # ===============================
-    with open(CRAWLED_URLS_FILE, "w") as f:
-        json.dump(sorted(crawled_urls), f, indent=2)
-
-    crawler_state["status"] = "completed"
-    print("[CRAWLER] Completed")
+    if paused:
+        print(f"[CRAWLER] Finished, paused sources: {', '.join(paused)}")
+    else:
+        print("[CRAWLER] Completed")
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+# -----------------------------
+# Append-only crawl journal
+# -----------------------------
+# One JSON record per line, covering the current crawl cycle:
+#
+#   {"t": "run_start", "at": ...}
+#   {"t": "page", "source", "query", "page", "found", "urls": [new URLs]}
+#   {"t": "source_end", "source", "status"}
+#   {"t": "run_end", "complete": bool}
+#
+# A page record is written once the page's URLs are in the crawl log.
+# After a crash, replay() gives back the dedup set and the pages already
+# done, and the next run skips them. Each record goes to the OS right
+# away, so it survives the process dying. fsync (for power loss) is
+# batched. A torn last line from a crash is ignored by replay() and
+# terminated before the next record is appended. When a cycle
+# completes (every source finished), crawled_urls.json holds the result
+# and the journal is truncated.
+
+
+class CrawlJournal:
+    def __init__(self, path: str, fsync_every: int = 50, fsync_seconds: float = 2.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_seconds = fsync_seconds
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _open(self):
+        # caller holds the lock
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            torn = self._ends_torn()
+            self._file = open(self.path, "a", encoding="utf-8")
+            if torn:
+                # end the torn line so the next record is not glued to it
+                self._file.write("\n")
+        return self._file
+
+    def _ends_torn(self) -> bool:
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return False
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b"\n"
+        except FileNotFoundError:
+            return False
+
+    def _sync(self):
+        # caller holds the lock
+        if self._file is not None and self._pending:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    # -----------------------------
+    # Writing
+    # -----------------------------
+    def record(self, kind: str, sync: bool = False, **fields):
+        line = json.dumps({"t": kind, **fields}, separators=(",", ":"))
+        with self._lock:
+            f = self._open()
+            f.write(line + "\n")
+            f.flush()
+            self._pending += 1
+
+            if (sync or self._pending >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_seconds):
+                self._sync()
+
+    def start_run(self):
+        self.record("run_start", sync=True, at=datetime.now().isoformat(timespec="seconds"))
+
+    def flush(self):
+        with self._lock:
+            self._sync()
+
+    def reset(self):
+        """
+        Start a new cycle with an empty journal.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._pending = 0
+            with open(self.path, "w"):
+                pass
+
+    # -----------------------------
+    # Reading
+    # -----------------------------
+    def replay(self) -> dict:
+        """
+        State of the current cycle:
+          urls     every URL accepted so far
+          pages    {source: {(query, page): URLs found on the page}}
+          sources  {source: last status}
+          runs     runs started in this cycle
+        """
+        state = {"urls": set(), "pages": {}, "sources": {}, "runs": 0}
+
+        if not os.path.exists(self.path):
+            return state
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue    # torn write from a crash
+
+                kind = rec.get("t")
+                if kind == "page":
+                    state["urls"].update(rec.get("urls", []))
+                    state["pages"].setdefault(rec["source"], {})[(rec["query"], rec["page"])] = rec.get("found", 0)
+                elif kind == "source_end":
+                    state["sources"][rec["source"]] = rec.get("status")
+                elif kind == "run_start":
+                    state["runs"] += 1
+
+        return state
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -1,19 +1,213 @@
+import os
+import json
 import time
+import random
+import threading
 from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+
+def host_of(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
 
 class RateLimiter:
-    def __init__(self, delay_seconds, cooldown_hours):
+    """
+    Adaptive per-host politeness. wait(host) blocks until that host's next
+    slot, so sources on different hosts never wait on each other.
+
+    Each host's delay is AIMD-tuned from record(): a run of healthy
+    responses shaves `speedup_step` seconds off, while a 429 / 5xx / slow
+    response multiplies it by `backoff`. Retry-After is honoured as-is.
+    block(host) starts a cooldown for that host only (CAPTCHA). Delays and
+    cooldowns are persisted to `state_path` so a restart neither forgets
+    a ban nor starts again from the slow default.
+    """
+
+    def __init__(self, delay_seconds, cooldown_hours, host_delays=None, jitter=0.2,
+                 min_delay=0.3, max_delay=120.0, backoff=2.0, speedup_step=0.1,
+                 speedup_after=5, slow_seconds=5.0, state_path=None):
         self.delay = delay_seconds
         self.cooldown = timedelta(hours=cooldown_hours)
-        self.blocked_until = None
+        self.host_delays = dict(host_delays or {})
+        self.jitter = jitter
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.speedup_step = speedup_step
+        self.speedup_after = speedup_after
+        self.slow_seconds = slow_seconds
+        self.state_path = state_path
+
+        self._lock = threading.Lock()
+        self._next_slot = {}        # host -> time.monotonic() of next request
+        self._hosts = {}            # host -> {"delay", "blocked_until" (epoch), "healthy"}
+        self._last_save = 0.0
+
+        self._load()
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[RATE] Ignoring unreadable {self.state_path} — {e}")
+            return
+
+        for host, st in saved.items():
+            self._hosts[host] = {
+                "delay": min(max(float(st.get("delay", self.delay_for(host))), self.min_delay), self.max_delay),
+                "blocked_until": st.get("blocked_until"),
+                "healthy": 0
+            }
+
+    def _save(self, force=False):
+        # caller holds the lock
+        if not self.state_path:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_save < 30:
+            return
+        self._last_save = now
+
+        state = {
+            host: {"delay": round(st["delay"], 3), "blocked_until": st["blocked_until"]}
+            for host, st in self._hosts.items()
+        }
+        tmp = self.state_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            print(f"[RATE] Could not save rate limit state — {e}")
+
+    # -----------------------------
+    # Pacing
+    # -----------------------------
+    def _host(self, host):
+        # caller holds the lock
+        st = self._hosts.get(host)
+        if st is None:
+            st = self._hosts[host] = {
+                "delay": self.host_delays.get(host, self.delay),
+                "blocked_until": None,
+                "healthy": 0
+            }
+        return st
+
+    def delay_for(self, host) -> float:
+        st = self._hosts.get(host)
+        return st["delay"] if st else self.host_delays.get(host, self.delay)
+
+    def wait(self, host):
+        """
+        Reserve the next request slot for `host` and sleep until it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot.get(host, now), now)
+            delay = self._host(host)["delay"]
+            self._next_slot[host] = slot + delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+        if slot > now:
+            time.sleep(slot - now)
+
+    def record(self, host, status_code=None, elapsed=None, retry_after=None):
+        """
+        Feed back one response (status_code None = connection error /
+        timeout) and adapt the host's delay.
+        """
+        slow = elapsed is not None and elapsed > self.slow_seconds
+        throttled = status_code is None or status_code == 429 or status_code >= 500
+
+        with self._lock:
+            st = self._host(host)
+
+            if throttled or slow:
+                old = st["delay"]
+                st["delay"] = min(st["delay"] * self.backoff, self.max_delay)
+                st["healthy"] = 0
+
+                pause = _parse_retry_after(retry_after)
+                if pause:
+                    self._next_slot[host] = max(self._next_slot.get(host, 0), time.monotonic() + pause)
+
+                reason = f"HTTP {status_code}" if status_code else "no response"
+                if slow and not throttled:
+                    reason = f"slow response ({elapsed:.1f}s)"
+                print(f"[RATE] {host}: {reason}, delay {old:.2f}s → {st['delay']:.2f}s"
+                      + (f", Retry-After {pause:.1f}s" if pause else ""))
+                self._save(force=True)
+
+            elif status_code < 400:
+                st["healthy"] += 1
+                if st["healthy"] >= self.speedup_after:
+                    st["healthy"] = 0
+                    st["delay"] = max(st["delay"] - self.speedup_step, self.min_delay)
+                    self._save()
+
+    # -----------------------------
+    # Cooldowns
+    # -----------------------------
+    def block(self, host):
+        """
+        CAPTCHA / ban: cool the host down and slow it for when it resumes.
+        """
+        with self._lock:
+            st = self._host(host)
+            st["blocked_until"] = (datetime.now() + self.cooldown).timestamp()
+            st["delay"] = min(st["delay"] * self.backoff, self.max_delay)
+            st["healthy"] = 0
+            self._save(force=True)
+
+    def is_blocked(self, host) -> bool:
+        until = self.blocked_until(host)
+        return until is not None and datetime.now() < until
+
+    def blocked_until(self, host):
+        with self._lock:
+            st = self._hosts.get(host)
+            until = st["blocked_until"] if st else None
+        return datetime.fromtimestamp(until) if until else None
+
+    def flush(self):
+        with self._lock:
+            self._save(force=True)
 
-    def wait(self):
-        time.sleep(self.delay)
+    def stats(self) -> dict:
+        with self._lock:
+            now = datetime.now().timestamp()
+            return {
+                host: {
+                    "delay_seconds": round(st["delay"], 3),
+                    "blocked_until": (
+                        datetime.fromtimestamp(st["blocked_until"]).isoformat(timespec="seconds")
+                        if st["blocked_until"] and st["blocked_until"] > now else None
+                    )
+                }
+                for host, st in self._hosts.items()
+            }
 
-    def block(self):
-        self.blocked_until = datetime.now() + self.cooldown
 
-    def is_blocked(self):
-        if not self.blocked_until:
-            return False
-        return datetime.now() < self.blocked_until
+def _parse_retry_after(value):
+    """
+    Seconds from a Retry-After header (delta-seconds or HTTP date).
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max((parsedate_to_datetime(value) - datetime.now().astimezone()).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
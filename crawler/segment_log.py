@@ -0,0 +1,270 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import numpy as np
+
+# -----------------------------
+# Append-only crawl output
+# -----------------------------
+# Crawled URLs are appended to JSONL segments instead of rewriting
+# metadata.json per batch:
+#
+#   <dir>/seg-00000001.jsonl    {"url", "source"} per line, oldest first
+#   <dir>/url_hashes.bin        uint64 hash of every URL ever accepted
+#
+# The hash file is the dedup index. It is loaded once into a set and
+# then only appended to, so accepting a batch costs O(batch). Background
+# compaction folds closed segments into metadata.json, which stays the
+# indexer's input format. Compaction only appends to metadata.json, so
+# row order (and the legacy snapshot prefix) never changes.
+# read_crawl_entries() gives metadata.json + any segments not yet
+# compacted, so nothing waits on compaction to become indexable.
+
+SEGMENT_RE = re.compile(r"^seg-(\d{8})\.jsonl$")
+HASHES_NAME = "url_hashes.bin"
+
+
+def url_hash(url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _segment_name(seq: int) -> str:
+    return f"seg-{seq:08d}.jsonl"
+
+
+def list_segments(segment_dir: str) -> list:
+    """
+    (seq, path) of every segment on disk, oldest first.
+    """
+    if not os.path.isdir(segment_dir):
+        return []
+    found = []
+    for name in os.listdir(segment_dir):
+        m = SEGMENT_RE.match(name)
+        if m:
+            found.append((int(m.group(1)), os.path.join(segment_dir, name)))
+    return sorted(found)
+
+
+def _read_lines(f):
+    for line in f:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue    # torn last line from a crash
+
+
+def _read_segment(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from _read_lines(f)
+    except FileNotFoundError:
+        return              # compacted while we were reading
+
+
+def read_crawl_entries(metadata_path: str, segment_dir: str) -> list:
+    """
+    Every crawled entry: metadata.json first, then un-compacted segments.
+    Segments are opened before metadata.json is read. Compaction
+    rewrites metadata.json before deleting segments, so a segment that
+    is already gone is in the metadata.json read after it, and an open
+    one stays readable after deletion: a concurrent compaction can only
+    cause duplicates, never gaps.
+    """
+    handles = []
+    try:
+        for _, path in list_segments(segment_dir):
+            try:
+                handles.append(open(path, "r", encoding="utf-8"))
+            except FileNotFoundError:
+                continue
+
+        entries = []
+        if os.path.exists(metadata_path):
+            with open(metadata_path, "r") as f:
+                entries = json.load(f)
+
+        for f in handles:
+            entries.extend(_read_lines(f))
+        return entries
+    finally:
+        for f in handles:
+            f.close()
+
+
+class SegmentLog:
+    def __init__(self, segment_dir: str, metadata_path: str,
+                 max_records: int = 5000, compact_every: int = 4):
+        self.dir = segment_dir
+        self.metadata_path = metadata_path
+        self.max_records = max_records
+        self.compact_every = compact_every
+
+        self._lock = threading.Lock()           # appends + segment roll
+        self._compact_lock = threading.Lock()   # one compaction at a time
+        self._compactor = None
+
+        os.makedirs(self.dir, exist_ok=True)
+        self._hashes = set()
+        self._hash_file = None
+        self._open_hashes()
+
+        segments = list_segments(self.dir)
+        self._seq = segments[-1][0] + 1 if segments else 1
+        self._active = None
+        self._active_records = 0
+
+    # -----------------------------
+    # Dedup index
+    # -----------------------------
+    def _open_hashes(self):
+        path = os.path.join(self.dir, HASHES_NAME)
+        fresh = not os.path.exists(path)
+
+        if not fresh:
+            size = os.path.getsize(path)
+            if size % 8:
+                # torn append: drop the partial hash
+                with open(path, "r+b") as f:
+                    f.truncate(size - size % 8)
+            self._hashes = set(np.fromfile(path, dtype="<u8").tolist())
+
+        self._hash_file = open(path, "ab")
+
+        # Bootstrap from metadata.json once; re-add hashes of segment
+        # lines whose hash append was lost in a crash
+        missing = []
+        if fresh and os.path.exists(self.metadata_path):
+            with open(self.metadata_path, "r") as f:
+                missing.extend(e["url"] for e in json.load(f) if e.get("url"))
+        for _, path in list_segments(self.dir):
+            missing.extend(e["url"] for e in _read_segment(path) if e.get("url"))
+
+        new = {url_hash(u) for u in missing} - self._hashes
+        if new:
+            self._write_hashes(new)
+            print(f"[CRAWL LOG] Dedup index rebuilt with {len(new)} URL hashes")
+
+    def _write_hashes(self, hashes):
+        self._hashes.update(hashes)
+        self._hash_file.write(np.fromiter(hashes, dtype="<u8", count=len(hashes)).tobytes())
+        self._hash_file.flush()
+        os.fsync(self._hash_file.fileno())
+
+    def __contains__(self, url) -> bool:
+        return url_hash(url) in self._hashes
+
+    def __len__(self):
+        return len(self._hashes)
+
+    # -----------------------------
+    # Appending
+    # -----------------------------
+    def _roll(self):
+        # caller holds the lock
+        if self._active is not None:
+            self._active.close()
+            self._active = None
+            self._seq += 1
+        self._active_records = 0
+
+    def append(self, urls, source=None) -> list:
+        """
+        Append the URLs not seen before. Returns the ones added.
+        Costs O(len(urls)) regardless of corpus size.
+        """
+        with self._lock:
+            added, hashes = [], set()
+            for url in urls:
+                h = url_hash(url)
+                if h in self._hashes or h in hashes:
+                    continue
+                hashes.add(h)
+                added.append(url)
+
+            if not added:
+                return added
+
+            if self._active is None:
+                self._active = open(os.path.join(self.dir, _segment_name(self._seq)), "a", encoding="utf-8")
+
+            # segment line first: a crash before the hash append is
+            # repaired on the next open, never the other way round
+            self._active.write("".join(
+                json.dumps({"url": u, "source": source}) + "\n" for u in added
+            ))
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._write_hashes(hashes)
+
+            self._active_records += len(added)
+            if self._active_records >= self.max_records:
+                self._roll()
+                closed = len(list_segments(self.dir))
+                if closed >= self.compact_every:
+                    self.compact_async()
+
+        return added
+
+    # -----------------------------
+    # Compaction
+    # -----------------------------
+    def compact(self, include_active: bool = True) -> int:
+        """
+        Fold closed segments (and the active one, by rolling it first)
+        into metadata.json, then delete them. Returns rows appended.
+        """
+        with self._compact_lock:
+            with self._lock:
+                if include_active:
+                    self._roll()
+                active_seq = self._seq if self._active is not None else None
+                segments = [(s, p) for s, p in list_segments(self.dir) if s != active_seq]
+
+            if not segments:
+                return 0
+
+            existing = []
+            if os.path.exists(self.metadata_path):
+                with open(self.metadata_path, "r") as f:
+                    existing = json.load(f)
+
+            # dedup against metadata.json too, so a compaction interrupted
+            # after the rewrite but before deleting segments is harmless
+            existing_urls = {e["url"] for e in existing}
+            added = 0
+            for _, path in segments:
+                for e in _read_segment(path):
+                    if e.get("url") and e["url"] not in existing_urls:
+                        existing.append(e)
+                        existing_urls.add(e["url"])
+                        added += 1
+
+            tmp = self.metadata_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(existing, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.metadata_path)
+
+            for _, path in segments:
+                os.remove(path)
+
+        print(f"[CRAWL LOG] 📦 Compacted {len(segments)} segment(s) — {added} new URLs in metadata.json")
+        return added
+
+    def compact_async(self, include_active: bool = False):
+        if self._compactor is not None and self._compactor.is_alive():
+            return self._compactor
+
+        def run():
+            try:
+                self.compact(include_active=include_active)
+            except Exception as e:
+                print(f"[CRAWL LOG] Compaction failed — {e}")
+
+        self._compactor = threading.Thread(target=run, daemon=True)
+        self._compactor.start()
+        return self._compactor
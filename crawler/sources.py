@@ -1,8 +1,8 @@
-import requests
 import time
-import random
+import requests
 from bs4 import BeautifulSoup
 from crawler.captcha_detector import is_captcha_page
+from crawler.rate_limiter import host_of
 
 HEADERS = {
     "User-Agent": (
@@ -20,12 +20,41 @@ FACE_QUERIES = [
     "human face candid portrait"
 ]
 
+
+# Every crawl_* function takes:
+#   limiter   RateLimiter to pace requests per host
+#   done      {(query, page): URLs found} of pages finished in an earlier
+#             run, which are skipped (see crawler/journal.py)
+#   on_page   on_page(query, page, urls) after each fetched page
+
+
+def _get(limiter, url, **kwargs):
+    """
+    requests.get after waiting for the URL's host slot on `limiter`.
+    The outcome is fed back so the limiter can adapt that host's pace.
+    """
+    if limiter is None:
+        return requests.get(url, **kwargs)
+
+    host = host_of(url)
+    limiter.wait(host)
+
+    start = time.perf_counter()
+    try:
+        r = requests.get(url, **kwargs)
+    except requests.RequestException:
+        limiter.record(host, None, time.perf_counter() - start)
+        raise
+
+    limiter.record(host, r.status_code, time.perf_counter() - start, r.headers.get("Retry-After"))
+    return r
+
 # --------------------------------------------------
 # YAHOO IMAGE SOURCE (KEYWORD-BASED)
 # --------------------------------------------------
 from config import YAHOO_MAX_PAGES
 
-def crawl_yahoo_images():
+def crawl_yahoo_images(limiter=None, done=None, on_page=None):
     collected = []
     captcha = False
 
@@ -33,6 +62,12 @@ def crawl_yahoo_images():
         query_encoded = query.replace(" ", "+")
 
         for page in range(YAHOO_MAX_PAGES):
+            found = done.get((query, page)) if done else None
+            if found is not None:
+                if found == 0:
+                    break   # this query ran out of results last run
+                continue    # page already journaled
+
             start = page * 20
 
             url = (
@@ -41,7 +76,7 @@ def crawl_yahoo_images():
             )
 
             try:
-                r = requests.get(url, headers=HEADERS, timeout=10)
+                r = _get(limiter, url, headers=HEADERS, timeout=10)
 
                 if r.status_code != 200:
                     continue
@@ -53,6 +88,7 @@ def crawl_yahoo_images():
                 soup = BeautifulSoup(r.text, "html.parser")
                 imgs = soup.find_all("img")
 
+                page_start = len(collected)
                 page_urls = 0
                 for img in imgs:
                     src = img.get("src") or img.get("data-src")
@@ -68,14 +104,15 @@ def crawl_yahoo_images():
 
                 print(f"[YAHOO] {query} | Page {page+1}: {page_urls}")
 
+                if on_page:
+                    on_page(query, page, collected[page_start:])
+
                 if page_urls == 0:
                     break
 
             except Exception:
                 continue
 
-            time.sleep(random.uniform(0.8, 1.5))
-
     return {"urls": collected, "captcha": False}
 
 # --------------------------------------------------
@@ -83,7 +120,7 @@ def crawl_yahoo_images():
 # --------------------------------------------------
 from config import FLICKR_MAX_PAGES
 
-def crawl_flickr_images():
+def crawl_flickr_images(limiter=None, done=None, on_page=None):
     collected = []
     captcha = False
 
@@ -91,10 +128,16 @@ def crawl_flickr_images():
         query_encoded = query.replace(" ", "+")
 
         for page in range(1, FLICKR_MAX_PAGES + 1):
+            found = done.get((query, page)) if done else None
+            if found is not None:
+                if found == 0:
+                    break   # this query ran out of results last run
+                continue    # page already journaled
+
             url = f"https://www.flickr.com/search/?text={query_encoded}&page={page}"
 
             try:
-                r = requests.get(url, headers=HEADERS, timeout=10)
+                r = _get(limiter, url, headers=HEADERS, timeout=10)
 
                 if r.status_code != 200:
                     continue
@@ -106,6 +149,7 @@ def crawl_flickr_images():
                 soup = BeautifulSoup(r.text, "html.parser")
                 imgs = soup.find_all("img")
 
+                page_start = len(collected)
                 page_urls = 0
                 for img in imgs:
                     src = img.get("src")
@@ -121,14 +165,15 @@ def crawl_flickr_images():
 
                 print(f"[FLICKR] {query} | Page {page}: {page_urls}")
 
+                if on_page:
+                    on_page(query, page, collected[page_start:])
+
                 if page_urls == 0:
                     break
 
             except Exception:
                 continue
 
-            time.sleep(random.uniform(1.0, 1.8))
-
     return {"urls": collected, "captcha": False}
 
 # --------------------------------------------------
@@ -136,7 +181,7 @@ def crawl_flickr_images():
 # --------------------------------------------------
 from config import WIKIMEDIA_MAX_PAGES
 
-def crawl_wikimedia_images():
+def crawl_wikimedia_images(limiter=None, done=None, on_page=None):
     collected = []
     captcha = False
 
@@ -144,6 +189,12 @@ def crawl_wikimedia_images():
         query_encoded = query.replace(" ", "+")
 
         for page in range(1, WIKIMEDIA_MAX_PAGES + 1):
+            found = done.get((query, page)) if done else None
+            if found is not None:
+                if found == 0:
+                    break   # this query ran out of results last run
+                continue    # page already journaled
+
             url = (
                 "https://commons.wikimedia.org/w/index.php"
                 f"?search={query_encoded}"
@@ -154,7 +205,7 @@ def crawl_wikimedia_images():
             )
 
             try:
-                r = requests.get(url, headers=HEADERS, timeout=10)
+                r = _get(limiter, url, headers=HEADERS, timeout=10)
 
                 if r.status_code != 200:
                     continue
@@ -162,6 +213,7 @@ def crawl_wikimedia_images():
                 soup = BeautifulSoup(r.text, "html.parser")
                 imgs = soup.find_all("img")
 
+                page_start = len(collected)
                 page_urls = 0
                 for img in imgs:
                     src = img.get("src")
@@ -173,14 +225,15 @@ def crawl_wikimedia_images():
 
                 print(f"[WIKIMEDIA] {query} | Page {page}: {page_urls}")
 
+                if on_page:
+                    on_page(query, page, collected[page_start:])
+
                 if page_urls == 0:
                     break
 
             except Exception:
                 continue
 
-            time.sleep(1.2)
-
     return {"urls": collected, "captcha": False}
 
 # --------------------------------------------------
@@ -188,7 +241,7 @@ def crawl_wikimedia_images():
 # --------------------------------------------------
 from config import PEXELS_API_KEY, PEXELS_MAX_PAGES
 
-def crawl_pexels_images():
+def crawl_pexels_images(limiter=None, done=None, on_page=None):
     collected = []
     captcha = False
 
@@ -197,6 +250,12 @@ def crawl_pexels_images():
 
     for query in FACE_QUERIES:
         for page in range(1, PEXELS_MAX_PAGES + 1):
+            found = done.get((query, page)) if done else None
+            if found is not None:
+                if found == 0:
+                    break   # this query ran out of results last run
+                continue    # page already journaled
+
             url = (
                 "https://api.pexels.com/v1/search"
                 f"?query={query}"
@@ -205,11 +264,12 @@ def crawl_pexels_images():
             )
 
             try:
-                r = requests.get(url, headers=headers, timeout=10)
+                r = _get(limiter, url, headers=headers, timeout=10)
                 if r.status_code != 200:
                     continue
 
                 photos = r.json().get("photos", [])
+                page_start = len(collected)
                 page_urls = 0
 
                 for photo in photos:
@@ -220,14 +280,15 @@ def crawl_pexels_images():
 
                 print(f"[PEXELS] {query} | Page {page}: {page_urls}")
 
+                if on_page:
+                    on_page(query, page, collected[page_start:])
+
                 if page_urls == 0:
                     break
 
             except Exception:
                 continue
 
-            time.sleep(0.7)
-
     return {"urls": collected, "captcha": False}
 
 # --------------------------------------------------
@@ -235,7 +296,7 @@ def crawl_pexels_images():
 # --------------------------------------------------
 from config import UNSPLASH_MAX_PAGES, SERPAPI_API_KEY
 
-def crawl_unsplash_images():
+def crawl_unsplash_images(limiter=None, done=None, on_page=None):
     collected = []
 
     if not SERPAPI_API_KEY:
@@ -244,6 +305,12 @@ def crawl_unsplash_images():
 
     for query in FACE_QUERIES:
         for page in range(UNSPLASH_MAX_PAGES):
+            found = done.get((query, page)) if done else None
+            if found is not None:
+                if found == 0:
+                    break   # this query ran out of results last run
+                continue    # page already journaled
+
             params = {
                 "engine": "google_images",
                 "q": f"{query} site:unsplash.com",
@@ -252,11 +319,12 @@ def crawl_unsplash_images():
             }
 
             try:
-                r = requests.get("https://serpapi.com/search.json", params=params, timeout=15)
+                r = _get(limiter, "https://serpapi.com/search.json", params=params, timeout=15)
                 r.raise_for_status()
                 data = r.json()
 
                 images = data.get("images_results", [])
+                page_start = len(collected)
                 page_urls = 0
 
                 for img in images:
@@ -267,6 +335,9 @@ def crawl_unsplash_images():
 
                 print(f"[UNSPLASH] {query} | Page {page+1}: {page_urls}")
 
+                if on_page:
+                    on_page(query, page, collected[page_start:])
+
                 if page_urls == 0:
                     break
 
@@ -274,6 +345,4 @@ def crawl_unsplash_images():
                 print(f"[UNSPLASH] Error: {e}")
                 continue
 
-            time.sleep(1.0)
-
     return {"urls": collected, "captcha": False}
\ No newline at end of file
@@ -0,0 +1,205 @@
+import math
+import numpy as np
+import faiss
+
+from config import (
+    FAISS_INDEX_TYPE,
+    FAISS_HNSW_M,
+    FAISS_HNSW_EF_CONSTRUCTION,
+    FAISS_HNSW_EF_SEARCH,
+    FAISS_IVF_NLIST,
+    FAISS_IVF_NPROBE,
+    FAISS_PQ_M,
+    FAISS_PQ_NBITS,
+    FAISS_TRAIN_SAMPLE,
+    FAISS_STORAGE,
+    FAISS_RERANK_FACTOR
+)
+
+# -----------------------------
+# Vector index factory
+# -----------------------------
+# All index types use inner product on L2-normalized vectors, i.e.
+# cosine similarity, so scores stay comparable with the flat index.
+#
+# flat, hnsw and ivf_flat can hold their vectors as float16 or 8-bit
+# scalar-quantized codes instead of float32 (2x / 4x less memory).
+# Searches on those fetch extra candidates and re-score them exactly
+# against the snapshot's float32 face_embeddings.npy, memory-mapped so
+# only the candidate rows are read.
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+STORAGE_TYPES = ("float32", "float16", "sq8")
+
+_SQ_TYPES = {
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+# faiss wants ~39 training points per IVF centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def _auto_nlist(n: int) -> int:
+    nlist = FAISS_IVF_NLIST or int(4 * math.sqrt(max(n, 1)))
+    return max(1, min(nlist, n // MIN_POINTS_PER_CENTROID))
+
+
+def _train_sample(embeddings: np.ndarray) -> np.ndarray:
+    if len(embeddings) <= FAISS_TRAIN_SAMPLE:
+        return embeddings
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(embeddings), size=FAISS_TRAIN_SAMPLE, replace=False)
+    return embeddings[np.sort(picks)]
+
+
+def create_index(index_type: str, dim: int, n: int, storage: str = None, **params):
+    """
+    Empty (untrained) index of the given type, sized for n vectors.
+    storage (float32 | float16 | sq8, default FAISS_STORAGE) applies to
+    flat, hnsw and ivf_flat; ivf_pq always stores PQ codes.
+    params override the FAISS_* settings: m, ef_construction, nlist,
+    pq_m, pq_nbits.
+    """
+    storage = storage or FAISS_STORAGE
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Unknown FAISS storage '{storage}' (expected one of {STORAGE_TYPES})")
+    qtype = _SQ_TYPES.get(storage)
+
+    if index_type == "flat":
+        if qtype is None:
+            return faiss.IndexFlatIP(dim)
+        return faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT)
+
+    if index_type == "hnsw":
+        m = params.get("m", FAISS_HNSW_M)
+        if qtype is None:
+            index = faiss.IndexHNSWFlat(dim, m, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexHNSWSQ(dim, qtype, m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params.get("ef_construction", FAISS_HNSW_EF_CONSTRUCTION)
+        return index
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = params.get("nlist") or _auto_nlist(n)
+        quantizer = faiss.IndexFlatIP(dim)
+
+        if index_type == "ivf_flat":
+            if qtype is None:
+                return faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            return faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, qtype, faiss.METRIC_INNER_PRODUCT)
+
+        pq_m = params.get("pq_m", FAISS_PQ_M)
+        if dim % pq_m:
+            raise ValueError(f"FAISS_PQ_M ({pq_m}) must divide the embedding size ({dim})")
+        return faiss.IndexIVFPQ(
+            quantizer, dim, nlist, pq_m, params.get("pq_nbits", FAISS_PQ_NBITS), faiss.METRIC_INNER_PRODUCT
+        )
+
+    raise ValueError(f"Unknown FAISS index type '{index_type}' (expected one of {INDEX_TYPES})")
+
+
+def _min_training_points(index_type: str, params: dict) -> int:
+    if index_type == "ivf_flat":
+        return MIN_POINTS_PER_CENTROID
+    if index_type == "ivf_pq":
+        # every PQ sub-quantizer runs k-means with 2^nbits centroids
+        return max(MIN_POINTS_PER_CENTROID, 1 << params.get("pq_nbits", FAISS_PQ_NBITS))
+    return 0
+
+
+def build_index(embeddings: np.ndarray, index_type: str = None, storage: str = None, **params):
+    """
+    Create, train (if needed) and fill an index with normalized embeddings.
+    Falls back to a flat index when there is too little data to train.
+    """
+    index_type = index_type or FAISS_INDEX_TYPE
+    n, dim = embeddings.shape
+
+    if n < _min_training_points(index_type, params):
+        print(f"[INDEXER] Only {n} vectors — too few to train {index_type}, using flat index")
+        index_type = "flat"
+
+    index = create_index(index_type, dim, n, storage=storage, **params)
+
+    if not index.is_trained:
+        print(f"[INDEXER] Training {index_type} index")
+        index.train(_train_sample(embeddings))
+
+    index.add(embeddings)
+    return index
+
+
+def index_type_of(index) -> str:
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def storage_of(index) -> str:
+    """
+    How the index holds its vectors: float32, float16, sq8 or pq.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "pq"
+
+    sq = getattr(index, "sq", None)
+    if sq is not None:
+        for name, qtype in _SQ_TYPES.items():
+            if sq.qtype == qtype:
+                return name
+        return "sq"
+    return "float32"
+
+
+def search_reranked(index, vectors, queries: np.ndarray, k: int, factor: int = None, storage: str = None):
+    """
+    index.search(), with exact float32 re-ranking when the index holds
+    reduced-precision codes: k * factor candidates are fetched and
+    re-scored against `vectors` (the float32 embeddings, usually a
+    memmap). Returns (scores, ids) like index.search().
+    """
+    factor = FAISS_RERANK_FACTOR if factor is None else factor
+    storage = storage or storage_of(index)
+
+    if storage == "float32" or not factor or vectors is None or len(vectors) != index.ntotal:
+        return index.search(queries, k)
+
+    _, candidates = index.search(queries, k * factor)
+
+    scores = np.full((len(queries), k), -np.inf, dtype="float32")
+    ids = np.full((len(queries), k), -1, dtype="int64")
+    for i, (q, rows) in enumerate(zip(queries, candidates)):
+        # sorted rows read the memmap front to back
+        rows = np.sort(rows[rows >= 0])
+        if not len(rows):
+            continue
+        exact = np.asarray(vectors[rows], dtype="float32") @ q
+        top = np.argsort(-exact, kind="stable")[:k]
+        scores[i, :len(top)] = exact[top]
+        ids[i, :len(top)] = rows[top]
+
+    return scores, ids
+
+
+def configure_search(index, nprobe: int = None, ef_search: int = None):
+    """
+    Apply query-time knobs (FAISS_IVF_NPROBE / FAISS_HNSW_EF_SEARCH by
+    default). No-op for index types the knob does not apply to.
+    """
+    index = faiss.downcast_index(index)
+
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(nprobe or FAISS_IVF_NPROBE, index.nlist)
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or FAISS_HNSW_EF_SEARCH
+
+    return index
@@ -0,0 +1,323 @@
+import threading
+import numpy as np
+import cv2
+
+from config import (
+    EMBEDDING_BACKEND,
+    ONNX_MODEL_PATH,
+    ONNX_BATCH_SIZE,
+    ONNX_INTRA_OP_THREADS,
+    ONNX_INTER_OP_THREADS,
+    ONNX_DETECTOR,
+    ONNX_DETECTOR_MODEL_PATH
+)
+
+# -----------------------------
+# Embedding backends
+# -----------------------------
+# Face detection + embedding sit behind one small interface, so the
+# indexer, the query path and the legacy embedder do not care what runs
+# the model:
+#
+#   detect(img)     -> [{"face": aligned BGR uint8 crop, "facial_area", "confidence"}]
+#   quick_detect(img) -> same, from the backend's cheap detector, unaligned
+#                      (OpenCV Haar via DeepFace, or YuNet)
+#   embed(crops)    -> (n, dim) float32, one row per crop, not normalized
+#   represent(img, quick=False)
+#                   -> [{"embedding", "facial_area", "face_confidence"}]
+#                      every face of an image, as DeepFace.represent returns
+#
+# "deepface" (default) is the original TensorFlow path. "onnx" runs
+# Facenet512 exported to ONNX under ONNX Runtime: crops are embedded in
+# batches of ONNX_BATCH_SIZE, with configurable intra- / inter-op
+# threads, and TensorFlow is only imported if the detector needs it.
+#
+# Vectors are only comparable within one model: an index built with one
+# backend must be queried with the same model (see the snapshot
+# manifest's "backend" / "model"). The detector matters too: RetinaFace
+# and YuNet crop differently, which shifts the vectors.
+
+MODEL_NAME = "Facenet512"
+DETECTOR_BACKEND = "retinaface"
+QUICK_DETECTOR_BACKEND = "opencv"    # Haar cascade: pre-filter, legacy embedder
+
+
+def _deepface():
+    # imported on first use: loading DeepFace pulls in TensorFlow
+    from deepface import DeepFace
+    return DeepFace
+
+
+def _to_bgr_uint8(face):
+    """
+    extract_faces returns RGB floats in [0, 1]; the models expect the
+    same BGR uint8 layout as an image read by OpenCV.
+    """
+    face = np.asarray(face)
+    if face.dtype != np.uint8:
+        face = np.clip(face * 255.0 if face.max() <= 1.0 else face, 0, 255).astype(np.uint8)
+    return np.ascontiguousarray(face[:, :, ::-1])
+
+
+def _retinaface_detect(img) -> list:
+    return _deepface_detect(img, DETECTOR_BACKEND, align=True)
+
+
+def _opencv_detect(img) -> list:
+    return _deepface_detect(img, QUICK_DETECTOR_BACKEND, align=False)
+
+
+def _deepface_detect(img, detector_backend: str, align: bool) -> list:
+    faces = _deepface().extract_faces(
+        img_path=img,
+        detector_backend=detector_backend,
+        enforce_detection=False,
+        align=align
+    )
+
+    # enforce_detection=False returns the whole frame with confidence 0
+    # when nothing was found
+    return [
+        {
+            "face": _to_bgr_uint8(f["face"]),
+            "facial_area": f.get("facial_area"),
+            "confidence": float(f.get("confidence", 1)),
+        }
+        for f in faces if f.get("confidence", 1) > 0
+    ]
+
+
+class DeepFaceBackend:
+    name = "deepface"
+
+    def __init__(self, model_name: str = MODEL_NAME, detector_backend: str = DETECTOR_BACKEND):
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+
+    def detect(self, img) -> list:
+        return _retinaface_detect(img)
+
+    def quick_detect(self, img) -> list:
+        return _opencv_detect(img)
+
+    def embed(self, crops: list) -> np.ndarray:
+        if not crops:
+            return np.zeros((0, 0), dtype="float32")
+        # DeepFace embeds one image per call
+        rows = [
+            _deepface().represent(
+                img_path=crop,
+                model_name=self.model_name,
+                detector_backend="skip",
+                enforce_detection=False
+            )[0]["embedding"]
+            for crop in crops
+        ]
+        return np.array(rows, dtype="float32").reshape(len(crops), -1)
+
+    def represent(self, img, quick: bool = False) -> list:
+        return _deepface().represent(
+            img_path=img,
+            model_name=self.model_name,
+            detector_backend=QUICK_DETECTOR_BACKEND if quick else self.detector_backend,
+            enforce_detection=False
+        ) or []
+
+    def warm_up(self):
+        _deepface().build_model(self.model_name)
+
+
+# -----------------------------
+# ONNX Runtime
+# -----------------------------
+class _YuNetDetector:
+    """
+    OpenCV's YuNet (an ONNX model run by cv2.dnn): no TensorFlow needed.
+    Faces are aligned by levelling the eyes, like DeepFace's align=True.
+    """
+
+    def __init__(self, model_path: str, score_threshold: float = 0.8):
+        self._detector = cv2.FaceDetectorYN.create(model_path, "", (320, 320), score_threshold)
+        self._lock = threading.Lock()   # the detector holds its input size
+
+    def __call__(self, img) -> list:
+        h, w = img.shape[:2]
+        with self._lock:
+            self._detector.setInputSize((w, h))
+            _, found = self._detector.detect(img)
+
+        faces = []
+        for row in found if found is not None else []:
+            x, y, fw, fh = (int(round(v)) for v in row[:4])
+            x, y = max(x, 0), max(y, 0)
+            fw, fh = min(fw, w - x), min(fh, h - y)
+            if fw <= 0 or fh <= 0:
+                continue
+
+            # YuNet landmarks: right eye, left eye (of the subject) first
+            right_eye, left_eye = row[4:6], row[6:8]
+            angle = np.degrees(np.arctan2(left_eye[1] - right_eye[1], left_eye[0] - right_eye[0]))
+            rotation = cv2.getRotationMatrix2D((x + fw / 2, y + fh / 2), angle, 1.0)
+            aligned = cv2.warpAffine(img, rotation, (w, h))
+
+            faces.append({
+                "face": np.ascontiguousarray(aligned[y:y + fh, x:x + fw]),
+                "facial_area": {
+                    "x": x, "y": y, "w": fw, "h": fh,
+                    "left_eye": tuple(int(v) for v in left_eye),
+                    "right_eye": tuple(int(v) for v in right_eye),
+                },
+                "confidence": float(row[-1]),
+            })
+        return faces
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(
+        self,
+        model_path: str = ONNX_MODEL_PATH,
+        batch_size: int = ONNX_BATCH_SIZE,
+        intra_op_threads: int = ONNX_INTRA_OP_THREADS,
+        inter_op_threads: int = ONNX_INTER_OP_THREADS,
+        detector: str = ONNX_DETECTOR,
+        detector_model_path: str = ONNX_DETECTOR_MODEL_PATH,
+        model_name: str = MODEL_NAME
+    ):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("EMBEDDING_BACKEND = 'onnx' needs the onnxruntime package (pip install onnxruntime)")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 leaves the choice to ONNX Runtime (one thread per core)
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        if inter_op_threads > 1:
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.model_name = model_name
+        self.batch_size = max(batch_size, 1)
+
+        model_input = self.session.get_inputs()[0]
+        self._input_name = model_input.name
+        shape = list(model_input.shape)
+        # Keras exports are NHWC (1, 160, 160, 3); PyTorch ones NCHW
+        self._channels_first = shape[1] == 3
+        size = shape[2:4] if self._channels_first else shape[1:3]
+        self.input_size = tuple(s if isinstance(s, int) else 160 for s in size)
+        # a fixed batch dimension (often 1) is filled exactly, padding the last batch
+        self._fixed_batch = isinstance(shape[0], int)
+        if self._fixed_batch:
+            self.batch_size = shape[0]
+
+        if detector == "yunet":
+            # YuNet is cheap enough to be the quick check as well
+            self._detect = self._quick_detect = _YuNetDetector(detector_model_path)
+        elif detector == "retinaface":
+            self._detect = _retinaface_detect
+            self._quick_detect = _opencv_detect
+        else:
+            raise ValueError(f"Unknown ONNX_DETECTOR '{detector}' (retinaface | yunet)")
+        self.detector_backend = detector
+
+    def _preprocess(self, crop) -> np.ndarray:
+        """
+        Same input DeepFace builds for Facenet512: resize keeping the
+        aspect ratio, pad to the model size with black, RGB, [0, 1].
+        """
+        th, tw = self.input_size
+        h, w = crop.shape[:2]
+        scale = min(th / h, tw / w)
+        nh, nw = max(int(h * scale), 1), max(int(w * scale), 1)
+        resized = cv2.resize(crop, (nw, nh))
+
+        canvas = np.zeros((th, tw, 3), dtype=np.float32)
+        top, left = (th - nh) // 2, (tw - nw) // 2
+        canvas[top:top + nh, left:left + nw] = resized[:, :, ::-1] / 255.0
+        return canvas.transpose(2, 0, 1) if self._channels_first else canvas
+
+    def detect(self, img) -> list:
+        return self._detect(img)
+
+    def quick_detect(self, img) -> list:
+        return self._quick_detect(img)
+
+    def embed(self, crops: list) -> np.ndarray:
+        if not crops:
+            return np.zeros((0, 0), dtype="float32")
+        out = []
+        for start in range(0, len(crops), self.batch_size):
+            chunk = crops[start:start + self.batch_size]
+            batch = np.stack([self._preprocess(c) for c in chunk])
+            if self._fixed_batch and len(chunk) < self.batch_size:
+                batch = np.concatenate([batch, np.zeros((self.batch_size - len(chunk), *batch.shape[1:]), batch.dtype)])
+            out.append(self.session.run(None, {self._input_name: batch})[0][:len(chunk)])
+        return np.vstack(out).astype("float32").reshape(len(crops), -1)
+
+    def represent(self, img, quick: bool = False) -> list:
+        faces = self.quick_detect(img) if quick else self.detect(img)
+        if not faces:
+            return []
+        embeddings = self.embed([f["face"] for f in faces])
+        return [
+            {"embedding": emb, "facial_area": f["facial_area"], "face_confidence": f["confidence"]}
+            for emb, f in zip(embeddings, faces)
+        ]
+
+    def warm_up(self):
+        self.embed([np.zeros((*self.input_size, 3), dtype=np.uint8)])
+
+
+BACKENDS = {
+    "deepface": DeepFaceBackend,
+    "onnx": OnnxBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def describe() -> dict:
+    """
+    What produces the vectors, for snapshot manifests. Does not load
+    the model.
+    """
+    return {
+        "backend": EMBEDDING_BACKEND,
+        "model": MODEL_NAME,
+        "detector": ONNX_DETECTOR if EMBEDDING_BACKEND == "onnx" else DETECTOR_BACKEND,
+    }
+
+
+def mismatches(manifest: dict) -> dict:
+    """
+    {field: (index value, query value)} for every describe() field the
+    snapshot was built with differently. Manifests from before a field
+    was recorded are not flagged for it.
+    """
+    current = describe()
+    return {
+        field: (manifest[field], value)
+        for field, value in current.items()
+        if manifest.get(field) is not None and manifest[field] != value
+    }
+
+
+def get_backend():
+    """
+    The process-wide backend selected by EMBEDDING_BACKEND, created on
+    first use (each inference worker process builds its own).
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if EMBEDDING_BACKEND not in BACKENDS:
+                    raise ValueError(f"Unknown EMBEDDING_BACKEND '{EMBEDDING_BACKEND}' ({' | '.join(BACKENDS)})")
+                _backend = BACKENDS[EMBEDDING_BACKEND]()
+                print(f"[BACKEND] Embedding with {_backend.name} ({_backend.model_name}, detector {_backend.detector_backend})")
+    return _backend
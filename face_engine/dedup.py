@@ -0,0 +1,116 @@
+import threading
+
+from face_engine.phash_index import CHUNKS, CHUNK_BITS, CHUNK_MASK, _flip_masks, phash_to_int
+
+# -----------------------------
+# Near-duplicate grouping
+# -----------------------------
+# The same photo is often crawled under several URLs (Yahoo thumbnails,
+# Flickr size variants, Unsplash originals). During ingestion every
+# decoded image is assigned to a group by pHash: an image within
+# `threshold` bits of a group's first hash joins that group instead of
+# being embedded again. Group keys are kept in the same 4 x 16-bit chunk
+# tables as PHashIndex, so assigning costs a few dict probes regardless
+# of how many groups exist.
+#
+# A member larger than everything seen so far in its group is still
+# embedded, so the vector kept for the group comes from its best copy.
+# Images matching a row of the current index are not embedded at all
+# and become aliases of that row.
+
+NEW = "new"              # first image of a new group: embed
+UPGRADE = "upgrade"      # larger copy of an existing group: embed too
+MEMBER = "member"        # smaller / equal copy: alias only
+INDEXED = "indexed"      # copy of an already indexed row: alias only
+
+
+class PHashGroups:
+    def __init__(self, threshold: int, known_index=None, known_url=None):
+        """
+        known_index: PHashIndex of the current snapshot (optional)
+        known_url:   row -> URL for known_index rows
+        """
+        self.threshold = threshold
+        self.known_index = known_index
+        self.known_url = known_url
+
+        self._lock = threading.Lock()
+        self._masks = _flip_masks(threshold // CHUNKS).tolist()
+        self._tables = [{} for _ in range(CHUNKS)]
+        self._keys = []          # group id -> pHash code of its first member
+        self._best_area = []     # group id -> largest member area so far
+
+        self.members = []        # group id -> [url, ...] in arrival order
+        self.group_of = {}       # url -> group id
+        self.area = {}           # url -> pixel area
+        self.indexed_aliases = {}  # canonical indexed URL -> [alias urls]
+        self.upgrades = 0
+
+    def _find(self, code: int):
+        best, best_dist = None, None
+        for c in range(CHUNKS):
+            key = (code >> (c * CHUNK_BITS)) & CHUNK_MASK
+            table = self._tables[c]
+            for mask in self._masks:
+                for gid in table.get(key ^ mask, ()):
+                    dist = bin(self._keys[gid] ^ code).count("1")
+                    if dist <= self.threshold and (best_dist is None or dist < best_dist):
+                        best, best_dist = gid, dist
+        return best
+
+    def _add_group(self, code: int) -> int:
+        gid = len(self._keys)
+        self._keys.append(code)
+        self._best_area.append(0)
+        self.members.append([])
+        for c in range(CHUNKS):
+            key = (code >> (c * CHUNK_BITS)) & CHUNK_MASK
+            self._tables[c].setdefault(key, []).append(gid)
+        return gid
+
+    def assign(self, url: str, phash: str, area: int) -> str:
+        """
+        Put one decoded image in a group. Returns NEW, UPGRADE, MEMBER
+        or INDEXED; only NEW and UPGRADE images need embedding.
+        """
+        if self.known_index is not None:
+            hits = self.known_index.search(phash, self.threshold)
+            if hits:
+                canonical = self.known_url(hits[0][0])
+                with self._lock:
+                    self.indexed_aliases.setdefault(canonical, []).append(url)
+                return INDEXED
+
+        code = phash_to_int(phash)
+        with self._lock:
+            gid = self._find(code)
+            outcome = MEMBER
+            if gid is None:
+                gid = self._add_group(code)
+                outcome = NEW
+            elif area > self._best_area[gid]:
+                outcome = UPGRADE
+                self.upgrades += 1
+
+            self._best_area[gid] = max(self._best_area[gid], area)
+            self.members[gid].append(url)
+            self.group_of[url] = gid
+            self.area[url] = area
+        return outcome
+
+    def report(self, indexed: int, aliases: int) -> dict:
+        """
+        How much grouping shrank the corpus: `indexed` images were kept
+        with `aliases` URLs attached to them.
+        """
+        indexed_aliases = sum(len(v) for v in self.indexed_aliases.values())
+        without = indexed + aliases + indexed_aliases
+        return {
+            "groups": len(self.members),
+            "aliases": aliases,
+            "aliases_of_indexed": indexed_aliases,
+            "extra_embeddings": self.upgrades,
+            "embeddings_saved": aliases + indexed_aliases - self.upgrades,
+            "images_without_dedup": without,
+            "shrink_pct": round(100 * (without - indexed) / without, 1) if without else 0.0,
+        }
@@ -1,16 +1,20 @@
-from deepface import DeepFace
+import cv2
 
-def has_face(image_path: str) -> bool:
+from face_engine.backends import get_backend
+
+
+def has_face(img) -> bool:
     """
     Lightweight face check for crawled images.
     Optimized for low-resolution thumbnails.
+    `img` is an image path or a decoded BGR array.
+    Runs the backend's quick detector: OpenCV's Haar cascade, or YuNet
+    with the ONNX backend (no TensorFlow).
     """
-    try:
-        detections = DeepFace.extract_faces(
-            img_path=image_path,
-            detector_backend="opencv",  # IMPORTANT
-            enforce_detection=False
-        )
-        return len(detections) > 0
-    except Exception:
-        return False
+    if isinstance(img, str):
+        img = cv2.imread(img)
+        if img is None:
+            return False
+
+    # the backend drops DeepFace's confidence-0 "whole frame" result
+    return bool(get_backend().quick_detect(img))
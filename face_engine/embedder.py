@@ -1,18 +1,20 @@
-from deepface import DeepFace
+import cv2
 import numpy as np
 
+from face_engine.backends import get_backend
+
 def extract_embedding(image_path: str):
     """
     Robust embedding extractor for crawled images.
-    Uses Facenet512 (more tolerant than ArcFace).
+    Uses Facenet512 through the configured embedding backend, with the
+    backend's quick detector (OpenCV, as the crawler uses).
     """
     try:
-        reps = DeepFace.represent(
-            img_path=image_path,
-            model_name="Facenet512",      # IMPORTANT CHANGE
-            detector_backend="opencv",    # Match crawler detector
-            enforce_detection=False
-        )
+        img = cv2.imread(image_path)
+        if img is None:
+            return None
+
+        reps = get_backend().represent(img, quick=True)
 
         if not reps:
             return None
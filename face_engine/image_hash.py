@@ -1,7 +1,10 @@
 from PIL import Image
 import imagehash
+import numpy as np
 import io
 
+EXIF_ORIENTATION = 0x0112
+
 def compute_phash(image_bytes) -> str:
     """
     Compute perceptual hash (pHash) for exact / near-exact image matching.
@@ -10,6 +13,55 @@ def compute_phash(image_bytes) -> str:
     return str(imagehash.phash(img))
 
 
+def compute_phash_from_array(img) -> str:
+    """
+    Compute pHash for an already decoded OpenCV (BGR) image.
+    Avoids decoding the same bytes a second time.
+
+    PIL does not apply EXIF orientation, so the array must be decoded
+    with cv2.IMREAD_IGNORE_ORIENTATION to hash the same pixels as
+    compute_phash() does for the query upload.
+    """
+    rgb = Image.fromarray(img[:, :, ::-1])
+    return str(imagehash.phash(rgb))
+
+
+def exif_orientation(image_bytes) -> int:
+    """
+    EXIF orientation tag (1-8) of an encoded image, 1 when absent.
+    Reads the header only.
+    """
+    try:
+        return int(Image.open(io.BytesIO(image_bytes)).getexif().get(EXIF_ORIENTATION, 1))
+    except Exception:
+        return 1
+
+
+def apply_orientation(img, orientation: int):
+    """
+    Rotate / flip a decoded array the way cv2.imdecode would have for
+    this EXIF orientation, so one decode serves both the hash and the
+    upright image the face detector needs.
+    """
+    if orientation == 2:
+        img = img[:, ::-1]
+    elif orientation == 3:
+        img = img[::-1, ::-1]
+    elif orientation == 4:
+        img = img[::-1]
+    elif orientation == 5:
+        img = img.swapaxes(0, 1)
+    elif orientation == 6:
+        img = np.rot90(img, -1)
+    elif orientation == 7:
+        img = img[::-1, ::-1].swapaxes(0, 1)
+    elif orientation == 8:
+        img = np.rot90(img, 1)
+    else:
+        return img
+    return np.ascontiguousarray(img)
+
+
 def hamming_distance(h1: str, h2: str) -> int:
     """
     Compute Hamming distance between two hex hashes.
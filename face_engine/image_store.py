@@ -0,0 +1,214 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+import requests
+
+# -----------------------------
+# Content-addressed image store
+# -----------------------------
+# Downloaded image bytes are kept under IMAGE_DIR, keyed by SHA-256:
+#
+#   <root>/blobs/ab/abcdef...      raw bytes, one file per distinct image
+#   <root>/index.sqlite            url → hash, ETag, Last-Modified, fetch
+#                                  time; hash → size, last access
+#
+# Several URLs can share one blob (same photo on several hosts). A URL
+# fetched less than `revalidate_seconds` ago is served from disk with
+# no network at all. After that it is revalidated with a conditional
+# GET (If-None-Match / If-Modified-Since), and only a changed image is
+# downloaded again. Blobs are evicted least-recently-used once the store
+# grows past `max_bytes`.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url           TEXT PRIMARY KEY,
+    hash          TEXT NOT NULL,
+    etag          TEXT,
+    last_modified TEXT,
+    fetched_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS urls_hash ON urls(hash);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash          TEXT PRIMARY KEY,
+    size          INTEGER NOT NULL,
+    last_access   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_access ON blobs(last_access);
+"""
+
+
+class ImageStore:
+    def __init__(self, root: str, max_bytes: int, revalidate_seconds: float = 0):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+        self.counters = {
+            "local": 0,         # served from disk, no request
+            "not_modified": 0,  # conditional GET → 304
+            "downloaded": 0,    # full GET (new or changed)
+            "stale_served": 0,  # revalidation failed, served local copy
+            "evicted": 0,
+        }
+
+    # -----------------------------
+    # Blobs
+    # -----------------------------
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def _read_blob(self, digest: str):
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_blob(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return digest
+
+    # -----------------------------
+    # Index (caller holds the lock)
+    # -----------------------------
+    def _lookup(self, url: str):
+        return self._db.execute(
+            "SELECT hash, etag, last_modified, fetched_at FROM urls WHERE url = ?", (url,)
+        ).fetchone()
+
+    def _touch(self, url: str, digest: str, now: float, refetched: bool):
+        self._db.execute("UPDATE blobs SET last_access = ? WHERE hash = ?", (now, digest))
+        if refetched:
+            self._db.execute("UPDATE urls SET fetched_at = ? WHERE url = ?", (now, url))
+        self._db.commit()
+
+    def _record(self, url: str, digest: str, size: int, etag, last_modified, now: float):
+        new_blob = self._db.execute(
+            "INSERT OR IGNORE INTO blobs (hash, size, last_access) VALUES (?, ?, ?)",
+            (digest, size, now)
+        ).rowcount
+        if new_blob:
+            self._total += size
+        else:
+            self._db.execute("UPDATE blobs SET last_access = ? WHERE hash = ?", (now, digest))
+
+        self._db.execute(
+            "INSERT OR REPLACE INTO urls (url, hash, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?)",
+            (url, digest, etag, last_modified, now)
+        )
+        self._db.commit()
+
+        if self._total > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        # down to 90% of the cap so eviction doesn't run on every insert
+        target = int(self.max_bytes * 0.9)
+        rows = self._db.execute("SELECT hash, size FROM blobs ORDER BY last_access").fetchall()
+
+        evicted = []
+        for digest, size in rows:
+            if self._total <= target:
+                break
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+            self._total -= size
+            evicted.append((digest,))
+
+        self._db.executemany("DELETE FROM urls WHERE hash = ?", evicted)
+        self._db.executemany("DELETE FROM blobs WHERE hash = ?", evicted)
+        self._db.commit()
+        self.counters["evicted"] += len(evicted)
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+    def fetch(self, url: str, session=None, headers=None, timeout: float = 15) -> bytes:
+        """
+        Image bytes for `url`, from disk when possible.
+        Raises like requests on a failed download of an image we don't have.
+        """
+        now = time.time()
+
+        with self._lock:
+            row = self._lookup(url)
+
+        cached = None
+        if row is not None:
+            digest, etag, last_modified, fetched_at = row
+            cached = self._read_blob(digest)
+
+        if cached is not None and now - fetched_at < self.revalidate_seconds:
+            with self._lock:
+                self._touch(url, digest, now, refetched=False)
+                self.counters["local"] += 1
+            return cached
+
+        request_headers = dict(headers or {})
+        if cached is not None:
+            if etag:
+                request_headers["If-None-Match"] = etag
+            if last_modified:
+                request_headers["If-Modified-Since"] = last_modified
+
+        try:
+            r = (session or requests).get(url, headers=request_headers, timeout=timeout)
+            if cached is not None and r.status_code == 304:
+                with self._lock:
+                    self._touch(url, digest, now, refetched=True)
+                    self.counters["not_modified"] += 1
+                return cached
+            r.raise_for_status()
+
+        except requests.RequestException as e:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            if cached is not None and status not in (404, 410):
+                # host unreachable / erroring: the local copy is still good
+                with self._lock:
+                    self.counters["stale_served"] += 1
+                return cached
+            raise
+
+        data = r.content
+        digest = self._write_blob(data)
+        with self._lock:
+            self._record(url, digest, len(data), r.headers.get("ETag"), r.headers.get("Last-Modified"), now)
+            self.counters["downloaded"] += 1
+        return data
+
+    def stats(self) -> dict:
+        with self._lock:
+            urls = self._db.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+            blobs = self._db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+            return {
+                **self.counters,
+                "urls": urls,
+                "blobs": blobs,
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,31 +1,132 @@
 import os
 import json
+import shutil
+import itertools
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+import cv2
 import numpy as np
 import faiss
-from deepface import DeepFace
+
+from config import (
+    INDEXER_DOWNLOAD_WORKERS,
+    INDEXER_DECODE_WORKERS,
+    INDEXER_EMBED_WORKERS,
+    INDEXER_QUEUE_SIZE,
+    INDEXER_CHECKPOINT_EVERY,
+    INDEXER_PREFILTER_WORKERS,
+    INDEXER_MAX_FACES,
+    INDEXER_MIN_FACE_SIDE,
+    PREFILTER_ENABLED,
+    PREFILTER_OPENCV,
+    PREFILTER_RETRY_REJECTS,
+    IMAGE_DIR,
+    EMBEDDING_DIR,
+    IMAGE_STORE_ENABLED,
+    IMAGE_STORE_MAX_GB,
+    IMAGE_STORE_REVALIDATE_HOURS,
+    DEDUP_ENABLED,
+    DEDUP_PHASH_THRESHOLD,
+    SNAPSHOT_KEEP,
+    INDEX_SHARDS,
+    INDEX_SHARD_PARTITION
+)
+from face_engine.image_hash import compute_phash_from_array, exif_orientation, apply_orientation
+from face_engine.image_store import ImageStore
+from face_engine.ann import build_index, index_type_of, storage_of
+from face_engine.backends import get_backend, describe as describe_backend
+from face_engine.shards import ShardWriter, ShardedBuild, ShardedAppend
+from face_engine.dedup import PHashGroups, MEMBER, INDEXED
+from face_engine.metadata_store import MetadataStore, write_metadata_store
+from face_engine.phash_index import PHashIndex
+from face_engine.pipeline import Pipeline, Rejected
+from face_engine.prefilter import check_bytes, check_image, check_opencv, cascade_report, OPENCV_REASON
+from face_engine.snapshot import (
+    INDEX_NAME,
+    EMBEDDINGS_NAME,
+    METADATA_NAME,
+    PHASH_INDEX_NAME,
+    REJECTED_NAME,
+    PREFILTERED_NAME,
+    begin_snapshot,
+    commit_snapshot,
+    abort_snapshot,
+    prune_snapshots,
+    snapshot_path,
+    read_current_version,
+    read_manifest,
+    load_snapshot,
+    load_rejected,
+    load_prefiltered,
+    IndexSnapshot
+)
+from crawler.segment_log import read_crawl_entries, url_hash
+from utils.helpers import infer_source, clone_file
+
 # -----------------------------
 # Paths
 # -----------------------------
-DATA_DIR = "data/embeddings"
-EMBEDDINGS_FILE = os.path.join(DATA_DIR, "face_embeddings.npy")
-FAISS_INDEX_FILE = os.path.join(DATA_DIR, "faiss.index")
-METADATA_FILE = os.path.join(DATA_DIR, "metadata.json")
+METADATA_FILE = os.path.join(EMBEDDING_DIR, "metadata.json")     # crawler output (compacted)
+CRAWL_SEGMENT_DIR = os.path.join(EMBEDDING_DIR, "crawl_segments") # crawler output (not yet compacted)
+CHECKPOINT_DIR = os.path.join(EMBEDDING_DIR, "incremental_checkpoint")
 
-os.makedirs(DATA_DIR, exist_ok=True)
+os.makedirs(EMBEDDING_DIR, exist_ok=True)
 
 # -----------------------------
-# DeepFace config
+# Embedding model (run by the configured backend)
 # -----------------------------
-MODEL_NAME = "Facenet512"
-DETECTOR_BACKEND = "retinaface"
 EMBEDDING_DIM = 512
 
 
 # -----------------------------
 # Utilities
 # -----------------------------
-def download_image(url: str):
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; FaceSearchBot/1.0)",
+    "Referer": "https://commons.wikimedia.org/"
+}
+
+_thread_local = threading.local()
+
+
+def _get_session():
+    """
+    One keep-alive session per download thread, so connections to the
+    same image host are reused instead of re-opened per image.
+    """
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _thread_local.session = session
+    return session
+
+
+_image_store = None
+_image_store_lock = threading.Lock()
+
+
+def get_image_store():
+    """
+    Shared content-addressed store for downloaded images (None if disabled).
+    """
+    global _image_store
+    if not IMAGE_STORE_ENABLED:
+        return None
+    with _image_store_lock:
+        if _image_store is None:
+            _image_store = ImageStore(
+                IMAGE_DIR,
+                max_bytes=int(IMAGE_STORE_MAX_GB * 1024 ** 3),
+                revalidate_seconds=IMAGE_STORE_REVALIDATE_HOURS * 3600
+            )
+        return _image_store
+
+
+def _normalize_url(url: str) -> str:
     if not isinstance(url, str):
         raise ValueError("URL must be a string")
 
@@ -34,116 +135,829 @@ def download_image(url: str):
 
     if not url.startswith("http"):
         raise ValueError("Invalid URL")
+    return url
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (compatible; FaceSearchBot/1.0)",
-        "Referer": "https://commons.wikimedia.org/"
-    }
 
-    r = requests.get(url, headers=headers, timeout=15)
+def download_image(url: str, session=None):
+    url = _normalize_url(url)
+
+    store = get_image_store()
+    if store is not None:
+        return store.fetch(url, session=session, headers=HEADERS)
+
+    r = (session or requests).get(url, headers=HEADERS, timeout=15)
     r.raise_for_status()
     return r.content
 
 
-import cv2
-import numpy as np
+def decode_image(img_bytes):
+    img_array = np.frombuffer(img_bytes, np.uint8)
+    return cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+
+
+def embed_faces(img) -> list:
+    """
+    Every face in an already decoded BGR image, from one detection pass:
+    [{"embedding", "bbox": [x, y, w, h], "confidence"}], largest first.
+    Empty when no face is found.
+    """
+    faces = []
+    for rep in get_backend().represent(img):
+        # enforce_detection=False returns the whole frame with
+        # confidence 0 when nothing was found
+        if rep.get("face_confidence", 1) <= 0:
+            continue
+        area = rep.get("facial_area") or {}
+        faces.append({
+            "embedding": np.array(rep["embedding"], dtype="float32"),
+            "bbox": [int(area.get(k, 0)) for k in ("x", "y", "w", "h")],
+            "confidence": float(rep.get("face_confidence", 1)),
+        })
+
+    faces.sort(key=lambda f: f["bbox"][2] * f["bbox"][3], reverse=True)
+    faces = faces[:1] + [f for f in faces[1:] if min(f["bbox"][2:]) >= INDEXER_MIN_FACE_SIDE]
+    return faces[:INDEXER_MAX_FACES]
+
+
+def embed_image(img):
+    """
+    Embed the largest face of an already decoded BGR image.
+    Returns None when no face is found.
+    """
+    faces = embed_faces(img)
+    return faces[0]["embedding"] if faces else None
+
 
 def extract_embedding(img_bytes):
     # bytes → numpy image
-    img_array = np.frombuffer(img_bytes, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+    img = decode_image(img_bytes)
 
     if img is None:
         return None
 
-    reps = DeepFace.represent(
-        img_path=img,
-        model_name=MODEL_NAME,
-        detector_backend=DETECTOR_BACKEND,
-        enforce_detection=False
+    return embed_image(img)
+
+
+# -----------------------------
+# Ingestion pipeline stages
+# -----------------------------
+def _download_stage(job):
+    job["bytes"] = download_image(job["url"], session=_get_session())
+    return job
+
+
+def _decode_stage(job):
+    data = job.pop("bytes")
+    if PREFILTER_ENABLED:
+        check_bytes(data)
+
+    # hash the stored pixels (as compute_phash does for queries), then
+    # orient for detection
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img is None:
+        raise ValueError("Could not decode image")
+    job["phash"] = compute_phash_from_array(img)
+    img = apply_orientation(img, exif_orientation(data))
+
+    if PREFILTER_ENABLED:
+        check_image(img)
+
+    job["img"] = img
+    return job
+
+
+def _dedup_stage(job, groups):
+    h, w = job["img"].shape[:2]
+    outcome = groups.assign(job["url"], job["phash"], h * w)
+    if outcome == INDEXED:
+        raise Rejected("duplicate_indexed")
+    if outcome == MEMBER:
+        raise Rejected("duplicate")
+    return job
+
+
+def _prefilter_stage(job):
+    job["audit"] = check_opencv(job["img"])
+    return job
+
+
+def _embed_stage(job):
+    faces = embed_faces(job.pop("img"))
+    if not faces:
+        # audited OpenCV rejects count as no-face like any other
+        raise Rejected("no_face_audit" if job.get("audit") else "no_face")
+
+    job["faces"] = faces
+    return job
+
+
+DUPLICATE_REASONS = ("duplicate", "duplicate_indexed")
+
+
+def _collapse_groups(completed: list, dropped: dict, groups: PHashGroups):
+    """
+    One record per near-duplicate group: the largest embedded member,
+    with the group's other URLs as "aliases". Returns (records, number
+    of aliases attached, URLs of groups rejected for their content,
+    URLs of groups only the OpenCV pre-filter rejected).
+    Groups whose embedded members all failed are left out entirely, so
+    the next incremental run retries them.
+    """
+    by_group = {}
+    for job in completed:
+        by_group.setdefault(groups.group_of[job["url"]], []).append(job)
+
+    records, aliases, no_face, prefiltered = [], 0, [], []
+    for gid, members in enumerate(groups.members):
+        done = by_group.get(gid)
+        if done:
+            best = max(done, key=lambda j: groups.area[j["url"]])
+            others = [u for u in members if u != best["url"]]
+            if others:
+                best["aliases"] = others
+                aliases += len(others)
+            records.append(best)
+            continue
+
+        verdicts = [dropped.get(u) for u in members if dropped.get(u) not in (None, "failed") + DUPLICATE_REASONS]
+        if verdicts:
+            # same photo, same verdict
+            target = prefiltered if verdicts[0] == OPENCV_REASON else no_face
+            target.extend(u for u in members if dropped.get(u) == "duplicate")
+
+    records.sort(key=lambda job: job["pos"])
+    return records, aliases, no_face, prefiltered
+
+
+def run_ingestion(
+    image_urls: list[str],
+    download_workers: int = None,
+    decode_workers: int = None,
+    embed_workers: int = None,
+    queue_size: int = None,
+    known=None,
+    opencv_prefilter: bool = None
+):
+    """
+    Download → decode + pHash → embed, concurrently.
+    Every image is fetched and decoded exactly once, and near-duplicates
+    are embedded once per group. `known` is the snapshot being appended
+    to; images matching its rows become aliases of those rows.
+    `opencv_prefilter` overrides PREFILTER_OPENCV.
+    Returns (records in input order, report).
+    """
+    stages = [
+        ("download", _download_stage, download_workers or INDEXER_DOWNLOAD_WORKERS),
+        ("decode", _decode_stage, decode_workers or INDEXER_DECODE_WORKERS),
+    ]
+
+    groups = None
+    if DEDUP_ENABLED:
+        groups = PHashGroups(
+            DEDUP_PHASH_THRESHOLD,
+            known_index=known.phash_index if known is not None and known.size else None,
+            known_url=known.metadata.url if known is not None else None
+        )
+        stages.append(("dedup", lambda job: _dedup_stage(job, groups), 1))
+    if PREFILTER_OPENCV if opencv_prefilter is None else opencv_prefilter:
+        stages.append(("prefilter", _prefilter_stage, INDEXER_PREFILTER_WORKERS))
+    stages.append(("embed", _embed_stage, embed_workers or INDEXER_EMBED_WORKERS))
+
+    pipeline = Pipeline(
+        stages,
+        queue_size=queue_size or INDEXER_QUEUE_SIZE,
+        log_prefix="[INDEXER]"
     )
 
-    if not reps:
-        return None
+    store = get_image_store()
+    store_before = store.stats() if store else None
+
+    jobs = [{"pos": i, "url": url} for i, url in enumerate(image_urls)]
+    completed, stats = pipeline.run(jobs)
+    completed.sort(key=lambda job: job["pos"])
+
+    # anything rejected for its content (sanity checks or RetinaFace) is
+    # not retried by incremental updates; failures (network) are, and so
+    # are OpenCV rejects, since the Haar cascade misses some faces
+    no_face_urls = [
+        image_urls[pos] for pos, reason in pipeline.dropped
+        if reason not in ("failed", OPENCV_REASON) + DUPLICATE_REASONS
+    ]
+    prefiltered_urls = [image_urls[pos] for pos, reason in pipeline.dropped if reason == OPENCV_REASON]
+
+    dedup = None
+    if groups is not None:
+        dropped = {image_urls[pos]: reason for pos, reason in pipeline.dropped}
+        completed, aliases, duplicate_no_face, duplicate_prefiltered = _collapse_groups(completed, dropped, groups)
+        no_face_urls.extend(duplicate_no_face)
+        prefiltered_urls.extend(duplicate_prefiltered)
+        dedup = groups.report(len(completed), aliases)
+
+    audited = sum(1 for j in completed if j.get("audit")) + stats["rejected"].get("no_face_audit", 0)
+    audit_missed = sum(1 for j in completed if j.get("audit"))
+
+    report = {
+        "total": stats["total"],
+        "downloaded": stats["stages"]["download"]["processed"],
+        "no_face": len(no_face_urls),
+        "prefiltered": len(prefiltered_urls),
+        "failed": stats["failed"],
+        "indexed": len(completed),
+        "faces": sum(len(j["faces"]) for j in completed),
+        "elapsed_seconds": stats["elapsed_seconds"],
+        "stages": stats["stages"],
+        "prefilter": cascade_report(stats, audited, audit_missed),
+        "no_face_urls": no_face_urls,
+        "prefiltered_urls": prefiltered_urls,
+    }
+    if dedup is not None:
+        report["dedup"] = dedup
+        report["indexed_aliases"] = groups.indexed_aliases
+    if store:
+        after = store.stats()
+        report["image_store"] = {
+            k: after[k] - store_before[k]
+            for k in ("local", "not_modified", "downloaded", "stale_served", "evicted")
+        }
+        report["image_store"]["bytes"] = after["bytes"]
+    return completed, report
+
+
+def print_report(report: dict):
+    print(
+        f"[INDEXER] Report — downloaded: {report['downloaded']}, "
+        f"no face: {report['no_face']}, OpenCV-rejected: {report['prefiltered']}, failed: {report['failed']}, "
+        f"indexed: {report['indexed']} ({report['faces']} faces) "
+        f"({report['elapsed_seconds']}s)"
+    )
+    for name, s in report["stages"].items():
+        print(
+            f"[INDEXER]   {name:<9} x{s['workers']:<3} "
+            f"{s['per_second']:>8}/s  avg {s['avg_ms']} ms  "
+            f"ok {s['processed']}  rejected {s['rejected']}  failed {s['failed']}"
+        )
+
+    pf = report.get("prefilter")
+    if pf:
+        sanity = ", ".join(f"{k} {v}" for k, v in pf["sanity"]["rejected"].items() if v) or "none"
+        line = f"[INDEXER]   pre-filter: sanity rejected {sanity}"
+        if "opencv" in pf:
+            line += f"; opencv passed {pf['opencv']['passed']}, rejected {pf['opencv']['rejected']}"
+            if "audited" in pf["opencv"]:
+                line += f" (audit: {pf['opencv']['audit_missed_faces']}/{pf['opencv']['audited']} missed)"
+            line += f", cost {pf['opencv']['cost_seconds']}s"
+        print(line + f"; ~{pf['embedding_seconds_avoided']}s of embedding avoided")
+
+    dd = report.get("dedup")
+    if dd:
+        print(
+            f"[INDEXER]   near-duplicates: {dd['groups']} groups, {dd['aliases']} aliases, "
+            f"{dd['aliases_of_indexed']} of indexed rows; {dd['embeddings_saved']} embeddings saved, "
+            f"corpus {dd['images_without_dedup']} → {dd['images_without_dedup'] - dd['aliases'] - dd['aliases_of_indexed']} images "
+            f"(-{dd['shrink_pct']}%)"
+        )
+
+    st = report.get("image_store")
+    if st:
+        print(
+            f"[INDEXER]   image store: {st['local']} local, {st['not_modified']} revalidated, "
+            f"{st['downloaded']} downloaded, {st['stale_served']} stale, "
+            f"{st['evicted']} evicted ({st['bytes'] / 1024 ** 2:.1f} MB on disk)"
+        )
+
+
+def record_rows(records: list, sources: dict = None):
+    """
+    (embeddings, metadata) with one row per face of each ingested
+    record. Face rows of one image share its URL and "image_id";
+    "face" and "bbox" say which face the row is.
+    """
+    embeddings, metadata = [], []
+    for r in records:
+        source = (sources or {}).get(r["url"]) or r.get("source") or infer_source(r["url"])
+        image_id = f"{url_hash(r['url']):016x}"
+
+        for i, face in enumerate(r["faces"]):
+            row = {"url": r["url"], "phash": r["phash"], "source": source,
+                   "image_id": image_id, "face": i, "bbox": face["bbox"]}
+            if r.get("aliases"):
+                row["aliases"] = r["aliases"]
+            embeddings.append(face["embedding"])
+            metadata.append(row)
+
+    if not embeddings:
+        return np.zeros((0, EMBEDDING_DIM), dtype="float32"), metadata
+    return np.vstack(embeddings).astype("float32"), metadata
 
-    return np.array(reps[0]["embedding"], dtype="float32")
 
+# -----------------------------
+# Snapshot writing
+# -----------------------------
+def _new_index(embeddings: np.ndarray, metadata: list):
+    """
+    FAISS index for a fresh snapshot, or INDEX_SHARDS shards of it.
+    """
+    if INDEX_SHARDS > 1:
+        return ShardedBuild(embeddings, [m["url"] for m in metadata], INDEX_SHARDS, INDEX_SHARD_PARTITION)
+    return build_index(embeddings)
+
+
+def _save_snapshot(index, new_metadata: list, rejected, write_embeddings, info: dict,
+                   base_metadata=None, extra_updates: dict = None, prefiltered=(),
+                   phash_index: PHashIndex = None) -> str:
+    """
+    Stage index, embeddings and metadata together and publish them as
+    one snapshot. write_embeddings(path) writes the .npy file; metadata
+    rows are base_metadata (if any) followed by new_metadata, with
+    extra_updates ({row: extra fields}) applied to base rows.
+    `index` is a FAISS index or a ShardWriter for a sharded snapshot.
+    `rejected` (no face) and `prefiltered` (OpenCV rejects) are URLs.
+    `phash_index` is built from the written metadata when not given.
+    """
+    staging = begin_snapshot()
+    try:
+        write_embeddings(os.path.join(staging, EMBEDDINGS_NAME))
+        if isinstance(index, ShardWriter):
+            index_info = index.write(staging)
+        else:
+            faiss.write_index(index, os.path.join(staging, INDEX_NAME))
+            index_info = {
+                "vectors": index.ntotal,
+                "index_type": index_type_of(index),
+                "storage": storage_of(index),
+            }
+
+        store_path = os.path.join(staging, METADATA_NAME)
+        if isinstance(base_metadata, MetadataStore):
+            write_metadata_store(store_path, new_metadata, base=base_metadata, extra_updates=extra_updates)
+        else:
+            base_rows = list(base_metadata or [])
+            for row, extra in (extra_updates or {}).items():
+                base_rows[row] = {**{k: base_rows[row][k] for k in ("url", "phash", "source") if k in base_rows[row]}, **extra}
+            write_metadata_store(store_path, itertools.chain(base_rows, new_metadata))
+
+        if phash_index is None:
+            phash_index = PHashIndex(*MetadataStore(store_path).phash_rows())
+        phash_index.save(os.path.join(staging, PHASH_INDEX_NAME))
+        with open(os.path.join(staging, REJECTED_NAME), "w") as f:
+            json.dump(sorted(rejected), f)
+        with open(os.path.join(staging, PREFILTERED_NAME), "w") as f:
+            json.dump(sorted(prefiltered), f)
+
+        version = commit_snapshot(staging, info={
+            "dim": EMBEDDING_DIM,
+            **describe_backend(),
+            **index_info,
+            **info,
+        })
+    except Exception:
+        abort_snapshot(staging)
+        raise
+
+    prune_snapshots(SNAPSHOT_KEEP)
+    return version
 
 
 # -----------------------------
 # ONE-TIME REBUILD FUNCTION
 # -----------------------------
-def rebuild_index_from_urls(image_urls: list[str]):
+def rebuild_index_from_urls(image_urls: list[str], **pipeline_options):
     """
     ONE-TIME rebuild.
     Call this manually, NOT on app startup.
+    pipeline_options override the INDEXER_* concurrency settings.
     """
 
     print(f"[INDEXER] Rebuilding index from {len(image_urls)} images")
 
-    embeddings = []
-    metadata = []
+    records, report = run_ingestion(image_urls, **pipeline_options)
+    print_report(report)
 
-    for i, url in enumerate(image_urls, start=1):
-        print(f"[INDEXER] ({i}/{len(image_urls)}) Processing")
+    if not records:
+        print("[INDEXER] ❌ No embeddings created — aborting save")
+        return report
 
-        try:
-            img = download_image(url)
-            emb = extract_embedding(img)
+    embeddings, metadata = record_rows(records)
 
-            if emb is None:
-                continue
+    # ✅ IMPORTANT: Normalize for cosine similarity
+    faiss.normalize_L2(embeddings)
 
-            embeddings.append(emb)
-            from face_engine.image_hash import compute_phash
+    # ✅ Cosine similarity index (type from FAISS_INDEX_TYPE)
+    index = _new_index(embeddings, metadata)
+
+    # Save everything as one snapshot
+    version = _save_snapshot(
+        index,
+        metadata,
+        report["no_face_urls"],
+        lambda path: np.save(path, embeddings),
+        {"built_by": "rebuild"},
+        prefiltered=report["prefiltered_urls"]
+    )
 
-            img_bytes = download_image(url)
-            img_hash = compute_phash(img_bytes)
+    # a checkpoint taken against the old index is meaningless now
+    shutil.rmtree(CHECKPOINT_DIR, ignore_errors=True)
 
-            phash = compute_phash(img)
-            metadata.append({"url": url,"phash": phash})
+    print(f"[INDEXER] ✅ Rebuild complete: {len(embeddings)} embeddings saved ({version})")
+    return report
 
 
-            print("[INDEXER] Face embedding stored")
+# -----------------------------
+# INCREMENTAL UPDATE
+# -----------------------------
+# metadata.json + crawl_segments/ (next to the snapshots) are the
+# crawler's URL list.
+# Entries whose URL is neither in the current snapshot's metadata nor
+# in its rejected (no face) list are pending. They are embedded in
+# checkpointed chunks and appended to a copy of the current snapshot,
+# which is then published as a new snapshot.
+
+def _write_json_atomic(path: str, data, **dump_kwargs):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _append_npy_rows(path: str, rows: np.ndarray, keep_rows: int):
+    """
+    Append rows to a 2-D .npy file in place, after its first keep_rows
+    rows. Only the header and the new rows are written, so the cost is
+    O(len(rows)), not O(file). Falls back to a full rewrite when the
+    header has no room for the new shape.
+    """
+    rows = np.ascontiguousarray(rows)
+
+    if os.path.exists(path):
+        with open(path, "r+b") as f:
+            version = np.lib.format.read_magic(f)
+            prefix = f.tell()
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+                prefix += 2
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+                prefix += 4
+            data_offset = f.tell()
+
+            compatible = (
+                not fortran
+                and dtype == rows.dtype
+                and len(shape) == 2
+                and shape[1] == rows.shape[1]
+                and shape[0] >= keep_rows
+            )
+
+            header = repr({
+                "descr": np.lib.format.dtype_to_descr(dtype),
+                "fortran_order": False,
+                "shape": (keep_rows + len(rows), rows.shape[1]),
+            })
+            room = data_offset - prefix - 1
+
+            if compatible and len(header) <= room:
+                # data first, header last: a crash in between leaves a
+                # valid file with the old shape
+                f.seek(data_offset + keep_rows * rows.shape[1] * dtype.itemsize)
+                f.truncate()
+                f.write(rows.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+                f.seek(prefix)
+                f.write((header.ljust(room) + "\n").encode("latin1"))
+                f.flush()
+                os.fsync(f.fileno())
+                return
+
+        existing = np.load(path)[:keep_rows]
+        rows = np.vstack([existing, rows.astype(existing.dtype)])
+
+    np.save(path, rows)
+
+
+def _load_checkpoint(base_version: str):
+    progress_file = os.path.join(CHECKPOINT_DIR, "progress.json")
+    if os.path.exists(progress_file):
+        with open(progress_file, "r") as f:
+            progress = json.load(f)
+
+        if progress.get("base_version") == base_version:
+            print(f"[INDEXER] Resuming from checkpoint ({len(progress['parts'])} parts done)")
+            progress.setdefault("aliases", {})
+            progress.setdefault("prefiltered", [])
+            return progress
+
+        print("[INDEXER] Discarding stale checkpoint (index changed since)")
+        shutil.rmtree(CHECKPOINT_DIR, ignore_errors=True)
+
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    return {"base_version": base_version, "parts": [], "no_face": [], "prefiltered": [], "aliases": {}}
+
+
+def _save_checkpoint_part(progress: dict, records: list, no_face: list, indexed_aliases: dict = None,
+                          prefiltered: list = ()):
+    part = f"part_{len(progress['parts']):05d}"
+
+    embeddings, rows = record_rows(records)
+    if rows:
+        np.save(os.path.join(CHECKPOINT_DIR, part + ".npy"), embeddings)
+    _write_json_atomic(os.path.join(CHECKPOINT_DIR, part + ".json"), rows)
+
+    progress["parts"].append(part)
+    progress["no_face"].extend(no_face)
+    progress["prefiltered"].extend(prefiltered)
+    for canonical, urls in (indexed_aliases or {}).items():
+        progress["aliases"].setdefault(canonical, []).extend(urls)
+    _write_json_atomic(os.path.join(CHECKPOINT_DIR, "progress.json"), progress)
+
+
+def _load_checkpoint_parts(progress: dict):
+    embeddings, metadata = [], []
+    for part in progress["parts"]:
+        with open(os.path.join(CHECKPOINT_DIR, part + ".json"), "r") as f:
+            records = json.load(f)
+        if records:
+            embeddings.append(np.load(os.path.join(CHECKPOINT_DIR, part + ".npy")))
+            metadata.extend(records)
+    return embeddings, metadata
+
+
+def _copy_embeddings(base, new_embeddings: np.ndarray):
+    """
+    Writer for the new snapshot's .npy: base rows followed by new rows.
+    The base file is cloned (a reflink where the filesystem supports it,
+    else a full copy) and the new rows appended to the clone in place.
+    """
+    base_size = base.size if base is not None else 0
 
-        except Exception as e:
-            print(f"[INDEXER] Failed — {e}")
+    def write(path):
+        if base_size == 0:
+            np.save(path, new_embeddings)
+            return
 
-    if not embeddings:
-        print("[INDEXER] ❌ No embeddings created — aborting save")
-        return
+        base_file = base.file(EMBEDDINGS_NAME)
+        if os.path.exists(base_file):
+            if not clone_file(base_file, path):
+                print(f"[INDEXER] Copied {os.path.getsize(base_file) >> 20} MB of base embeddings (no reflink support)")
+        else:
+            np.save(path, base.index.reconstruct_n(0, base_size))
+        _append_npy_rows(path, new_embeddings, keep_rows=base_size)
 
-    embeddings = np.vstack(embeddings).astype("float32")
+    return write
 
-    # ✅ IMPORTANT: Normalize for cosine similarity
-    faiss.normalize_L2(embeddings)
 
-    # ✅ Cosine similarity index
-    index = faiss.IndexFlatIP(EMBEDDING_DIM)
-    index.add(embeddings)
+_publish_lock = threading.Lock()
+
+
+def _alias_updates(base, indexed_aliases: dict) -> dict:
+    """
+    {row: extra fields} attaching new alias URLs to base rows, found by
+    their canonical URL. Canonical rows gone from the base are skipped
+    (the aliases stay pending and are retried).
+    """
+    if not indexed_aliases or base is None or not base.size:
+        return {}
+
+    rows_of = {}
+    for i, url in enumerate(base.metadata.urls()):
+        if url in indexed_aliases:
+            rows_of.setdefault(url, []).append(i)
+
+    # every face row of the image carries the aliases
+    updates = {}
+    for canonical, urls in indexed_aliases.items():
+        for row in rows_of.get(canonical, ()):
+            extra = base.metadata.extra(row)
+            current = extra.get("aliases", [])
+            added = [u for u in urls if u not in current and u != canonical]
+            if added:
+                updates[row] = {**extra, "aliases": current + added}
+    return updates
+
+
+def _appended_phash_index(base, new_metadata: list) -> PHashIndex:
+    """
+    The base's pHash index with the new rows merged in.
+    """
+    if base is None or not base.size:
+        return PHashIndex.build([m.get("phash") for m in new_metadata])
+
+    rows = [i for i, m in enumerate(new_metadata) if m.get("phash")]
+    codes = np.array([int(new_metadata[i]["phash"], 16) for i in rows], dtype=np.uint64)
+    return base.phash_index.extend(codes, np.array(rows, dtype=np.int64) + base.size)
+
 
-    # Save everything
-    np.save(EMBEDDINGS_FILE, embeddings)
-    faiss.write_index(index, FAISS_INDEX_FILE)
-    with open(METADATA_FILE, "w") as f:
-        json.dump(metadata, f)
+def publish_appended(new_embeddings: np.ndarray, new_metadata: list, no_face, info: dict,
+                     indexed_aliases: dict = None, prefiltered=(), base=None):
+    """
+    Publish the current snapshot + new rows as a new snapshot.
+    The base is whatever is current at publish time, so two writers in
+    this process (incremental update, streaming) never drop each other's
+    rows; rows whose URL the base already has are skipped.
+    indexed_aliases ({canonical URL: [alias URLs]}) attaches near-
+    duplicates to rows the base already has. `prefiltered` URLs join the
+    base's OpenCV rejects; any of them now indexed or confirmed without
+    a face leave that list.
+    `base` is the caller's own loaded copy of the current snapshot; it
+    saves reloading it when it is still current. Its FAISS index is
+    extended in place, so the caller must switch to the returned
+    snapshot (and drop `base` if this raises).
+    Returns (version, total vectors, rows added, published snapshot).
+    """
+    with _publish_lock:
+        if base is None or base.version != read_current_version():
+            base = load_snapshot()
+
+        if base is not None and base.size:
+            known = set(base.metadata.urls())
+            known.update(base.metadata.alias_rows())
+            keep = [i for i, m in enumerate(new_metadata) if m["url"] not in known]
+            if len(keep) != len(new_metadata):
+                new_metadata = [new_metadata[i] for i in keep]
+                new_embeddings = new_embeddings[keep]
+
+        new_embeddings = np.ascontiguousarray(new_embeddings, dtype="float32")
+        faiss.normalize_L2(new_embeddings)
+
+        # before the base index grows below
+        write_embeddings = _copy_embeddings(base, new_embeddings)
+        phash_index = _appended_phash_index(base, new_metadata)
+
+        if base is None or base.size == 0:
+            index = _new_index(new_embeddings, new_metadata)
+        elif base.shards:
+            # same shard count and partitioning as the base
+            index = ShardedAppend(base, new_embeddings, [m["url"] for m in new_metadata])
+        else:
+            # keep the base index type (and its training); rebuild to
+            # change it. The base was loaded for this publish (or handed
+            # over by the caller), so it is extended instead of cloned.
+            index = base.index
+            index.add(new_embeddings)
+
+        rejected = set(load_rejected(base)) if base is not None else set()
+        rejected |= set(no_face)
+
+        pending = set(load_prefiltered(base)) if base is not None else set()
+        pending |= set(prefiltered)
+        pending -= rejected
+        pending -= {m["url"] for m in new_metadata}
+        for urls in (indexed_aliases or {}).values():
+            pending -= set(urls)
+
+        version = _save_snapshot(
+            index,
+            new_metadata,
+            rejected,
+            write_embeddings,
+            info,
+            base_metadata=base.metadata if base is not None else None,
+            extra_updates=_alias_updates(base, indexed_aliases),
+            prefiltered=pending,
+            phash_index=phash_index
+        )
+
+        path = snapshot_path(version)
+        published = IndexSnapshot(
+            version,
+            path,
+            None if isinstance(index, ShardWriter) else index,
+            MetadataStore(os.path.join(path, METADATA_NAME)),
+            read_manifest(version),
+            phash_index
+        )
+
+    return version, index.ntotal, len(new_metadata), published
+
+
+def update_index_incremental(checkpoint_every: int = None, retry_prefiltered: bool = None, **pipeline_options):
+    """
+    Embed only crawled URLs that are not in the current snapshot yet and
+    publish a new snapshot with them appended.
+    Earlier OpenCV pre-filter rejects go straight to RetinaFace unless
+    `retry_prefiltered` (default PREFILTER_RETRY_REJECTS) is False.
+    Progress is checkpointed every `checkpoint_every` URLs; re-running
+    after an interruption resumes from the last checkpoint.
+    """
+    checkpoint_every = checkpoint_every or INDEXER_CHECKPOINT_EVERY
+    if retry_prefiltered is None:
+        retry_prefiltered = PREFILTER_RETRY_REJECTS
 
-    print(f"[INDEXER] ✅ Rebuild complete: {len(embeddings)} embeddings saved")
+    entries = read_crawl_entries(METADATA_FILE, CRAWL_SEGMENT_DIR)
+    if not entries:
+        print("[INDEXER] No crawled URLs — nothing to index")
+        return None
+
+    base = load_snapshot()
+    if base is None:
+        base_version, indexed, rejected, prefiltered = None, None, set(), set()
+        indexed_urls = set()
+    else:
+        base_version, indexed = base.version, base.metadata
+        rejected = set(load_rejected(base))
+        prefiltered = set(load_prefiltered(base))
+        indexed_urls = set(indexed.urls())
+        indexed_urls.update(indexed.alias_rows())
+
+    pending, retry, sources = [], [], {}
+    for e in entries:
+        url = e.get("url")
+        if not url or url in indexed_urls or url in rejected or url in sources:
+            continue
+        if url in prefiltered and not retry_prefiltered:
+            continue
+        sources[url] = e.get("source") or infer_source(url)
+        (retry if url in prefiltered else pending).append(url)
+
+    progress = _load_checkpoint(base_version)
+    done = set(progress["no_face"])
+    for part in progress["parts"]:
+        with open(os.path.join(CHECKPOINT_DIR, part + ".json"), "r") as f:
+            for r in json.load(f):
+                done.add(r["url"])
+                done.update(r.get("aliases", ()))
+    for urls in progress["aliases"].values():
+        done.update(urls)
+
+    done.update(progress["prefiltered"])
+
+    todo = [u for u in pending if u not in done]
+    retry_todo = [u for u in retry if u not in done]
+    print(
+        f"[INDEXER] Incremental update — {len(pending)} pending, {len(todo)} left to process, "
+        f"{len(retry_todo)} OpenCV rejects to re-check with RetinaFace"
+    )
+
+    totals = {"downloaded": 0, "no_face": 0, "prefiltered": 0, "failed": 0, "indexed": 0, "faces": 0}
+
+    # earlier OpenCV rejects skip the OpenCV check this time
+    chunks = [(todo[i:i + checkpoint_every], None) for i in range(0, len(todo), checkpoint_every)]
+    chunks += [(retry_todo[i:i + checkpoint_every], False) for i in range(0, len(retry_todo), checkpoint_every)]
+
+    for chunk, opencv_prefilter in chunks:
+        records, report = run_ingestion(chunk, known=base, opencv_prefilter=opencv_prefilter, **pipeline_options)
+        print_report(report)
+
+        for r in records:
+            r["source"] = sources.get(r["url"])
+
+        # failed downloads and OpenCV rejects are retried on the next
+        # run, no-face ones are not
+        _save_checkpoint_part(
+            progress, records, report["no_face_urls"], report.get("indexed_aliases"), report["prefiltered_urls"]
+        )
+
+        for key in totals:
+            totals[key] += report[key]
+
+    # -----------------------------
+    # Merge checkpoint into a new snapshot
+    # -----------------------------
+    part_embeddings, new_metadata = _load_checkpoint_parts(progress)
+    no_face = set(progress["no_face"])
+
+    if not new_metadata and not no_face and not progress["aliases"] and not progress["prefiltered"]:
+        shutil.rmtree(CHECKPOINT_DIR, ignore_errors=True)
+        print("[INDEXER] ✅ No new embeddings — index unchanged")
+        return totals
+
+    if part_embeddings:
+        new_embeddings = np.vstack(part_embeddings).astype("float32")
+    else:
+        new_embeddings = np.zeros((0, EMBEDDING_DIM), dtype="float32")
+
+    version, total, added, _ = publish_appended(
+        new_embeddings,
+        new_metadata,
+        no_face,
+        {"built_by": "incremental", "base_version": base_version},
+        indexed_aliases=progress["aliases"],
+        prefiltered=progress["prefiltered"],
+        base=base
+    )
+
+    shutil.rmtree(CHECKPOINT_DIR, ignore_errors=True)
+
+    print(
+        f"[INDEXER] ✅ Incremental update complete: +{added} embeddings "
+        f"({total} total, {len(no_face)} new without a face) — {version}"
+    )
+    return totals
 
 
 # -----------------------------
 # LOAD EXISTING INDEX (SEARCH)
 # -----------------------------
 def load_index():
-    if not os.path.exists(FAISS_INDEX_FILE):
+    snapshot = load_snapshot()
+    if snapshot is None:
         return None, None
 
-    index = faiss.read_index(FAISS_INDEX_FILE)
-    with open(METADATA_FILE, "r") as f:
-        metadata = json.load(f)
-
-    print(f"[INDEXER] Loaded index with {index.ntotal} embeddings")
-    return index, metadata
+    print(f"[INDEXER] Loaded index with {snapshot.size} embeddings ({snapshot.version})")
+    return snapshot.index, snapshot.metadata
 
 # =========================
 # URL NORMALIZATION
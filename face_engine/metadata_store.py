@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import shutil
+from array import array
+import numpy as np
+
+from utils.helpers import infer_source, clone_file
+
+# -----------------------------
+# Columnar, memory-mapped metadata
+# -----------------------------
+# One directory per snapshot, row i ↔ FAISS id i:
+#
+#   header.json         row count, source names, format version
+#   urls.bin            UTF-8 URLs back to back
+#   url_offsets.npy     uint64 [n + 1], row i = urls.bin[off[i]:off[i+1]]
+#   phash.npy           uint64 [n] packed pHash
+#   has_phash.npy       bool   [n]
+#   source.npy          uint8  [n] index into header["sources"], 255 = none
+#   extra.bin           JSON of any other per-row fields (often empty)
+#   extra_offsets.npy   uint64 [n + 1]
+#
+# Every column is opened with mmap, so a process only pages in the
+# rows it touches instead of parsing the corpus into Python dicts.
+
+FORMAT_VERSION = 1
+HEADER_NAME = "header.json"
+CORE_FIELDS = ("url", "phash", "source")
+NO_SOURCE = 255
+
+
+def _load_column(path: str, name: str):
+    return np.load(os.path.join(path, name), mmap_mode="r")
+
+
+def _load_blob(path: str, name: str):
+    file_path = os.path.join(path, name)
+    if os.path.getsize(file_path) == 0:
+        return np.empty(0, dtype=np.uint8)
+    return np.memmap(file_path, dtype=np.uint8, mode="r")
+
+
+# -----------------------------
+# Writing
+# -----------------------------
+def _copy_extra(base, out, updates: dict):
+    """
+    Copy base extra.bin into `out`, replacing the extra fields of the
+    rows in `updates`. Returns the base extra offsets, shifted for the
+    replaced rows. Untouched byte ranges are copied as-is.
+    """
+    offsets = np.asarray(base._extra_offsets, dtype=np.int64)
+    shift = np.zeros(len(offsets), dtype=np.int64)
+
+    with open(os.path.join(base.path, "extra.bin"), "rb") as src:
+        pos = 0
+        for row in sorted(updates):
+            a, b = int(offsets[row]), int(offsets[row + 1])
+            src.seek(pos)
+            out.write(src.read(a - pos))
+            data = json.dumps(updates[row], separators=(",", ":")).encode("utf-8") if updates[row] else b""
+            out.write(data)
+            shift[row + 1] += len(data) - (b - a)
+            pos = b
+        src.seek(pos)
+        shutil.copyfileobj(src, out)
+
+    return (offsets + np.cumsum(shift)).astype(np.uint64)
+
+
+def write_metadata_store(path: str, records, base=None, extra_updates: dict = None):
+    """
+    Write records (dicts with "url" and optional "phash", "source" and
+    extra fields) to a new store directory. If `base` is a
+    MetadataStore, its rows are copied first without decoding them, so
+    extending a store costs O(base bytes copied + new rows).
+    extra_updates ({base row: extra fields}) replaces the extra fields
+    of those base rows.
+    The base's urls.bin (and extra.bin, when no row's extras change) is
+    cloned and appended to, so on a filesystem with reflinks only the
+    small fixed-width columns are rewritten in full.
+    """
+    os.makedirs(path)
+    if base is not None:
+        clone_file(os.path.join(base.path, "urls.bin"), os.path.join(path, "urls.bin"))
+        if not extra_updates:
+            clone_file(os.path.join(base.path, "extra.bin"), os.path.join(path, "extra.bin"))
+
+    sources = list(base.sources) if base is not None else []
+    source_codes = {s: i for i, s in enumerate(sources)}
+
+    url_offsets, extra_offsets = array("Q"), array("Q")
+    phashes, has_phash, source_col = array("Q"), bytearray(), bytearray()
+
+    cloned_extra = base is not None and not extra_updates
+    with open(os.path.join(path, "urls.bin"), "ab" if base is not None else "wb") as uf, \
+            open(os.path.join(path, "extra.bin"), "ab" if cloned_extra else "wb") as ef:
+
+        base_extra_off = None
+        if cloned_extra:
+            base_extra_off = np.asarray(base._extra_offsets, dtype=np.uint64)
+        elif base is not None:
+            base_extra_off = _copy_extra(base, ef, extra_updates)
+        url_pos, extra_pos = uf.tell(), ef.tell()
+
+        for r in records:
+            url_offsets.append(url_pos)
+            url_pos += uf.write(r["url"].encode("utf-8"))
+
+            phash = r.get("phash")
+            phashes.append(int(phash, 16) if phash else 0)
+            has_phash.append(1 if phash else 0)
+
+            source = r.get("source") or infer_source(r["url"])
+            if source is None:
+                source_col.append(NO_SOURCE)
+            else:
+                if source not in source_codes:
+                    if len(sources) >= NO_SOURCE:
+                        raise ValueError("Too many distinct sources for the metadata store")
+                    source_codes[source] = len(sources)
+                    sources.append(source)
+                source_col.append(source_codes[source])
+
+            extra = {k: v for k, v in r.items() if k not in CORE_FIELDS}
+            extra_offsets.append(extra_pos)
+            if extra:
+                extra_pos += ef.write(json.dumps(extra, separators=(",", ":")).encode("utf-8"))
+
+        url_offsets.append(url_pos)
+        extra_offsets.append(extra_pos)
+
+    def column(new, dtype, base_col=None):
+        new = np.frombuffer(new, dtype=dtype) if len(new) else np.empty(0, dtype=dtype)
+        if base_col is None:
+            return new
+        return np.concatenate([np.asarray(base_col, dtype=dtype), new])
+
+    if base is not None:
+        # base offsets already end where the new rows start
+        url_off = np.concatenate([np.asarray(base._url_offsets[:-1]), np.frombuffer(url_offsets, dtype=np.uint64)])
+        extra_off = np.concatenate([base_extra_off[:-1], np.frombuffer(extra_offsets, dtype=np.uint64)])
+    else:
+        url_off = np.frombuffer(url_offsets, dtype=np.uint64)
+        extra_off = np.frombuffer(extra_offsets, dtype=np.uint64)
+
+    base_cols = (base.phash_codes, base.has_phash, base._source) if base is not None else (None, None, None)
+    np.save(os.path.join(path, "url_offsets.npy"), url_off)
+    np.save(os.path.join(path, "extra_offsets.npy"), extra_off)
+    np.save(os.path.join(path, "phash.npy"), column(phashes, np.uint64, base_cols[0]))
+    np.save(os.path.join(path, "has_phash.npy"), column(has_phash, np.uint8, base_cols[1]).astype(bool))
+    np.save(os.path.join(path, "source.npy"), column(source_col, np.uint8, base_cols[2]))
+
+    with open(os.path.join(path, HEADER_NAME), "w") as f:
+        json.dump({"format": FORMAT_VERSION, "rows": len(url_off) - 1, "sources": sources}, f)
+
+
+# -----------------------------
+# Reading
+# -----------------------------
+class MetadataStore:
+    """
+    Read-only view of a store directory. store[row] returns a dict like
+    the old metadata.json entries; url()/phash()/source() avoid even that.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(os.path.join(path, HEADER_NAME), "r") as f:
+            header = json.load(f)
+        if header.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported metadata store format {header.get('format')}")
+
+        self.sources = header["sources"]
+        self._rows = header["rows"]
+        self._urls = _load_blob(path, "urls.bin")
+        self._url_offsets = _load_column(path, "url_offsets.npy")
+        self._extra = _load_blob(path, "extra.bin")
+        self._extra_offsets = _load_column(path, "extra_offsets.npy")
+        self.phash_codes = _load_column(path, "phash.npy")
+        self.has_phash = _load_column(path, "has_phash.npy")
+        self._source = _load_column(path, "source.npy")
+
+    def __len__(self):
+        return self._rows
+
+    def _row(self, row) -> int:
+        row = int(row)
+        if row < 0:
+            row += self._rows
+        if not 0 <= row < self._rows:
+            raise IndexError(f"metadata row {row} out of range")
+        return row
+
+    def url(self, row) -> str:
+        row = self._row(row)
+        a, b = int(self._url_offsets[row]), int(self._url_offsets[row + 1])
+        return self._urls[a:b].tobytes().decode("utf-8")
+
+    def phash(self, row):
+        row = self._row(row)
+        return f"{int(self.phash_codes[row]):016x}" if self.has_phash[row] else None
+
+    def source(self, row):
+        code = int(self._source[self._row(row)])
+        return None if code == NO_SOURCE else self.sources[code]
+
+    def extra(self, row) -> dict:
+        row = self._row(row)
+        a, b = int(self._extra_offsets[row]), int(self._extra_offsets[row + 1])
+        return json.loads(self._extra[a:b].tobytes()) if b > a else {}
+
+    def __getitem__(self, row) -> dict:
+        item = {"url": self.url(row)}
+        phash = self.phash(row)
+        if phash:
+            item["phash"] = phash
+        source = self.source(row)
+        if source:
+            item["source"] = source
+        item.update(self.extra(row))
+        return item
+
+    def __iter__(self):
+        for row in range(self._rows):
+            yield self[row]
+
+    def urls(self):
+        for row in range(self._rows):
+            yield self.url(row)
+
+    def phash_rows(self):
+        """
+        (codes, rows) of every row that has a pHash.
+        """
+        rows = np.nonzero(np.asarray(self.has_phash))[0]
+        return np.asarray(self.phash_codes)[rows], rows
+
+    def alias_rows(self) -> dict:
+        """
+        {alias URL: first row} for the near-duplicate URLs collapsed
+        into rows.
+        """
+        # find the rows mentioning "aliases" in the raw bytes first,
+        # instead of decoding every row's extra fields
+        blob = self._extra.tobytes() if len(self._extra) else b""
+        positions, pos = [], blob.find(b'"aliases"')
+        while pos >= 0:
+            positions.append(pos)
+            pos = blob.find(b'"aliases"', pos + 1)
+        if not positions:
+            return {}
+
+        rows = np.searchsorted(np.asarray(self._extra_offsets, dtype=np.int64), positions, side="right") - 1
+        aliases = {}
+        for row in np.unique(rows).tolist():
+            for url in self.extra(row).get("aliases", ()):
+                aliases.setdefault(url, row)
+        return aliases
+
+
+class JsonMetadata(list):
+    """
+    In-memory metadata from an old metadata.json, with the same
+    accessors as MetadataStore.
+    """
+
+    def url(self, row) -> str:
+        return self[row]["url"]
+
+    def phash(self, row):
+        return self[row].get("phash")
+
+    def source(self, row):
+        return self[row].get("source") or infer_source(self[row]["url"])
+
+    def urls(self):
+        return (m["url"] for m in self)
+
+    def phash_rows(self):
+        rows = [i for i, m in enumerate(self) if m.get("phash")]
+        codes = np.array([int(self[i]["phash"], 16) for i in rows], dtype=np.uint64)
+        return codes, np.array(rows, dtype=np.int64)
+
+    def extra(self, row) -> dict:
+        return {k: v for k, v in self[row].items() if k not in CORE_FIELDS}
+
+    def alias_rows(self) -> dict:
+        return {url: i for i, m in enumerate(self) for url in m.get("aliases", ())}
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+if __name__ == "__main__":
+    # python -m face_engine.metadata_store migrate
+    if sys.argv[1:] != ["migrate"]:
+        raise SystemExit("usage: python -m face_engine.metadata_store migrate")
+
+    from face_engine.snapshot import migrate_json_metadata
+    migrate_json_metadata()
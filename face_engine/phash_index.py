@@ -0,0 +1,204 @@
+import numpy as np
+
+# -----------------------------
+# Packed pHash lookup
+# -----------------------------
+# pHashes are 64-bit, stored as uint64 codes. Lookups within a Hamming
+# radius use multi-index hashing: the code is split into 4 chunks of
+# 16 bits, and by pigeonhole any code within distance d of the query
+# has at least one chunk within d // 4 of the query's chunk. Each chunk
+# is kept sorted, so a probe is a binary search and only the few
+# candidates sharing a chunk get an exact popcount check.
+
+CHUNKS = 4
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# Below this size a straight vectorized scan is as fast as probing
+LINEAR_SCAN_BELOW = 65536
+
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def phash_to_int(h: str) -> int:
+    return int(h, 16)
+
+
+def popcount64(x: np.ndarray) -> np.ndarray:
+    """
+    Number of set bits per element of a uint64 array.
+    """
+    x = np.ascontiguousarray(x, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x).astype(np.int64)
+    return _BYTE_POPCOUNT[x.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int64)
+
+
+def _flip_masks(radius: int) -> np.ndarray:
+    """
+    All 16-bit masks with at most `radius` bits set.
+    """
+    masks = np.arange(1 << CHUNK_BITS, dtype=np.uint32)
+    counts = _BYTE_POPCOUNT[masks & 0xFF] + _BYTE_POPCOUNT[masks >> 8]
+    return masks[counts <= radius]
+
+
+class PHashIndex:
+    """
+    codes[i] is the pHash of metadata row rows[i].
+    """
+
+    def __init__(self, codes: np.ndarray, rows: np.ndarray, chunk_keys=None, chunk_order=None):
+        self.codes = np.ascontiguousarray(codes, dtype=np.uint64)
+        self.rows = np.ascontiguousarray(rows, dtype=np.int64)
+
+        if chunk_keys is None or chunk_order is None:
+            chunk_keys, chunk_order = [], []
+            for c in range(CHUNKS):
+                keys = ((self.codes >> np.uint64(c * CHUNK_BITS)) & np.uint64(CHUNK_MASK)).astype(np.uint16)
+                order = np.argsort(keys, kind="stable").astype(np.int64)
+                chunk_keys.append(keys[order])
+                chunk_order.append(order)
+
+        self.chunk_keys = list(chunk_keys)
+        self.chunk_order = list(chunk_order)
+        self._masks = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    # -----------------------------
+    # Build / persist
+    # -----------------------------
+    @classmethod
+    def build(cls, phashes):
+        """
+        phashes: one hex string (or None) per metadata row.
+        """
+        rows = [i for i, h in enumerate(phashes) if h]
+        codes = np.array([phash_to_int(phashes[i]) for i in rows], dtype=np.uint64)
+        return cls(codes, np.array(rows, dtype=np.int64))
+
+    def extend(self, codes: np.ndarray, rows: np.ndarray):
+        """
+        New index with (codes, rows) added. The sorted chunk tables are
+        merged rather than re-sorted, so appending m codes to n costs
+        O(n + m log m).
+        """
+        codes = np.ascontiguousarray(codes, dtype=np.uint64)
+        if not len(codes):
+            return self
+
+        offset = len(self.codes)
+        chunk_keys, chunk_order = [], []
+        for c in range(CHUNKS):
+            keys = ((codes >> np.uint64(c * CHUNK_BITS)) & np.uint64(CHUNK_MASK)).astype(np.uint16)
+            order = np.argsort(keys, kind="stable").astype(np.int64)
+            # after equal old keys, so the merge stays stable
+            at = np.searchsorted(self.chunk_keys[c], keys[order], side="right")
+            chunk_keys.append(np.insert(self.chunk_keys[c], at, keys[order]))
+            chunk_order.append(np.insert(self.chunk_order[c], at, order + offset))
+
+        return PHashIndex(
+            np.concatenate([self.codes, codes]),
+            np.concatenate([self.rows, np.asarray(rows, dtype=np.int64)]),
+            chunk_keys,
+            chunk_order
+        )
+
+    def save(self, path: str):
+        arrays = {"codes": self.codes, "rows": self.rows}
+        for c in range(CHUNKS):
+            arrays[f"keys_{c}"] = self.chunk_keys[c]
+            arrays[f"order_{c}"] = self.chunk_order[c]
+
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(
+                data["codes"],
+                data["rows"],
+                [data[f"keys_{c}"] for c in range(CHUNKS)],
+                [data[f"order_{c}"] for c in range(CHUNKS)],
+            )
+
+    # -----------------------------
+    # Lookup
+    # -----------------------------
+    def _candidates(self, query: int, threshold: int) -> np.ndarray:
+        radius = threshold // CHUNKS
+        masks = self._masks.get(radius)
+        if masks is None:
+            masks = self._masks[radius] = _flip_masks(radius)
+
+        found = []
+        for c in range(CHUNKS):
+            key = (query >> (c * CHUNK_BITS)) & CHUNK_MASK
+            probes = (masks ^ key).astype(np.uint16)
+
+            lo = np.searchsorted(self.chunk_keys[c], probes, side="left")
+            hi = np.searchsorted(self.chunk_keys[c], probes, side="right")
+            for a, b in zip(lo[hi > lo], hi[hi > lo]):
+                found.append(self.chunk_order[c][a:b])
+
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def search(self, query, threshold: int):
+        """
+        Rows within `threshold` bits of the query hash (hex str or int).
+        Returns [(row, distance)] sorted by distance.
+        """
+        if not len(self.codes):
+            return []
+
+        q = phash_to_int(query) if isinstance(query, str) else int(query)
+
+        if len(self.codes) < LINEAR_SCAN_BELOW or threshold >= CHUNKS * 4:
+            dists = popcount64(self.codes ^ np.uint64(q))
+            keep = np.nonzero(dists <= threshold)[0]
+            rows, dists = self.rows[keep], dists[keep]
+        else:
+            candidates = self._candidates(q, threshold)
+            if not len(candidates):
+                return []
+            dists = popcount64(self.codes[candidates] ^ np.uint64(q))
+            keep = dists <= threshold
+            rows, dists = self.rows[candidates[keep]], dists[keep]
+
+        return sorted(zip(rows.tolist(), dists.tolist()), key=lambda x: x[1])
+
+    def search_batch(self, queries, threshold: int):
+        """
+        search() for many query hashes at once. Returns one hit list per
+        query. Small corpora are scanned as one (queries x corpus) XOR +
+        popcount matrix; large ones probe the multi-index per query.
+        """
+        if not len(self.codes) or not len(queries):
+            return [[] for _ in queries]
+
+        if len(self.codes) >= LINEAR_SCAN_BELOW and threshold < CHUNKS * 4:
+            return [self.search(q, threshold) for q in queries]
+
+        q = np.array(
+            [phash_to_int(h) if isinstance(h, str) else int(h) for h in queries],
+            dtype=np.uint64
+        )
+
+        results = []
+        # bound the matrix to ~4M cells
+        step = max(1, (1 << 22) // len(self.codes))
+        for start in range(0, len(q), step):
+            block = q[start:start + step, None] ^ self.codes[None, :]
+            dists = popcount64(block.ravel()).reshape(block.shape)
+
+            for row_dists in dists:
+                keep = np.nonzero(row_dists <= threshold)[0]
+                hits = zip(self.rows[keep].tolist(), row_dists[keep].tolist())
+                results.append(sorted(hits, key=lambda x: x[1]))
+
+        return results
@@ -0,0 +1,212 @@
+import queue
+import threading
+import time
+from collections import Counter
+
+# -----------------------------
+# Staged, bounded worker pipeline
+# -----------------------------
+# Each stage is a pool of threads reading jobs (dicts) from a bounded
+# queue, transforming them and handing them to the next stage. Bounded
+# queues give backpressure: fast downloaders block instead of piling up
+# decoded images in memory while the embedder catches up.
+
+_SENTINEL = object()
+
+
+class Rejected(Exception):
+    """
+    Raised by a stage to drop a job for an expected reason
+    (e.g. no face found). Counted separately from failures.
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class StageStats:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.processed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, outcome: str):
+        with self._lock:
+            self.busy_seconds += elapsed
+            if outcome == "ok":
+                self.processed += 1
+            elif outcome == "rejected":
+                self.rejected += 1
+            else:
+                self.failed += 1
+
+    def as_dict(self, wall_seconds: float) -> dict:
+        handled = self.processed + self.rejected + self.failed
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "per_second": round(handled / wall_seconds, 2) if wall_seconds else 0.0,
+            "avg_ms": round(self.busy_seconds / handled * 1000, 2) if handled else 0.0,
+        }
+
+
+class Pipeline:
+    """
+    stages: list of (name, func, workers). func(job) returns the job
+    to forward, raises Rejected to drop it, or raises any other
+    exception to count it as failed.
+    """
+
+    def __init__(self, stages, queue_size: int = 64, log_prefix: str = "[PIPELINE]", log_every: int = 100):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+
+        self.stages = [(name, func, max(1, int(workers))) for name, func, workers in stages]
+        self.queue_size = max(1, int(queue_size))
+        self.log_prefix = log_prefix
+        self.log_every = log_every
+
+        self.stats = {name: StageStats(name, workers) for name, _, workers in self.stages}
+        self.rejections = Counter()
+        self.failures = 0
+        self.dropped = []
+        self._finished = 0
+        self._total = 0
+        self._lock = threading.Lock()
+
+    # -----------------------------
+    # Bookkeeping
+    # -----------------------------
+    def _job_done(self):
+        with self._lock:
+            self._finished += 1
+            finished = self._finished
+
+        if self.log_every and finished % self.log_every == 0:
+            print(f"{self.log_prefix} ({finished}/{self._total}) processed")
+
+    def _reject(self, job, reason: str):
+        with self._lock:
+            self.rejections[reason] += 1
+            self.dropped.append((job.get("pos"), reason))
+        self._job_done()
+
+    def _fail(self, job, stage: str, error: Exception):
+        with self._lock:
+            self.failures += 1
+            self.dropped.append((job.get("pos"), "failed"))
+        print(f"{self.log_prefix} {stage} failed — {error}")
+        self._job_done()
+
+    # -----------------------------
+    # Workers
+    # -----------------------------
+    def _worker(self, stage_idx, in_q, out_q, remaining, next_workers):
+        name, func, _ = self.stages[stage_idx]
+        stats = self.stats[name]
+        is_last = stage_idx == len(self.stages) - 1
+
+        while True:
+            job = in_q.get()
+            if job is _SENTINEL:
+                break
+
+            start = time.perf_counter()
+            try:
+                job = func(job)
+            except Rejected as e:
+                stats.record(time.perf_counter() - start, "rejected")
+                self._reject(job, e.reason)
+                continue
+            except Exception as e:
+                stats.record(time.perf_counter() - start, "failed")
+                self._fail(job, name, e)
+                continue
+
+            stats.record(time.perf_counter() - start, "ok")
+            if is_last:
+                self._job_done()
+            out_q.put(job)
+
+        # Last worker of this stage closes the next one
+        with self._lock:
+            remaining[stage_idx] -= 1
+            closing = remaining[stage_idx] == 0
+
+        if closing:
+            for _ in range(next_workers):
+                out_q.put(_SENTINEL)
+
+    def _feed(self, jobs, first_q, first_workers):
+        for job in jobs:
+            first_q.put(job)
+        for _ in range(first_workers):
+            first_q.put(_SENTINEL)
+
+    # -----------------------------
+    # Run
+    # -----------------------------
+    def run(self, jobs: list) -> tuple[list, dict]:
+        """
+        Push jobs through every stage.
+        Returns (completed jobs, report). Dropped jobs are listed in
+        self.dropped as (job["pos"], reason) pairs.
+        """
+        self._total = len(jobs)
+        started = time.perf_counter()
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results_q = queue.Queue()
+        queues.append(results_q)
+
+        remaining = [workers for _, _, workers in self.stages]
+        threads = []
+
+        for i, (name, _, workers) in enumerate(self.stages):
+            next_workers = self.stages[i + 1][2] if i + 1 < len(self.stages) else 1
+            for w in range(workers):
+                t = threading.Thread(
+                    target=self._worker,
+                    args=(i, queues[i], queues[i + 1], remaining, next_workers),
+                    name=f"{name}-{w}",
+                    daemon=True
+                )
+                t.start()
+                threads.append(t)
+
+        feeder = threading.Thread(
+            target=self._feed,
+            args=(jobs, queues[0], self.stages[0][2]),
+            daemon=True
+        )
+        feeder.start()
+
+        completed = []
+        while True:
+            job = results_q.get()
+            if job is _SENTINEL:
+                break
+            completed.append(job)
+
+        feeder.join()
+        for t in threads:
+            t.join()
+
+        wall = time.perf_counter() - started
+        report = {
+            "total": len(jobs),
+            "completed": len(completed),
+            "rejected": dict(self.rejections),
+            "failed": self.failures,
+            "elapsed_seconds": round(wall, 3),
+            "stages": {name: s.as_dict(wall) for name, s in self.stats.items()},
+        }
+        return completed, report
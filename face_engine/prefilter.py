@@ -0,0 +1,127 @@
+import random
+import cv2
+
+from config import (
+    PREFILTER_MIN_BYTES,
+    PREFILTER_MIN_SIDE,
+    PREFILTER_MAX_ASPECT,
+    PREFILTER_OPENCV_MAX_SIDE,
+    PREFILTER_AUDIT_RATE
+)
+from face_engine.detector import has_face
+from face_engine.pipeline import Rejected
+
+# -----------------------------
+# Pre-filter cascade
+# -----------------------------
+# Cheap checks that drop crawled images before RetinaFace + Facenet512:
+#
+#   sanity   file size and format signature (before decode), then
+#            pixel size and aspect ratio (after decode); microseconds
+#   opencv   Haar cascade face check on a downscaled copy; ~10-30 ms
+#
+# Each check raises Rejected with its own reason, so the pipeline report
+# gives per-check counts. A small PREFILTER_AUDIT_RATE share of OpenCV
+# rejects is still sent to RetinaFace, to measure how many real faces
+# the cheap detector misses at the current settings.
+
+SANITY_REASONS = ("file_too_small", "bad_format", "too_small", "bad_aspect")
+OPENCV_REASON = "opencv_no_face"
+
+_SIGNATURES = (
+    b"\xff\xd8\xff",        # JPEG
+    b"\x89PNG\r\n\x1a\n",   # PNG
+    b"GIF87a", b"GIF89a",
+    b"BM",                  # BMP
+)
+
+
+def _known_format(data: bytes) -> bool:
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return True
+    return data.startswith(_SIGNATURES)
+
+
+def check_bytes(data: bytes):
+    """
+    Before decoding: tiny files (tracking pixels, placeholders) and
+    non-image responses (HTML error pages).
+    """
+    if len(data) < PREFILTER_MIN_BYTES:
+        raise Rejected("file_too_small")
+    if not _known_format(data):
+        raise Rejected("bad_format")
+
+
+def check_image(img):
+    """
+    After decoding: too small to hold a usable face, or a banner/strip.
+    """
+    h, w = img.shape[:2]
+    if min(h, w) < PREFILTER_MIN_SIDE:
+        raise Rejected("too_small")
+    if max(h, w) / min(h, w) > PREFILTER_MAX_ASPECT:
+        raise Rejected("bad_aspect")
+
+
+def check_opencv(img) -> bool:
+    """
+    Raise Rejected unless the OpenCV detector finds a face.
+    Returns True when the image only passes as an audit sample.
+    Detector errors let the image through, since RetinaFace decides anyway.
+    """
+    h, w = img.shape[:2]
+    scale = PREFILTER_OPENCV_MAX_SIDE / max(h, w)
+    small = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA) if scale < 1 else img
+
+    try:
+        found = has_face(small)
+    except Exception as e:
+        print(f"[PREFILTER] OpenCV check failed, passing image through — {e}")
+        return False
+
+    if found:
+        return False
+    if PREFILTER_AUDIT_RATE and random.random() < PREFILTER_AUDIT_RATE:
+        return True
+    raise Rejected(OPENCV_REASON)
+
+
+def cascade_report(report: dict, audited: int = 0, audit_missed: int = 0) -> dict:
+    """
+    Pass/reject counts per check, the embedding time the rejects
+    avoided and what the OpenCV check cost, from a run_ingestion
+    pipeline report. The two are kept apart: on small or face-heavy
+    batches the check can cost more than it avoids.
+    """
+    rejected = report["rejected"]
+    stages = report["stages"]
+
+    sanity = {r: rejected.get(r, 0) for r in SANITY_REASONS}
+    opencv = stages.get("prefilter")
+    embed = stages["embed"]
+
+    skipped = sum(sanity.values()) + rejected.get(OPENCV_REASON, 0)
+    # what the dropped images would have cost at the embed stage's average
+    avoided = skipped * embed["avg_ms"] / 1000
+
+    result = {
+        "sanity": {
+            "passed": stages["decode"]["processed"],
+            "rejected": sanity,
+        },
+        "skipped_embedding": skipped,
+        "embedding_seconds_avoided": round(avoided, 2),
+    }
+    if opencv:
+        result["opencv"] = {
+            "passed": opencv["processed"] - audited,
+            "rejected": rejected.get(OPENCV_REASON, 0),
+            "avg_ms": opencv["avg_ms"],
+            "cost_seconds": round(opencv["busy_seconds"], 2),
+        }
+        if audited:
+            result["opencv"]["audited"] = audited
+            result["opencv"]["audit_missed_faces"] = audit_missed
+            result["opencv"]["estimated_miss_rate"] = round(audit_missed / audited, 3)
+    return result
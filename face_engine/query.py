@@ -0,0 +1,229 @@
+import io
+import time
+import numpy as np
+import cv2
+import faiss
+from PIL import Image
+
+from config import (
+    QUERY_DETECT_MAX_SIDE,
+    QUERY_CROP_MARGIN,
+    QUERY_CROP_MAX_SIDE
+)
+from face_engine.backends import get_backend
+
+# -----------------------------
+# Query pipeline: decode → detect + align → embed
+# -----------------------------
+# The aligned crop the detector returns goes straight to the embedding
+# model, so no second detector runs over the whole image. Both steps go
+# through the configured embedding backend (see face_engine/backends.py).
+#
+# Large uploads (phone photos are 12+ MP) are not detected at full
+# resolution: JPEGs are decoded at 1/2, 1/4 or 1/8 scale by libjpeg
+# (IMREAD_REDUCED_COLOR_*) and shrunk to QUERY_DETECT_MAX_SIDE. Once a
+# single face is found, the region around it is cut from the image at
+# native resolution and detected + aligned again. That crop is small, so
+# the second pass is cheap, and the embedding sees native pixels. The
+# crop is only decoded as finely as QUERY_CROP_MAX_SIDE needs, so a face
+# filling a 12 MP frame does not cost a full decode either.
+
+_REDUCED_DECODE = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    1: cv2.IMREAD_COLOR,
+}
+# a reduced decode may land this much under its target (4032 px / 4 = 1008)
+_DECODE_SLACK = 0.75
+
+
+def bytes_to_image(image_bytes):
+    arr = np.frombuffer(image_bytes, np.uint8)
+    return cv2.imdecode(arr, cv2.IMREAD_COLOR)
+
+
+def image_size(image_bytes):
+    """
+    (width, height) from the image header only, or None.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as im:
+            return im.size
+    except Exception:
+        return None
+
+
+def _reduction_for(long_edge: int, target: int) -> int:
+    """
+    Coarsest libjpeg scale (8, 4, 2 or 1) that still decodes `long_edge`
+    pixels to about `target` or more.
+    """
+    for factor in (8, 4, 2):
+        if long_edge / factor >= target * _DECODE_SLACK:
+            return factor
+    return 1
+
+
+def decode_reduced(image_bytes, factor: int):
+    """
+    Decode at 1/factor of the native size (JPEG: inside libjpeg; other
+    formats are decoded fully and resized by OpenCV).
+    """
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), _REDUCED_DECODE.get(factor, cv2.IMREAD_COLOR))
+
+
+def _shrink(img, max_side: int):
+    h, w = img.shape[:2]
+    if not max_side or max(h, w) <= max_side:
+        return img
+    s = max_side / max(h, w)
+    return cv2.resize(img, (max(round(w * s), 1), max(round(h * s), 1)), interpolation=cv2.INTER_AREA)
+
+
+def decode_for_detection(image_bytes, max_side: int = None):
+    """
+    (image, scale): the upload decoded with its long edge at most
+    `max_side` (default QUERY_DETECT_MAX_SIDE, 0 = full resolution),
+    using libjpeg's reduced decoding where the image is large enough.
+    scale = detection pixels per native pixel (1.0 when not reduced).
+    """
+    max_side = QUERY_DETECT_MAX_SIDE if max_side is None else max_side
+    size = image_size(image_bytes)
+    if not max_side or size is None or max(size) <= max_side:
+        return bytes_to_image(image_bytes), 1.0
+
+    long_edge = max(size)
+    img = decode_reduced(image_bytes, _reduction_for(long_edge, max_side))
+    if img is None:
+        return None, 1.0
+
+    img = _shrink(img, max_side)
+    return img, max(img.shape[:2]) / long_edge
+
+
+def _native_area(area: dict, scale: float) -> dict:
+    """
+    A facial_area from the reduced image in native pixel coordinates.
+    """
+    out = dict(area or {})
+    for key in ("x", "y", "w", "h"):
+        if key in out:
+            out[key] = int(round(out[key] / scale))
+    for key in ("left_eye", "right_eye"):
+        if out.get(key) is not None:
+            out[key] = tuple(int(round(v / scale)) for v in out[key])
+    return out
+
+
+def native_crop(img, area: dict, margin: float = None, max_side: int = None, factor: int = 1):
+    """
+    The face region (`area` in native pixels) with `margin` (share of
+    the face size) of context on every side, shrunk to `max_side`.
+    `img` may be decoded at 1/factor of the native size.
+    """
+    margin = QUERY_CROP_MARGIN if margin is None else margin
+    h, w = img.shape[:2]
+    pad_x, pad_y = area["w"] * margin, area["h"] * margin
+    x0, y0 = max(int((area["x"] - pad_x) / factor), 0), max(int((area["y"] - pad_y) / factor), 0)
+    x1 = min(int((area["x"] + area["w"] + pad_x) / factor), w)
+    y1 = min(int((area["y"] + area["h"] + pad_y) / factor), h)
+    return _shrink(img[y0:y1, x0:x1], QUERY_CROP_MAX_SIDE if max_side is None else max_side)
+
+
+def detect_faces(img):
+    """
+    Detected and aligned faces, each a dict with "face" (BGR uint8 crop)
+    and "facial_area".
+    """
+    return get_backend().detect(img)
+
+
+def embed_face(face):
+    """
+    Embed an aligned face crop without running detection again.
+    """
+    return get_backend().embed([face])[0]
+
+
+def _check_deadline(deadline):
+    if deadline is not None and time.time() > deadline:
+        raise TimeoutError("query deadline exceeded")
+
+
+def embed_query(image_bytes, img=None, deadline=None, max_side: int = None):
+    """
+    Single-face query embedding.
+    Returns (embedding or None, info) where embedding is a normalized
+    (1, 512) float32 row and info has "faces" (number detected),
+    "timings" (ms per stage) and "scale" (detection / native pixels).
+    "crop_fallback" says why the native re-crop was not used, if it
+    was attempted and failed ("decode_failed" | "no_face_in_crop").
+    `deadline` (epoch seconds) is checked between stages; past it the
+    remaining work is skipped with TimeoutError.
+    `max_side` overrides QUERY_DETECT_MAX_SIDE (0 = full resolution).
+    """
+    timings = {}
+    _check_deadline(deadline)
+
+    start = time.perf_counter()
+    if img is None:
+        small, scale = decode_for_detection(image_bytes, max_side)
+    else:
+        limit = QUERY_DETECT_MAX_SIDE if max_side is None else max_side
+        small = _shrink(img, limit)
+        scale = max(small.shape[:2]) / max(img.shape[:2])
+    timings["decode"] = (time.perf_counter() - start) * 1000
+
+    if small is None:
+        return None, {"faces": 0, "timings": timings}
+
+    _check_deadline(deadline)
+    start = time.perf_counter()
+    faces = detect_faces(small)
+    timings["detect"] = (time.perf_counter() - start) * 1000
+
+    # ❗ single-face enforcement
+    if len(faces) != 1:
+        return None, {"faces": len(faces), "timings": timings, "scale": scale}
+
+    face = faces[0]["face"]
+    area = faces[0]["facial_area"]
+    fallback = None
+
+    if scale < 1.0 and area:
+        # re-crop and re-align at native resolution
+        _check_deadline(deadline)
+        start = time.perf_counter()
+        area = _native_area(area, scale)
+        if img is not None:
+            crop = native_crop(img, area)
+        else:
+            # finest decode the crop can use: past QUERY_CROP_MAX_SIDE it is shrunk anyway
+            region = max(area["w"], area["h"]) * (1 + 2 * QUERY_CROP_MARGIN)
+            factor = _reduction_for(region, QUERY_CROP_MAX_SIDE)
+            native = decode_reduced(image_bytes, factor)
+            crop = None if native is None else native_crop(native, area, factor=factor)
+
+        # otherwise the face from the reduced-resolution pass is embedded
+        if crop is None or crop.size == 0:
+            fallback = "decode_failed"
+        else:
+            refined = detect_faces(crop)
+            if refined:
+                # the margin may catch part of a neighbour: keep the largest
+                face = max(refined, key=lambda f: f["face"].shape[0] * f["face"].shape[1])["face"]
+            else:
+                fallback = "no_face_in_crop"
+        timings["crop_fallback" if fallback else "crop"] = (time.perf_counter() - start) * 1000
+
+    _check_deadline(deadline)
+    start = time.perf_counter()
+    emb = embed_face(face).reshape(1, -1)
+    faiss.normalize_L2(emb)
+    timings["embed"] = (time.perf_counter() - start) * 1000
+
+    info = {"faces": 1, "timings": timings, "facial_area": area, "scale": scale}
+    if fallback:
+        info["crop_fallback"] = fallback
+    return emb, info
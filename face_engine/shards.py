@@ -0,0 +1,475 @@
+import os
+import json
+import time
+import argparse
+import threading
+from abc import ABC, abstractmethod
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import faiss
+import requests
+
+from config import (
+    SHARD_WORKERS,
+    SHARD_REMOTE_URLS,
+    SHARD_TIMEOUT_SECONDS
+)
+from crawler.segment_log import url_hash
+from face_engine.ann import build_index, configure_search, index_type_of, search_reranked, storage_of
+
+# -----------------------------
+# Sharded vector index
+# -----------------------------
+# With INDEX_SHARDS > 1 a snapshot holds its FAISS index as N shards
+# instead of one faiss.index:
+#
+#   shards/shard-000/   faiss.index, ids.npy (global row of each vector)
+#
+# float16 / sq8 shards re-rank against the snapshot's global
+# face_embeddings.npy, memory-mapped and read through ids.npy, so the
+# float32 vectors are stored once (shards written before this kept a
+# private copy in shard-NNN/face_embeddings.npy, which is still used).
+#
+# Rows are split by URL hash (all faces of an image land on the same
+# shard, appends spread evenly) or by row-id range (appends go to the
+# last shard). Metadata, pHash index and the global embeddings file stay
+# whole; only vector search is scattered. A shard server therefore needs
+# the snapshot's face_embeddings.npy next to its shard directory.
+#
+# The search API sends each query to every shard in parallel, either to
+# one local worker process per shard or to shard servers over HTTP
+# (`python -m face_engine.shards serve`), and merges the per-shard
+# top-k into one ranking. Shards that fail or miss SHARD_TIMEOUT_SECONDS
+# are left out: the response is flagged as degraded instead of failing.
+
+SHARDS_NAME = "shards"
+SHARD_INDEX_NAME = "faiss.index"
+SHARD_IDS_NAME = "ids.npy"
+SHARD_EMBEDDINGS_NAME = "face_embeddings.npy"   # older shards only
+GLOBAL_EMBEDDINGS_NAME = "face_embeddings.npy"
+PARTITIONS = ("hash", "range")
+
+
+def shard_path(snapshot_dir: str, shard: int) -> str:
+    return os.path.join(snapshot_dir, SHARDS_NAME, f"shard-{shard:03d}")
+
+
+def partition_rows(urls: list, count: int, partition: str, first_row: int = 0) -> list:
+    """
+    Global row ids (first_row + position) of each shard, ascending.
+    """
+    rows = np.arange(first_row, first_row + len(urls), dtype="int64")
+    if partition == "hash":
+        owner = np.array([url_hash(u) % count for u in urls], dtype="int64")
+        return [rows[owner == s] for s in range(count)]
+    if partition == "range":
+        return np.array_split(rows, count)
+    raise ValueError(f"Unknown shard partition '{partition}' (expected one of {PARTITIONS})")
+
+
+def _write_shard(path: str, index, ids: np.ndarray):
+    os.makedirs(path, exist_ok=True)
+    faiss.write_index(index, os.path.join(path, SHARD_INDEX_NAME))
+    np.save(os.path.join(path, SHARD_IDS_NAME), ids)
+
+
+class ShardWriter(ABC):
+    """
+    Stands in for a FAISS index when a snapshot is saved: write(staging)
+    writes the shards and returns the manifest info for them.
+    """
+    ntotal = 0
+
+    @abstractmethod
+    def write(self, staging: str) -> dict:
+        ...
+
+
+class ShardedBuild(ShardWriter):
+    """
+    Fresh shards from normalized embeddings (row i belongs to urls[i]).
+    Shards are built and written one at a time.
+    """
+
+    def __init__(self, embeddings: np.ndarray, urls: list, count: int, partition: str,
+                 index_type: str = None, storage: str = None):
+        self.embeddings = embeddings
+        self.parts = partition_rows(urls, count, partition)
+        self.partition = partition
+        self.index_type = index_type
+        self.storage = storage
+        self.ntotal = len(embeddings)
+
+    def write(self, staging: str) -> dict:
+        sizes, index = [], None
+        for shard, rows in enumerate(self.parts):
+            vectors = np.ascontiguousarray(self.embeddings[rows])
+            index = build_index(vectors, index_type=self.index_type, storage=self.storage)
+            _write_shard(shard_path(staging, shard), index, rows)
+            sizes.append(len(rows))
+            print(f"[SHARDS] Shard {shard}: {len(rows)} vectors ({index_type_of(index)}, {storage_of(index)})")
+
+        return {
+            "vectors": self.ntotal,
+            "index_type": index_type_of(index),
+            "storage": storage_of(index),
+            "shards": {"count": len(self.parts), "partition": self.partition, "sizes": sizes},
+        }
+
+
+class ShardedAppend(ShardWriter):
+    """
+    The base snapshot's shards plus new rows, partitioned the same way.
+    Each base shard keeps its index type (and training).
+    """
+
+    def __init__(self, base, new_embeddings: np.ndarray, new_urls: list):
+        self.base = base
+        self.layout = base.manifest["shards"]
+        self.embeddings = new_embeddings
+        self.parts = partition_rows(new_urls, self.layout["count"], self.layout["partition"], first_row=base.size)
+        if self.layout["partition"] == "range":
+            # row ids only grow: everything new goes to the last shard
+            self.parts = [np.array([], dtype="int64")] * (len(self.parts) - 1) + [np.concatenate(self.parts)]
+        self.ntotal = base.size + len(new_embeddings)
+
+    def write(self, staging: str) -> dict:
+        sizes, index = [], None
+        for shard, rows in enumerate(self.parts):
+            src = shard_path(self.base.path, shard)
+            index = faiss.read_index(os.path.join(src, SHARD_INDEX_NAME))
+            ids = np.load(os.path.join(src, SHARD_IDS_NAME))
+            vectors = self.embeddings[rows - self.base.size]
+
+            if len(rows):
+                index.add(vectors)
+                ids = np.concatenate([ids, rows])
+
+            _write_shard(shard_path(staging, shard), index, ids)
+            sizes.append(len(ids))
+
+        return {
+            "vectors": self.ntotal,
+            "index_type": index_type_of(index),
+            "storage": storage_of(index),
+            "shards": {**self.layout, "sizes": sizes},
+        }
+
+
+# -----------------------------
+# Searching one shard
+# -----------------------------
+class _ShardRows:
+    """
+    The shard's rows of the global embeddings: local row i is global
+    row ids[i]. Only what search_reranked() needs (len, fancy indexing).
+    """
+
+    def __init__(self, vectors, ids: np.ndarray):
+        self.vectors = vectors
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, rows):
+        return self.vectors[self.ids[rows]]
+
+
+class Shard:
+    """
+    One loaded shard; search() answers with global row ids.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index = faiss.read_index(os.path.join(path, SHARD_INDEX_NAME))
+        self.ids = np.load(os.path.join(path, SHARD_IDS_NAME))
+        self.storage = storage_of(self.index)
+        self.vectors = None
+        if self.storage != "float32":
+            own = os.path.join(path, SHARD_EMBEDDINGS_NAME)
+            shared = os.path.join(os.path.dirname(os.path.dirname(path)), GLOBAL_EMBEDDINGS_NAME)
+            if os.path.exists(own):
+                self.vectors = np.load(own, mmap_mode="r")
+            elif os.path.exists(shared):
+                self.vectors = _ShardRows(np.load(shared, mmap_mode="r"), self.ids)
+        configure_search(self.index)
+
+    def search(self, queries: np.ndarray, k: int):
+        k = min(k, self.index.ntotal)
+        if k == 0:
+            return np.zeros((len(queries), 0), dtype="float32"), np.zeros((len(queries), 0), dtype="int64")
+        scores, local = search_reranked(self.index, self.vectors, queries, k, storage=self.storage)
+        return scores, np.where(local >= 0, self.ids[np.maximum(local, 0)], -1)
+
+
+def merge_topk(results: list, k: int, n_queries: int):
+    """
+    Global top-k from per-shard (scores, ids) pairs.
+    """
+    results = [r for r in results if r[0].shape[1]]
+    if not results:
+        return np.full((n_queries, k), -np.inf, dtype="float32"), np.full((n_queries, k), -1, dtype="int64")
+
+    scores = np.hstack([s for s, _ in results])
+    ids = np.hstack([i for _, i in results])
+    scores = np.where(ids >= 0, scores, -np.inf)
+
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    scores = np.take_along_axis(scores, order, axis=1)
+    ids = np.take_along_axis(ids, order, axis=1)
+
+    if scores.shape[1] < k:
+        pad = k - scores.shape[1]
+        scores = np.pad(scores, ((0, 0), (0, pad)), constant_values=-np.inf)
+        ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=-1)
+    return scores.astype("float32"), ids
+
+
+# -----------------------------
+# Local shard workers (one process per shard)
+# -----------------------------
+# Shard processes are spawned, so each one re-imports the app's main
+# module. Nothing on that import path may load state: the search API
+# loads the index only in the parent process, and the crawler's URL
+# set, journal, segment log and rate limiter are created on first use
+# (crawler.crawler.get_*). A shard process only ever opens its shard.
+_worker_shard = None
+
+
+def _init_shard_worker(path: str):
+    global _worker_shard
+    _worker_shard = Shard(path)
+
+
+def _search_task(queries, k):
+    return _worker_shard.search(queries, k)
+
+
+class _LocalShard:
+    def __init__(self, path: str):
+        self.name = path
+        self._executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_shard_worker,
+            initargs=(path,)
+        )
+
+    def submit(self, version: str, queries: np.ndarray, k: int):
+        return self._executor.submit(_search_task, queries, k)
+
+    def close(self):
+        # queries already handed over still finish
+        self._executor.shutdown(wait=False)
+
+
+# -----------------------------
+# Remote shards (HTTP stand-in for shard nodes)
+# -----------------------------
+_rpc_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="shard-rpc")
+
+
+class _RemoteShard:
+    def __init__(self, url: str, shard: int, timeout: float):
+        self.name = url
+        self.url = url.rstrip("/")
+        self.shard = shard
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def _call(self, version: str, queries: np.ndarray, k: int):
+        r = self._session.post(
+            f"{self.url}/search",
+            json={"version": version, "shard": self.shard, "k": k, "queries": queries.tolist()},
+            timeout=self.timeout
+        )
+        r.raise_for_status()
+        body = r.json()
+        return np.array(body["scores"], dtype="float32"), np.array(body["ids"], dtype="int64")
+
+    def submit(self, version: str, queries: np.ndarray, k: int):
+        return _rpc_pool.submit(self._call, version, queries, k)
+
+    def close(self):
+        self._session.close()
+
+
+class ShardedSearcher:
+    """
+    Scatter a query to every shard of a snapshot, gather and merge.
+    """
+
+    def __init__(self, snapshot, workers: str = None, remote_urls: list = None, timeout: float = None):
+        self.version = snapshot.version
+        self.count = snapshot.manifest["shards"]["count"]
+        self.workers = workers or SHARD_WORKERS
+        self.timeout = SHARD_TIMEOUT_SECONDS if timeout is None else timeout
+
+        if self.workers == "local":
+            self._shards = [_LocalShard(shard_path(snapshot.path, s)) for s in range(self.count)]
+        elif self.workers == "remote":
+            urls = list(remote_urls if remote_urls is not None else SHARD_REMOTE_URLS)
+            if len(urls) != self.count:
+                print(f"[SHARDS] ⚠️ {self.count} shards but {len(urls)} SHARD_REMOTE_URLS; the rest count as missing")
+            self._shards = [
+                _RemoteShard(urls[s], s, self.timeout) if s < len(urls) else None
+                for s in range(self.count)
+            ]
+        else:
+            raise ValueError(f"Unknown SHARD_WORKERS '{self.workers}' (local | remote)")
+
+        print(f"[SHARDS] Searching {self.count} shards of {self.version} ({self.workers})")
+
+    def warm_up(self, dim: int, timeout: float = 120.0):
+        """
+        Start the workers / have the nodes load this version before
+        the first real query, which would otherwise miss the deadline.
+        """
+        queries = np.zeros((1, dim), dtype="float32")
+        futures = [shard.submit(self.version, queries, 1) for shard in self._shards if shard is not None]
+        wait(futures, timeout=timeout)
+
+    def search(self, queries: np.ndarray, k: int):
+        """
+        (scores, ids, status): merged top-k plus which shards answered.
+        status["missing"] lists shards left out (failed / timed out).
+        """
+        queries = np.ascontiguousarray(queries, dtype="float32")
+        start = time.perf_counter()
+
+        futures, missing = {}, []
+        for s, shard in enumerate(self._shards):
+            if shard is None:
+                missing.append(s)
+                continue
+            try:
+                futures[shard.submit(self.version, queries, k)] = s
+            except Exception as e:
+                print(f"[SHARDS] Shard {s} unavailable — {e}")
+                missing.append(s)
+
+        done, not_done = wait(futures, timeout=self.timeout)
+
+        results, timed_out = [], []
+        for future in done:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"[SHARDS] Shard {futures[future]} failed — {e}")
+                missing.append(futures[future])
+        for future in not_done:
+            future.cancel()
+            timed_out.append(futures[future])
+
+        if timed_out:
+            print(f"[SHARDS] Shards {sorted(timed_out)} missed the {self.timeout}s deadline")
+
+        scores, ids = merge_topk(results, k, len(queries))
+        return scores, ids, {
+            "shards": self.count,
+            "answered": len(results),
+            "missing": sorted(missing + timed_out),
+            "ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    def close(self):
+        for shard in self._shards:
+            if shard is not None:
+                shard.close()
+
+
+# -----------------------------
+# Shard server: python -m face_engine.shards serve --shard N --port P
+# -----------------------------
+class _ShardServer:
+    """
+    Serves one shard number of whichever snapshot a request names, as
+    long as that snapshot exists on this node's disk.
+    """
+
+    def __init__(self, shard: int):
+        self.shard = shard
+        self._lock = threading.Lock()
+        self._loaded = {}        # version -> Shard (the newest two)
+
+    def get(self, version: str):
+        from face_engine.snapshot import snapshot_path
+
+        with self._lock:
+            if version not in self._loaded:
+                path = shard_path(snapshot_path(version), self.shard)
+                if not os.path.exists(os.path.join(path, SHARD_INDEX_NAME)):
+                    return None
+                self._loaded[version] = Shard(path)
+                print(f"[SHARDS] Loaded shard {self.shard} of {version}")
+                for old in sorted(self._loaded)[:-2]:
+                    del self._loaded[old]
+            return self._loaded[version]
+
+
+def serve(shard: int, host: str, port: int):
+    server_state = _ShardServer(shard)
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if self.path != "/search":
+                return self._reply(404, {"error": "not found"})
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if body.get("shard", shard) != shard:
+                return self._reply(409, {"error": f"this node serves shard {shard}"})
+
+            loaded = server_state.get(body["version"])
+            if loaded is None:
+                return self._reply(404, {"error": f"shard {shard} of {body['version']} not on this node"})
+
+            queries = np.array(body["queries"], dtype="float32").reshape(len(body["queries"]), -1)
+            scores, ids = loaded.search(queries, int(body["k"]))
+            # JSON has no -inf
+            scores = np.where(np.isfinite(scores), scores, -1e30)
+            self._reply(200, {"scores": scores.tolist(), "ids": ids.tolist()})
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self._reply(404, {"error": "not found"})
+            self._reply(200, {"shard": shard, "loaded": sorted(server_state._loaded)})
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    print(f"[SHARDS] Serving shard {shard} on http://{host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shard node for a sharded FAISS snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve", help="answer /search for one shard number")
+    p.add_argument("--shard", type=int, required=True)
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, required=True)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.shard, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+from datetime import datetime
+import faiss
+import numpy as np
+
+from config import EMBEDDING_DIR
+from face_engine.ann import index_type_of, search_reranked, storage_of
+from face_engine.metadata_store import MetadataStore, JsonMetadata, write_metadata_store
+from face_engine.phash_index import PHashIndex
+from face_engine.shards import SHARDS_NAME
+
+# -----------------------------
+# Versioned index snapshots
+# -----------------------------
+# EMBEDDING_DIR (data/embeddings/)
+#   snapshots/<version>/      faiss.index, face_embeddings.npy,
+#                             metadata/ (MetadataStore), phash_index.npz,
+#                             rejected.json, prefiltered.json,
+#                             manifest.json
+#                             (shards/ instead of faiss.index when
+#                             sharded, see face_engine/shards.py)
+#   CURRENT                   name of the live snapshot
+#
+# A snapshot is written into a hidden temp directory, checksummed,
+# renamed into place and only then published by atomically replacing
+# CURRENT. Readers resolve CURRENT once and load every file from the
+# same directory, so they never mix a new index with old metadata.
+#
+# The SHA-256 of every file is taken once, at commit. Loads check each
+# file's size and mtime against the manifest ("quick"), which costs a
+# stat per file; re-hashing everything ("full", O(corpus) reads) is for
+# audits and suspected corruption.
+
+SNAPSHOT_DIR = os.path.join(EMBEDDING_DIR, "snapshots")
+CURRENT_FILE = os.path.join(EMBEDDING_DIR, "CURRENT")
+
+INDEX_NAME = "faiss.index"
+EMBEDDINGS_NAME = "face_embeddings.npy"
+METADATA_NAME = "metadata"
+JSON_METADATA_NAME = "metadata.json"     # before the metadata store
+PHASH_INDEX_NAME = "phash_index.npz"
+REJECTED_NAME = "rejected.json"
+PREFILTERED_NAME = "prefiltered.json"    # OpenCV rejects, not confirmed by RetinaFace
+MANIFEST_NAME = "manifest.json"
+
+# Pre-snapshot layout (files directly under data/embeddings)
+LEGACY_VERSION = "legacy"
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class IndexSnapshot:
+    """
+    Everything a search needs, loaded from one snapshot directory.
+    Treated as immutable: reloads build a new object and swap it in.
+    Sharded snapshots have no `index`; their vectors are searched
+    through a ShardedSearcher (`searcher`, set by whoever serves them).
+    """
+
+    def __init__(self, version, path, index, metadata, manifest, phash_index):
+        self.version = version
+        self.path = path
+        self.index = index
+        self.metadata = metadata
+        self.manifest = manifest
+        self.phash_index = phash_index
+        self.shards = manifest.get("shards")
+        self.searcher = None
+        if index is not None:
+            self.storage = storage_of(index)
+            self.index_type = index_type_of(index)
+        else:
+            self.storage = manifest.get("storage", "float32")
+            self.index_type = manifest.get("index_type", "flat")
+        self._vectors = None
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @property
+    def size(self) -> int:
+        if self.index is None:
+            return len(self.metadata)
+        return self.index.ntotal
+
+    @property
+    def vectors(self):
+        """
+        float32 embeddings, memory-mapped (None if the file is missing).
+        """
+        if self._vectors is None and os.path.exists(self.file(EMBEDDINGS_NAME)):
+            self._vectors = np.load(self.file(EMBEDDINGS_NAME), mmap_mode="r")
+        return self._vectors
+
+    def search(self, queries, k: int):
+        """
+        Top-k (scores, ids); reduced-precision indexes are re-ranked
+        against the float32 embeddings.
+        """
+        if self.index is None:
+            raise SnapshotError(f"{self.version} is sharded; search it with a ShardedSearcher")
+        if self.storage == "float32":
+            return self.index.search(queries, k)
+        return search_reranked(self.index, self.vectors, queries, k, storage=self.storage)
+
+
+# -----------------------------
+# Helpers
+# -----------------------------
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _fsync_dir(path: str):
+    # Not supported on Windows; rename durability is best effort there
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def snapshot_path(version: str) -> str:
+    if version == LEGACY_VERSION:
+        return EMBEDDING_DIR
+    return os.path.join(SNAPSHOT_DIR, version)
+
+
+def read_current_version():
+    """
+    Name of the published snapshot, or None if nothing was published yet.
+    """
+    try:
+        with open(CURRENT_FILE, "r") as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+
+# -----------------------------
+# Writing
+# -----------------------------
+def begin_snapshot() -> str:
+    """
+    Create an empty staging directory for a new snapshot and return it.
+    Write the snapshot files there, then call commit_snapshot().
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    # sortable by creation time; the suffix only guards against clashes
+    version = datetime.now().strftime("%Y%m%d-%H%M%S-%f") + "-" + uuid.uuid4().hex[:4]
+    staging = os.path.join(SNAPSHOT_DIR, f".tmp-{version}")
+    os.makedirs(staging)
+    return staging
+
+
+def abort_snapshot(staging: str):
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+def commit_snapshot(staging: str, info: dict = None, publish: bool = True) -> str:
+    """
+    Checksum the staged files, write the manifest, move the directory
+    into place and (optionally) point CURRENT at it.
+    Returns the new version name.
+    """
+    version = os.path.basename(staging)[len(".tmp-"):]
+
+    files = {}
+    for root, _, names in os.walk(staging):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            with open(path, "r+b") as f:
+                os.fsync(f.fileno())
+            rel = os.path.relpath(path, staging).replace(os.sep, "/")
+            stat = os.stat(path)
+            files[rel] = {"sha256": _sha256(path), "bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    manifest = {
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "files": files,
+        **(info or {}),
+    }
+    with open(os.path.join(staging, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+
+    final = snapshot_path(version)
+    os.replace(staging, final)
+    _fsync_dir(SNAPSHOT_DIR)
+
+    if publish:
+        publish_snapshot(version)
+
+    return version
+
+
+def publish_snapshot(version: str):
+    """
+    Atomically switch CURRENT to an existing snapshot.
+    """
+    if not os.path.isdir(snapshot_path(version)):
+        raise SnapshotError(f"Snapshot {version} does not exist")
+
+    tmp = CURRENT_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, CURRENT_FILE)
+    _fsync_dir(EMBEDDING_DIR)
+
+    print(f"[SNAPSHOT] Published {version}")
+
+
+def prune_snapshots(keep: int):
+    """
+    Delete all but the newest `keep` snapshots. The published one and
+    in-progress staging directories are never removed.
+    """
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return
+
+    current = read_current_version()
+    versions = sorted(
+        v for v in os.listdir(SNAPSHOT_DIR)
+        if not v.startswith(".") and os.path.isdir(snapshot_path(v))
+    )
+
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version != current:
+            shutil.rmtree(snapshot_path(version), ignore_errors=True)
+            print(f"[SNAPSHOT] Pruned {version}")
+
+
+# -----------------------------
+# Reading
+# -----------------------------
+def read_manifest(version: str) -> dict:
+    if version == LEGACY_VERSION:
+        return {"version": LEGACY_VERSION, "files": {}}
+
+    with open(os.path.join(snapshot_path(version), MANIFEST_NAME), "r") as f:
+        return json.load(f)
+
+
+VERIFY_MODES = ("full", "quick", "off")
+
+
+def verify_snapshot(version: str, manifest: dict = None, mode: str = "full"):
+    """
+    Raise SnapshotError if any file is missing or does not match the
+    manifest: by SHA-256 ("full") or by size and mtime ("quick").
+    """
+    manifest = manifest or read_manifest(version)
+    path = snapshot_path(version)
+
+    for name, expected in manifest.get("files", {}).items():
+        file_path = os.path.join(path, name)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            raise SnapshotError(f"{version}: missing {name}")
+
+        if mode == "quick":
+            # manifests from before mtimes were recorded only have sizes
+            if stat.st_size != expected["bytes"] or expected.get("mtime_ns", stat.st_mtime_ns) != stat.st_mtime_ns:
+                raise SnapshotError(f"{version}: {name} changed since it was published")
+        elif _sha256(file_path) != expected["sha256"]:
+            raise SnapshotError(f"{version}: checksum mismatch for {name}")
+
+
+def load_snapshot(version: str = None, verify="quick"):
+    """
+    Load the given (default: current) snapshot.
+    Falls back to the pre-snapshot files in EMBEDDING_DIR.
+    Returns None if there is no index at all.
+    `verify` is one of VERIFY_MODES (True / False mean "full" / "off").
+    """
+    version = version or read_current_version()
+
+    if version is None:
+        if not os.path.exists(os.path.join(EMBEDDING_DIR, INDEX_NAME)):
+            return None
+        version = LEGACY_VERSION
+
+    path = snapshot_path(version)
+    manifest = read_manifest(version)
+    mode = {True: "full", False: "off"}.get(verify, verify)
+    if mode not in VERIFY_MODES:
+        raise ValueError(f"Unknown snapshot verify mode '{verify}' ({' | '.join(VERIFY_MODES)})")
+    if mode != "off":
+        verify_snapshot(version, manifest, mode)
+
+    # sharded snapshots keep their vectors in shards/, loaded by the searcher
+    index = None if manifest.get("shards") else faiss.read_index(os.path.join(path, INDEX_NAME))
+    vectors = manifest["vectors"] if index is None else index.ntotal
+
+    if os.path.isdir(os.path.join(path, METADATA_NAME)):
+        metadata = MetadataStore(os.path.join(path, METADATA_NAME))
+    else:
+        with open(os.path.join(path, JSON_METADATA_NAME), "r") as f:
+            metadata = JsonMetadata(json.load(f))
+
+        if version == LEGACY_VERSION:
+            # legacy metadata.json may carry un-indexed crawler entries
+            # after the indexed prefix
+            metadata = JsonMetadata(metadata[:vectors])
+
+    if len(metadata) != vectors:
+        raise SnapshotError(
+            f"{version}: {vectors} vectors but {len(metadata)} metadata rows"
+        )
+
+    phash_path = os.path.join(path, PHASH_INDEX_NAME)
+    if os.path.exists(phash_path):
+        phash_index = PHashIndex.load(phash_path)
+    else:
+        # snapshots from before the pHash index existed
+        phash_index = PHashIndex(*metadata.phash_rows())
+
+    return IndexSnapshot(version, path, index, metadata, manifest, phash_index)
+
+
+def load_rejected(snapshot: IndexSnapshot) -> list:
+    """
+    URLs already tried for this snapshot that had no face.
+    """
+    if snapshot.version == LEGACY_VERSION:
+        with open(snapshot.file(JSON_METADATA_NAME), "r") as f:
+            entries = json.load(f)
+        return [e["url"] for e in entries if e.get("status") == "no_face"]
+
+    path = snapshot.file(REJECTED_NAME)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def load_prefiltered(snapshot: IndexSnapshot) -> list:
+    """
+    URLs only the OpenCV pre-filter rejected. Unlike rejected.json these
+    are retried by incremental updates (PREFILTER_RETRY_REJECTS).
+    """
+    path = snapshot.file(PREFILTERED_NAME)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+# -----------------------------
+# Migration
+# -----------------------------
+def migrate_json_metadata():
+    """
+    One-time migration: republish the current snapshot (or the legacy
+    files) with its metadata.json converted into a MetadataStore.
+    Index, embeddings and rejected URLs are carried over unchanged.
+    """
+    snapshot = load_snapshot()
+    if snapshot is None:
+        print("[SNAPSHOT] No index to migrate")
+        return None
+
+    if isinstance(snapshot.metadata, MetadataStore):
+        print(f"[SNAPSHOT] {snapshot.version} already uses the metadata store")
+        return snapshot.version
+
+    staging = begin_snapshot()
+    try:
+        for name in (INDEX_NAME, EMBEDDINGS_NAME, PHASH_INDEX_NAME, PREFILTERED_NAME):
+            if os.path.exists(snapshot.file(name)):
+                shutil.copyfile(snapshot.file(name), os.path.join(staging, name))
+        if os.path.isdir(snapshot.file(SHARDS_NAME)):
+            shutil.copytree(snapshot.file(SHARDS_NAME), os.path.join(staging, SHARDS_NAME))
+        if not os.path.exists(os.path.join(staging, PHASH_INDEX_NAME)):
+            snapshot.phash_index.save(os.path.join(staging, PHASH_INDEX_NAME))
+
+        with open(os.path.join(staging, REJECTED_NAME), "w") as f:
+            json.dump(sorted(load_rejected(snapshot)), f)
+
+        # rows only: the "status" markers of the legacy layout now live
+        # in rejected.json
+        write_metadata_store(
+            os.path.join(staging, METADATA_NAME),
+            ({k: v for k, v in m.items() if k != "status"} for m in snapshot.metadata)
+        )
+
+        info = {k: v for k, v in snapshot.manifest.items() if k not in ("version", "created_at", "files")}
+        version = commit_snapshot(staging, info={
+            **info,
+            "vectors": snapshot.size,
+            "built_by": "migrate_json_metadata",
+            "base_version": snapshot.version,
+        })
+    except Exception:
+        abort_snapshot(staging)
+        raise
+
+    print(f"[SNAPSHOT] Migrated {snapshot.size} metadata rows from {snapshot.version} → {version}")
+    return version
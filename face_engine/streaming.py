@@ -0,0 +1,233 @@
+import time
+import queue
+import threading
+
+import numpy as np
+
+from config import STREAM_QUEUE_SIZE, STREAM_BATCH_SIZE, STREAM_PUBLISH_SECONDS, STREAM_PUBLISH_MAX_SHARE
+from face_engine.indexer import EMBEDDING_DIM, run_ingestion, print_report, publish_appended, record_rows
+from face_engine.snapshot import load_snapshot, read_current_version
+from utils.helpers import infer_source
+
+# -----------------------------
+# Streaming crawl → index
+# -----------------------------
+# The crawler calls submit(url) for every URL it accepts. A consumer
+# thread takes URLs off a bounded queue in batches, runs them through
+# the indexing pipeline (download → decode + pHash → embed), and every
+# `publish_seconds` publishes a snapshot with the new rows appended.
+# The search API's snapshot polling picks it up from there.
+#
+# The consumer keeps the snapshot it publishes in memory and hands it
+# to publish_appended(), which appends to it instead of loading and
+# cloning the current snapshot every tick; it is only reloaded when
+# another writer published in between. Writing a snapshot still costs
+# O(corpus) I/O, so the publish interval stretches to keep publishing
+# under STREAM_PUBLISH_MAX_SHARE of the consumer's time.
+#
+# submit() blocks while the queue is full, so a crawler that outpaces
+# indexing slows down instead of buffering without bound. URLs still
+# queued when the process dies are in the crawl log anyway, and the
+# next update_index_incremental() picks them up.
+
+_STOP = object()
+
+
+class StreamingIndexer:
+    def __init__(self, queue_size: int = None, batch_size: int = None,
+                 publish_seconds: float = None, **pipeline_options):
+        self.batch_size = batch_size or STREAM_BATCH_SIZE
+        self.publish_seconds = publish_seconds if publish_seconds is not None else STREAM_PUBLISH_SECONDS
+        self.pipeline_options = pipeline_options
+
+        self._queue = queue.Queue(maxsize=queue_size or STREAM_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # embedded but not yet published
+        self._embeddings = []
+        self._metadata = []
+        self._no_face = []
+        self._prefiltered = []
+        self._indexed_aliases = {}
+        self._last_publish = time.monotonic()
+        self._publish_interval = self.publish_seconds
+
+        # snapshot new images are deduplicated against and appended to;
+        # reloaded only when someone else publishes a newer one
+        self._known = None
+
+        self._counters = {
+            "submitted": 0,
+            "indexed": 0,
+            "faces": 0,
+            "no_face": 0,
+            "prefiltered": 0,
+            "failed": 0,
+            "published_rows": 0,
+            "snapshots": 0,
+            "last_publish_seconds": 0.0,
+            "backpressure_seconds": 0.0,
+            "last_version": None,
+        }
+
+    # -----------------------------
+    # Producer side (crawler)
+    # -----------------------------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            print("[STREAM] Streaming indexer started")
+        return self
+
+    def submit(self, url: str, source: str = None):
+        """
+        Queue one crawled URL. Blocks while indexing is behind.
+        """
+        item = (url, source or infer_source(url))
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            start = time.perf_counter()
+            self._queue.put(item)
+            with self._lock:
+                self._counters["backpressure_seconds"] += time.perf_counter() - start
+
+        with self._lock:
+            self._counters["submitted"] += 1
+
+    def close(self):
+        """
+        Index everything queued, publish it, and stop.
+        """
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        print("[STREAM] Streaming indexer stopped")
+
+    # -----------------------------
+    # Consumer side
+    # -----------------------------
+    def _next_batch(self):
+        """
+        Up to batch_size URLs; waits at most publish_seconds for the first
+        and returns early once the queue runs dry. stop=True after _STOP.
+        """
+        batch, stop = [], False
+        try:
+            item = self._queue.get(timeout=max(self.publish_seconds, 0.1))
+        except queue.Empty:
+            return batch, stop
+
+        while True:
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                break
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+        return batch, stop
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+
+            if batch:
+                try:
+                    self._ingest(batch)
+                except Exception as e:
+                    print(f"[STREAM] Batch of {len(batch)} failed — {e}")
+                    with self._lock:
+                        self._counters["failed"] += len(batch)
+
+            if stop or time.monotonic() - self._last_publish >= self._publish_interval:
+                try:
+                    self._publish()
+                except Exception as e:
+                    # rows stay pending and go out with the next publish
+                    print(f"[STREAM] Publish failed — {e}")
+
+    def _known_snapshot(self):
+        version = read_current_version()
+        if version is not None and (self._known is None or self._known.version != version):
+            self._known = load_snapshot(version)
+        return self._known
+
+    def _ingest(self, batch):
+        sources = dict(batch)
+        records, report = run_ingestion(
+            [url for url, _ in batch], known=self._known_snapshot(), **self.pipeline_options
+        )
+        print_report(report)
+
+        embeddings, metadata = record_rows(records, sources)
+        with self._lock:
+            self._embeddings.append(embeddings)
+            self._metadata.extend(metadata)
+            self._no_face.extend(report["no_face_urls"])
+            self._prefiltered.extend(report["prefiltered_urls"])
+            for canonical, urls in report.get("indexed_aliases", {}).items():
+                self._indexed_aliases.setdefault(canonical, []).extend(urls)
+
+            self._counters["indexed"] += report["indexed"]
+            self._counters["faces"] += report["faces"]
+            self._counters["no_face"] += report["no_face"]
+            self._counters["prefiltered"] += report["prefiltered"]
+            self._counters["failed"] += report["failed"]
+
+    def _publish(self):
+        start = self._last_publish = time.monotonic()
+
+        with self._lock:
+            if not self._metadata and not self._no_face and not self._prefiltered and not self._indexed_aliases:
+                return
+            embeddings, metadata, no_face = self._embeddings, self._metadata, self._no_face
+            prefiltered, indexed_aliases = self._prefiltered, self._indexed_aliases
+
+        base, self._known = self._known_snapshot(), None
+        version, total, added, self._known = publish_appended(
+            np.vstack(embeddings) if embeddings else np.zeros((0, EMBEDDING_DIM), dtype="float32"),
+            metadata,
+            no_face,
+            {"built_by": "stream"},
+            indexed_aliases=indexed_aliases,
+            prefiltered=prefiltered,
+            base=base
+        )
+
+        cost = time.monotonic() - start
+        self._publish_interval = max(self.publish_seconds, cost / STREAM_PUBLISH_MAX_SHARE)
+
+        with self._lock:
+            self._embeddings, self._metadata, self._no_face = [], [], []
+            self._prefiltered = []
+            self._indexed_aliases = {}
+            self._counters["published_rows"] += added
+            self._counters["snapshots"] += 1
+            self._counters["last_version"] = version
+            self._counters["last_publish_seconds"] = cost
+
+        print(f"[STREAM] Published +{added} embeddings ({total} total) in {cost:.1f}s — {version}")
+        if self._publish_interval > self.publish_seconds:
+            print(f"[STREAM] Next publish in {self._publish_interval:.0f}s (publishing takes {cost:.1f}s)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "backpressure_seconds": round(self._counters["backpressure_seconds"], 2),
+                "last_publish_seconds": round(self._counters["last_publish_seconds"], 2),
+                "publish_interval_seconds": round(self._publish_interval, 1),
+                "queued": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "pending_publish": len(self._metadata),
+                "running": self._thread is not None,
+            }
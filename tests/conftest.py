@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# config needs an API key and must never point the tests at the real data dir
+os.environ.setdefault("PEXELS_API_KEY", "test")
+os.environ.setdefault("FACETRACE_DATA_DIR", tempfile.mkdtemp(prefix="facetrace-tests-"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
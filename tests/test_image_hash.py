@@ -0,0 +1,44 @@
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from face_engine.image_hash import compute_phash, hamming_distance, exif_orientation, apply_orientation
+from face_engine.indexer import _decode_stage
+
+
+def _jpeg(orientation=None, size=(320, 200)):
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, size=(5, 8, 3)).astype(np.uint8)
+    img = Image.fromarray(cv2.resize(base, size, interpolation=cv2.INTER_CUBIC))
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=90, exif=exif.tobytes())
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("orientation", [None, 1, 6])
+def test_index_and_query_hash_agree(orientation, monkeypatch):
+    monkeypatch.setattr("face_engine.indexer.PREFILTER_ENABLED", False)
+    data = _jpeg(orientation)
+    job = _decode_stage({"url": "u", "bytes": data})
+    assert hamming_distance(job["phash"], compute_phash(data)) == 0
+
+
+def test_decode_stage_orients_for_detection(monkeypatch):
+    monkeypatch.setattr("face_engine.indexer.PREFILTER_ENABLED", False)
+    job = _decode_stage({"url": "u", "bytes": _jpeg(6)})
+    assert job["img"].shape[:2] == (320, 200)
+
+
+@pytest.mark.parametrize("orientation", range(1, 9))
+def test_apply_orientation_matches_opencv(orientation):
+    data = _jpeg(orientation)
+    assert exif_orientation(data) == orientation
+    raw = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    oriented = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    assert np.array_equal(apply_orientation(raw, orientation), oriented)
@@ -0,0 +1,60 @@
+from crawler.journal import CrawlJournal
+
+
+def _page(journal, source, page, urls, **kwargs):
+    journal.record("page", source=source, query="faces", page=page, found=len(urls), urls=urls, **kwargs)
+
+
+def test_replay_restores_cycle(tmp_path):
+    journal = CrawlJournal(str(tmp_path / "journal.jsonl"))
+    journal.start_run()
+    _page(journal, "flickr", 1, ["a", "b"])
+    _page(journal, "flickr", 2, ["c"])
+    journal.record("source_end", source="flickr", status="completed")
+    journal.close()
+
+    state = CrawlJournal(journal.path).replay()
+    assert state["urls"] == {"a", "b", "c"}
+    assert state["pages"] == {"flickr": {("faces", 1): 2, ("faces", 2): 1}}
+    assert state["sources"] == {"flickr": "completed"}
+    assert state["runs"] == 1
+
+
+def test_replay_after_torn_write(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = CrawlJournal(str(path))
+    journal.start_run()
+    _page(journal, "yahoo", 1, ["a", "b"])
+    journal.close()
+
+    # the process died half way through a record
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"t":"page","source":"yahoo","query":"faces","page":2,"found":1,"ur')
+
+    state = CrawlJournal(str(path)).replay()
+    assert state["urls"] == {"a", "b"}
+    assert ("faces", 2) not in state["pages"]["yahoo"]
+
+    # the next run appends after the torn line without losing records
+    resumed = CrawlJournal(str(path))
+    resumed.start_run()
+    _page(resumed, "yahoo", 2, ["c"])
+    resumed.close()
+
+    state = CrawlJournal(str(path)).replay()
+    assert state["urls"] == {"a", "b", "c"}
+    assert state["pages"]["yahoo"] == {("faces", 1): 2, ("faces", 2): 1}
+    assert state["runs"] == 2
+
+
+def test_reset_starts_a_new_cycle(tmp_path):
+    journal = CrawlJournal(str(tmp_path / "journal.jsonl"))
+    journal.start_run()
+    _page(journal, "pexels", 1, ["a"])
+    journal.reset()
+    _page(journal, "pexels", 1, ["b"])
+    journal.close()
+
+    state = CrawlJournal(journal.path).replay()
+    assert state["urls"] == {"b"}
+    assert state["runs"] == 0
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from face_engine import phash_index
+from face_engine.phash_index import PHashIndex, popcount64
+
+
+def _corpus(n, seed=0):
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(0, 2**63, size=n, dtype=np.uint64) * np.uint64(2) + rng.integers(0, 2, size=n, dtype=np.uint64)
+    # near copies of the first codes, 1..12 bits away
+    flips = [codes[i] ^ np.uint64(sum(1 << int(b) for b in rng.choice(64, size=1 + i % 12, replace=False)))
+             for i in range(n // 4)]
+    return np.concatenate([codes, np.array(flips, dtype=np.uint64)])
+
+
+def _brute(codes, rows, query, threshold):
+    dists = [bin(int(c) ^ query).count("1") for c in codes]
+    return sorted((int(r), d) for r, d in zip(rows, dists) if d <= threshold)
+
+
+@pytest.fixture(params=["scan", "probe"])
+def mode(request, monkeypatch):
+    # force both lookup paths on a small corpus
+    monkeypatch.setattr(phash_index, "LINEAR_SCAN_BELOW", 1 << 30 if request.param == "scan" else 0)
+    return request.param
+
+
+@pytest.mark.parametrize("threshold", [0, 3, 4, 8, 10])
+def test_search_matches_brute_force(mode, threshold):
+    codes = _corpus(2000)
+    rows = np.arange(len(codes)) * 3 + 7          # rows need not be positions
+    index = PHashIndex(codes, rows)
+
+    queries = [int(codes[i]) for i in range(0, len(codes), 97)] + [int(codes[5]) ^ 0b1011]
+    for q in queries:
+        assert sorted(index.search(q, threshold)) == _brute(codes, rows, q, threshold)
+
+    batch = index.search_batch([f"{q:016x}" for q in queries], threshold)
+    assert [sorted(hits) for hits in batch] == [_brute(codes, rows, q, threshold) for q in queries]
+
+
+def test_build_skips_rows_without_hash():
+    index = PHashIndex.build(["00000000000000ff", None, "", "ff00000000000000"])
+    assert index.rows.tolist() == [0, 3]
+    assert index.search("00000000000000fe", 1) == [(0, 1)]
+
+
+def test_extend_matches_fresh_build(mode):
+    codes = _corpus(1500, seed=1)
+    base = PHashIndex(codes[:1000], np.arange(1000))
+    extended = base.extend(codes[1000:], np.arange(1000, len(codes)))
+    fresh = PHashIndex(codes, np.arange(len(codes)))
+
+    for c in range(phash_index.CHUNKS):
+        assert np.array_equal(extended.chunk_keys[c], fresh.chunk_keys[c])
+        assert np.array_equal(extended.chunk_order[c], fresh.chunk_order[c])
+    for q in codes[::53]:
+        assert extended.search(int(q), 6) == fresh.search(int(q), 6)
+
+
+def test_save_load_roundtrip(tmp_path):
+    codes = _corpus(300)
+    index = PHashIndex(codes, np.arange(len(codes)))
+    index.save(str(tmp_path / "phash.npz"))
+    loaded = PHashIndex.load(str(tmp_path / "phash.npz"))
+    assert np.array_equal(loaded.codes, index.codes)
+    assert loaded.search(int(codes[10]), 4) == index.search(int(codes[10]), 4)
+
+
+def test_popcount64():
+    x = np.array([0, 1, 2**64 - 1, 0x8000_0000_0000_0001], dtype=np.uint64)
+    assert popcount64(x).tolist() == [0, 1, 64, 2]
@@ -0,0 +1,105 @@
+import pytest
+
+from api import query_cache as qc
+from api.query_cache import QueryCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(qc.time, "monotonic", clock)
+    return clock
+
+
+def _phash(code: int) -> str:
+    return f"{code:016x}"
+
+
+BASE = 0x9F3A_51C2_7E04_B6D8
+
+
+def _table_keys(cache):
+    return {key for table in cache._tables for bucket in table.values() for key in bucket}
+
+
+def test_exact_and_near_duplicate_hits(clock):
+    cache = QueryCache(capacity=8, ttl_seconds=60, phash_threshold=4)
+    cache.put("a", "v1", _phash(BASE), None, {"n": 1})
+
+    assert cache.get("a", "v1")["response"] == {"n": 1}
+    # 4 bits off, spread over all four chunks
+    near = BASE ^ (1 << 3) ^ (1 << 20) ^ (1 << 37) ^ (1 << 60)
+    assert cache.get("b", "v1", phash=_phash(near))["response"] == {"n": 1}
+    assert cache.get("c", "v1", phash=_phash(near ^ (1 << 50))) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["phash_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_near_lookup_picks_closest(clock):
+    cache = QueryCache(capacity=8, ttl_seconds=60, phash_threshold=8)
+    cache.put("far", "v1", _phash(BASE ^ 0b111), None, {"n": "far"})
+    cache.put("close", "v1", _phash(BASE ^ 0b1), None, {"n": "close"})
+    assert cache.get("q", "v1", phash=_phash(BASE))["response"] == {"n": "close"}
+
+
+def test_ttl_expiry(clock):
+    cache = QueryCache(capacity=8, ttl_seconds=60, phash_threshold=4)
+    cache.put("a", "v1", _phash(BASE), None, {})
+
+    clock.now += 59
+    assert cache.get("a", "v1") is not None
+    clock.now += 2
+    assert cache.get("x", "v1", phash=_phash(BASE)) is None
+    assert cache.get("a", "v1") is None
+
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["size"] == 0
+    assert not _table_keys(cache)
+
+
+def test_lru_eviction(clock):
+    cache = QueryCache(capacity=3, ttl_seconds=60, phash_threshold=4)
+    for i, key in enumerate("abc"):
+        cache.put(key, "v1", _phash(BASE + (i << 40)), None, {"key": key})
+
+    cache.get("a", "v1")                 # a is now the most recent
+    cache.put("d", "v1", _phash(BASE + (7 << 40)), None, {"key": "d"})
+
+    assert cache.get("b", "v1") is None
+    assert [k for k in "acd" if cache.get(k, "v1") is not None] == ["a", "c", "d"]
+    assert cache.stats()["evictions"] == 1
+    assert _table_keys(cache) == {"a", "c", "d"}
+
+
+def test_replacing_an_entry_reindexes_it(clock):
+    cache = QueryCache(capacity=8, ttl_seconds=60, phash_threshold=0)
+    cache.put("a", "v1", _phash(BASE), None, {"n": 1})
+    cache.put("a", "v1", _phash(~BASE & (2**64 - 1)), None, {"n": 2})
+
+    assert cache.get("q", "v1", phash=_phash(BASE)) is None
+    assert cache.get("q", "v1", phash=_phash(~BASE & (2**64 - 1)))["response"] == {"n": 2}
+
+
+def test_new_snapshot_invalidates(clock):
+    cache = QueryCache(capacity=8, ttl_seconds=60, phash_threshold=4)
+    cache.put("a", "v1", _phash(BASE), None, {})
+
+    assert cache.get("a", "v2") is None
+    assert cache.get("x", "v2", phash=_phash(BASE)) is None
+    assert cache.stats()["invalidations"] == 1
+    assert not _table_keys(cache)
+
+
+def test_disabled_cache():
+    cache = QueryCache(capacity=0, ttl_seconds=60, phash_threshold=4)
+    cache.put("a", "v1", _phash(BASE), None, {})
+    assert cache.get("a", "v1") is None
@@ -0,0 +1,97 @@
+import json
+import threading
+
+import pytest
+
+from crawler import segment_log
+from crawler.segment_log import SegmentLog, read_crawl_entries, list_segments
+
+
+@pytest.fixture
+def crawl_log(tmp_path):
+    log = SegmentLog(str(tmp_path / "segments"), str(tmp_path / "metadata.json"), max_records=10, compact_every=1000)
+    yield log
+    log.compact()
+
+
+def _fill(log, start, count):
+    urls = [f"https://img.example/{i}.jpg" for i in range(start, start + count)]
+    for i in range(0, count, 5):
+        log.append(urls[i:i + 5], source="test")
+    return urls
+
+
+def _urls(log):
+    return {e["url"] for e in read_crawl_entries(log.metadata_path, log.dir)}
+
+
+def test_reads_metadata_and_segments(crawl_log):
+    first = _fill(crawl_log, 0, 30)
+    crawl_log.compact(include_active=False)
+    second = _fill(crawl_log, 30, 7)
+    assert list_segments(crawl_log.dir)
+    assert _urls(crawl_log) == set(first + second)
+
+
+def test_compaction_after_metadata_read(crawl_log, monkeypatch):
+    # segments opened, old metadata.json read, then the segments are
+    # compacted away before they are read
+    urls = _fill(crawl_log, 0, 30)
+    crawl_log.compact(include_active=False)
+    urls += _fill(crawl_log, 30, 25)
+
+    real_load, fired = json.load, []
+
+    def load(f, *args, **kwargs):
+        data = real_load(f, *args, **kwargs)
+        if not fired:
+            fired.append(True)
+            crawl_log.compact()
+        return data
+
+    monkeypatch.setattr(segment_log.json, "load", load)
+    assert _urls(crawl_log) == set(urls)
+    assert fired and not list_segments(crawl_log.dir)
+
+
+def test_compaction_after_listing(crawl_log, monkeypatch):
+    urls = _fill(crawl_log, 0, 25)
+    real_list = segment_log.list_segments
+
+    def listed_then_compacted(segment_dir):
+        found = real_list(segment_dir)
+        monkeypatch.setattr(segment_log, "list_segments", real_list)
+        crawl_log.compact()
+        return found
+
+    monkeypatch.setattr(segment_log, "list_segments", listed_then_compacted)
+    assert _urls(crawl_log) == set(urls)
+
+
+def test_concurrent_compaction_never_loses_rows(crawl_log):
+    stop = threading.Event()
+    written = []
+    errors = []
+
+    def writer():
+        n = 0
+        while not stop.is_set():
+            written.extend(_fill(crawl_log, n, 5))
+            n += 5
+            if n % 20 == 0:
+                crawl_log.compact(include_active=n % 40 == 0)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(200):
+            before = set(written)
+            missing = before - _urls(crawl_log)
+            if missing:
+                errors.append(missing)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert not errors
+    assert _urls(crawl_log) == set(written)
@@ -0,0 +1,119 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+import pytest
+
+from face_engine.shards import Shard, ShardedBuild, ShardedSearcher, ShardWriter, merge_topk, shard_path
+
+COUNT = 3
+
+
+class _InProcessShard:
+    """Stands in for a shard worker: runs Shard.search on a thread."""
+
+    pool = ThreadPoolExecutor(max_workers=4)
+
+    def __init__(self, shard, fail=False, delay=0.0):
+        self.shard, self.fail, self.delay = shard, fail, delay
+
+    def _search(self, queries, k):
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("shard down")
+        return self.shard.search(queries, k)
+
+    def submit(self, version, queries, k):
+        return self.pool.submit(self._search, queries, k)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(scope="module", params=["float32", "sq8"])
+def sharded(request, tmp_path_factory):
+    path = tmp_path_factory.mktemp(f"snapshot-{request.param}")
+    rng = np.random.default_rng(3)
+    embeddings = rng.normal(size=(600, 64)).astype("float32")
+    faiss.normalize_L2(embeddings)
+    urls = [f"https://img.example/{i}.jpg" for i in range(len(embeddings))]
+
+    build = ShardedBuild(embeddings, urls, COUNT, "hash", index_type="flat", storage=request.param)
+    info = build.write(str(path))
+    np.save(path / "face_embeddings.npy", embeddings)
+
+    snapshot = SimpleNamespace(version="v1", path=str(path), manifest=info)
+    shards = [Shard(shard_path(str(path), s)) for s in range(COUNT)]
+    return snapshot, shards, embeddings
+
+
+def _searcher(snapshot, shards, timeout=5.0):
+    searcher = ShardedSearcher(snapshot, workers="remote", remote_urls=[], timeout=timeout)
+    searcher._shards = shards
+    return searcher
+
+
+def _brute(embeddings, queries, k, rows=None):
+    scores = queries @ embeddings.T
+    if rows is not None:
+        mask = np.full(len(embeddings), -np.inf)
+        mask[rows] = 0
+        scores = scores + mask
+    return np.argsort(-scores, axis=1, kind="stable")[:, :k]
+
+
+def test_shard_writer_is_abstract():
+    with pytest.raises(TypeError):
+        ShardWriter()
+
+
+def test_all_shards_match_brute_force(sharded):
+    snapshot, shards, embeddings = sharded
+    assert sum(len(s.ids) for s in shards) == len(embeddings)
+
+    queries = embeddings[[0, 123, 599]]
+    scores, ids, status = _searcher(snapshot, [_InProcessShard(s) for s in shards]).search(queries, 5)
+
+    assert status["answered"] == COUNT and status["missing"] == []
+    assert np.array_equal(ids, _brute(embeddings, queries, 5))
+    assert np.allclose(scores[:, 0], 1.0, atol=1e-5)
+
+
+@pytest.mark.parametrize("how", ["absent", "failed", "timed_out"])
+def test_missing_shard_degrades_results(sharded, how):
+    snapshot, shards, embeddings = sharded
+    workers = [_InProcessShard(s) for s in shards]
+    if how == "absent":
+        workers[1] = None
+    elif how == "failed":
+        workers[1] = _InProcessShard(shards[1], fail=True)
+    else:
+        workers[1] = _InProcessShard(shards[1], delay=1.0)
+
+    queries = embeddings[[5, 77, 300]]
+    scores, ids, status = _searcher(snapshot, workers, timeout=0.5).search(queries, 4)
+
+    assert status["missing"] == [1] and status["answered"] == COUNT - 1
+    assert not np.isin(ids, shards[1].ids).any()
+    kept = np.concatenate([shards[0].ids, shards[2].ids])
+    assert np.array_equal(ids, _brute(embeddings, queries, 4, rows=kept))
+
+
+def test_no_shard_answers(sharded):
+    snapshot, shards, embeddings = sharded
+    scores, ids, status = _searcher(snapshot, [None] * COUNT).search(embeddings[:2], 3)
+    assert status["missing"] == [0, 1, 2]
+    assert (ids == -1).all() and np.isneginf(scores).all()
+
+
+def test_merge_topk_pads_short_results():
+    a = (np.array([[0.9, 0.1]], dtype="float32"), np.array([[4, 2]]))
+    b = (np.array([[0.5, 0.0]], dtype="float32"), np.array([[7, -1]]))
+    empty = (np.zeros((1, 0), dtype="float32"), np.zeros((1, 0), dtype="int64"))
+
+    scores, ids = merge_topk([a, b, empty], 5, 1)
+    assert ids.tolist() == [[4, 7, 2, -1, -1]]
+    assert scores[0, :3].tolist() == pytest.approx([0.9, 0.5, 0.1])
+    assert np.isneginf(scores[0, 3:]).all()
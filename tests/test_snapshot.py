@@ -0,0 +1,146 @@
+import os
+
+import numpy as np
+import pytest
+
+from face_engine import snapshot as snap
+from face_engine.indexer import publish_appended
+from face_engine.snapshot import SnapshotError, load_snapshot, read_current_version, verify_snapshot
+
+
+@pytest.fixture(autouse=True)
+def embedding_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(snap, "EMBEDDING_DIR", str(tmp_path))
+    monkeypatch.setattr(snap, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(snap, "CURRENT_FILE", str(tmp_path / "CURRENT"))
+    return tmp_path
+
+
+def _rows(start, count, seed=0):
+    rng = np.random.default_rng(seed + start)
+    embeddings = rng.normal(size=(count, 512)).astype("float32")
+    metadata = [
+        {"url": f"https://img.example/{i}.jpg", "phash": f"{int(rng.integers(0, 2**63)):016x}", "source": "flickr"}
+        for i in range(start, start + count)
+    ]
+    return embeddings, metadata
+
+
+def _publish(start, count, **kwargs):
+    embeddings, metadata = _rows(start, count)
+    return publish_appended(embeddings, metadata, [], {"built_by": "test"}, **kwargs)
+
+
+def test_nothing_published():
+    assert read_current_version() is None
+    assert load_snapshot() is None
+
+
+def test_publish_and_reload():
+    v1, total, added, published = _publish(0, 6)
+    assert (total, added) == (6, 6)
+    assert read_current_version() == v1
+
+    loaded = load_snapshot()
+    assert loaded.version == v1 == published.version
+    assert loaded.size == 6
+    assert loaded.metadata.url(3) == "https://img.example/3.jpg"
+    assert loaded.metadata.source(3) == "flickr"
+
+    # every stored vector finds itself
+    scores, ids = loaded.search(np.ascontiguousarray(loaded.vectors[:6]), 1)
+    assert ids[:, 0].tolist() == list(range(6))
+    assert np.allclose(scores[:, 0], 1.0, atol=1e-5)
+
+    # the pHash index points at the right rows
+    assert loaded.phash_index.search(loaded.metadata[4]["phash"], 0) == [(4, 0)]
+
+
+def test_append_publishes_new_version_and_keeps_old():
+    v1, *_ = _publish(0, 4)
+    v2, total, added, published = _publish(4, 3, base=load_snapshot())
+    assert v2 != v1 and read_current_version() == v2
+    assert (total, added) == (7, 3)
+
+    new, old = load_snapshot(), load_snapshot(v1)
+    assert (new.size, old.size) == (7, 4)
+    assert new.metadata.url(6) == "https://img.example/6.jpg"
+    assert new.phash_index.search(new.metadata[6]["phash"], 0) == [(6, 0)]
+    assert np.array_equal(new.vectors[:4], old.vectors[:4])
+
+    # the in-memory snapshot handed back matches what is on disk
+    assert published.size == new.size
+    assert np.array_equal(published.phash_index.codes, new.phash_index.codes)
+
+
+def test_append_skips_urls_already_indexed():
+    _publish(0, 4)
+    _, total, added, _ = _publish(2, 4)
+    assert (total, added) == (6, 2)
+
+
+def test_rejected_and_prefiltered_lists():
+    embeddings, metadata = _rows(0, 2)
+    publish_appended(embeddings, metadata, ["https://img.example/noface.jpg"], {"built_by": "test"},
+                     prefiltered=["https://img.example/haar.jpg", "https://img.example/noface.jpg"])
+    loaded = load_snapshot()
+    assert snap.load_rejected(loaded) == ["https://img.example/noface.jpg"]
+    assert snap.load_prefiltered(loaded) == ["https://img.example/haar.jpg"]
+
+
+def test_quick_verify_catches_size_and_mtime_changes():
+    version, *_ = _publish(0, 4)
+    path = snap.snapshot_path(version)
+    verify_snapshot(version, mode="quick")
+
+    rejected = os.path.join(path, snap.REJECTED_NAME)
+    stat = os.stat(rejected)
+    with open(rejected, "a") as f:
+        f.write(" ")
+    with pytest.raises(SnapshotError):
+        load_snapshot()
+
+    with open(rejected, "w") as f:
+        f.write("[]")
+    os.utime(rejected, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    with pytest.raises(SnapshotError):
+        verify_snapshot(version, mode="quick")
+
+
+def test_full_verify_catches_same_size_edits():
+    version, *_ = _publish(0, 4)
+    path = os.path.join(snap.snapshot_path(version), snap.EMBEDDINGS_NAME)
+    stat = os.stat(path)
+    with open(path, "r+b") as f:
+        f.seek(-4, os.SEEK_END)
+        f.write(b"\x00\x00\x80\x7f")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    verify_snapshot(version, mode="quick")
+    with pytest.raises(SnapshotError):
+        verify_snapshot(version, mode="full")
+    with pytest.raises(SnapshotError):
+        load_snapshot(verify=True)
+
+
+def test_missing_file_fails_to_load():
+    version, *_ = _publish(0, 4)
+    os.remove(os.path.join(snap.snapshot_path(version), snap.PHASH_INDEX_NAME))
+    with pytest.raises(SnapshotError):
+        load_snapshot()
+    assert load_snapshot(verify="off").size == 4
+
+
+def test_prune_keeps_current_and_staging(monkeypatch):
+    monkeypatch.setattr("face_engine.indexer.SNAPSHOT_KEEP", 10)
+    versions = [_publish(i * 2, 2)[0] for i in range(4)]
+    staging = snap.begin_snapshot()
+
+    snap.publish_snapshot(versions[0])
+    snap.prune_snapshots(keep=1)
+
+    left = sorted(os.listdir(snap.SNAPSHOT_DIR))
+    assert versions[0] in left and versions[-1] in left
+    assert versions[1] not in left and versions[2] not in left
+    assert os.path.basename(staging) in left
+    assert load_snapshot().version == versions[0]
@@ -0,0 +1,58 @@
+import shutil
+from urllib.parse import urlparse
+
+# =========================
+# SOURCE DETECTION
+# =========================
+
+SOURCE_HOSTS = {
+    "yimg.com": "yahoo",
+    "yahoo.com": "yahoo",
+    "staticflickr.com": "flickr",
+    "flickr.com": "flickr",
+    "wikimedia.org": "wikimedia",
+    "pexels.com": "pexels",
+    "unsplash.com": "unsplash",
+}
+
+
+def infer_source(url: str):
+    """
+    Best-effort crawl source for a URL, from its host name.
+    """
+    if not isinstance(url, str):
+        return None
+
+    url = url.strip()
+    if url.startswith("//"):
+        url = "https:" + url
+
+    host = urlparse(url).netloc.lower()
+    for suffix, source in SOURCE_HOSTS.items():
+        if host == suffix or host.endswith("." + suffix):
+            return source
+    return None
+
+
+# =========================
+# FILE COPIES
+# =========================
+
+FICLONE = 0x40049409    # Linux ioctl: share the source's extents
+
+
+def clone_file(src: str, dst: str) -> bool:
+    """
+    Copy src to dst as a copy-on-write clone (reflink) where the
+    filesystem supports it (Btrfs, XFS, ...), which costs O(1) however
+    large the file is; otherwise copy the bytes. Either way dst can be
+    modified without touching src. Returns True if it was cloned.
+    """
+    try:
+        import fcntl
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except (ImportError, OSError):
+        shutil.copyfile(src, dst)
+        return False
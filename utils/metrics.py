@@ -0,0 +1,205 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# -----------------------------
+# Request timing & Prometheus metrics
+# -----------------------------
+# A small in-process registry rendered in the Prometheus text format
+# (version 0.0.4), so /metrics needs no extra dependency. Counters and
+# histograms are updated by request threads. Values that already live
+# elsewhere (index size, crawler progress, cache counters) are read at
+# scrape time by collectors instead of being mirrored into metrics.
+
+# seconds; a cache hit is well under 1 ms, a cold CPU inference a few s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value) -> str:
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = self._header()
+        for key, value in values:
+            lines.append(f"{self.name}_total{_labels(dict(zip(self.labelnames, key)))} {_number(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts, sum, count]
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted((k, (list(c), s, n)) for k, (c, s, n) in self._values.items())
+        lines = self._header()
+        for key, (counts, total, count) in values:
+            labels = dict(zip(self.labelnames, key))
+            for bound, bucket in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels({**labels, 'le': _number(bound)})} {bucket}")
+            lines.append(f"{self.name}_bucket{_labels({**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._get(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_collector(self, collect):
+        """
+        `collect()` is called on every scrape and returns
+        [(name, kind, help, [(labels dict, value), ...]), ...]
+        with kind "gauge" or "counter".
+        """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        for collect in collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                # one broken source must not take the whole scrape down
+                print(f"[METRICS] Collector {getattr(collect, '__name__', collect)} failed — {e}")
+                continue
+            for name, kind, help, samples in families:
+                suffix = "_total" if kind == "counter" else ""
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f"{name}{suffix}{_labels(labels)} {_number(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# -----------------------------
+# Per-request stage timer
+# -----------------------------
+class StageTimer:
+    """
+    Wall time per named stage of one request, in milliseconds. A stage
+    timed twice adds up. Stages are reported in the order first seen.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, ms: float):
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self) -> dict:
+        return {name: round(ms, 3) for name, ms in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value, e.g. `phash;dur=1.20, faiss;dur=3.41, total;dur=5.02`.
+        """
+        parts = [f"{name};dur={ms:.2f}" for name, ms in self.stages.items()]
+        parts.append(f"total;dur={self.total_ms():.2f}")
+        return ", ".join(parts)
+
+    def observe(self, histogram: Histogram, **labels):
+        for name, ms in self.stages.items():
+            histogram.observe(ms / 1000, stage=name, **labels)